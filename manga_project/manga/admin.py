@@ -1,11 +1,12 @@
+from django import forms
 from django.contrib import admin
+from django.urls import reverse
 from django.utils.html import format_html
 from django.db.models import Count
 from .models import *
+from . import ingest
+from .pagination import EstimatedCountPaginator
 import zipfile
-from django.core.files import File
-from PIL import Image
-import io
 
 
 # ==================== INLINE ADMINS ====================
@@ -28,6 +29,13 @@ class ChapterInline(admin.TabularInline):
     readonly_fields = ('views', 'created_at')
 
 
+# ==================== BASE ====================
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist của bảng lớn: không đếm toàn bảng ở mỗi trang"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
 # ==================== CATEGORY ADMIN ====================
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -35,10 +43,14 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(manga_total=Count('mangas'))
+
     def manga_count(self, obj):
-        return obj.mangas.count()
+        return obj.manga_total
 
     manga_count.short_description = 'Số truyện'
+    manga_count.admin_order_field = 'manga_total'
 
 
 # ==================== AUTHOR ADMIN ====================
@@ -48,18 +60,24 @@ class AuthorAdmin(admin.ModelAdmin):
     search_fields = ('name',)
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(manga_total=Count('manga'))
+
     def manga_count(self, obj):
-        return obj.manga_set.count()
+        return obj.manga_total
 
     manga_count.short_description = 'Số truyện'
+    manga_count.admin_order_field = 'manga_total'
 
 
 # ==================== MANGA ADMIN ====================
 @admin.register(Manga)
-class MangaAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'status', 'views', 'rating', 'chapter_count', 'updated_at', 'cover_preview')
+class MangaAdmin(LargeTableAdmin):
+    list_display = ('title', 'author', 'status', 'views', 'rating', 'chapter_list', 'updated_at', 'cover_preview')
     list_filter = ('status', 'categories', 'created_at')
+    list_select_related = ('author',)
     search_fields = ('title', 'alternative_title', 'author__name')
+    autocomplete_fields = ('author',)
     filter_horizontal = ('categories',)
     prepopulated_fields = {'slug': ('title',)}
     date_hierarchy = 'created_at'
@@ -90,18 +108,41 @@ class MangaAdmin(admin.ModelAdmin):
 
     cover_preview.short_description = 'Ảnh bìa'
 
-    def chapter_count(self, obj):
-        return obj.chapters.count()
+    def chapter_list(self, obj):
+        # chapter_count là trường tính sẵn (Manga.refresh_chapter_stats), không đếm theo từng dòng
+        url = reverse('admin:manga_chapter_changelist') + f'?manga__id__exact={obj.id}'
+        return format_html('<a href="{}">{} chapter</a>', url, obj.chapter_count)
 
-    chapter_count.short_description = 'Số chapter'
+    chapter_list.short_description = 'Số chapter'
+    chapter_list.admin_order_field = 'chapter_count'
 
 
 # ==================== CHAPTER ADMIN ====================
+class ChapterAdminForm(forms.ModelForm):
+    # Thêm field upload ZIP
+    upload_zip = forms.FileField(required=False, help_text='Upload file ZIP chứa ảnh')
+
+    class Meta:
+        model = Chapter
+        fields = '__all__'
+
+    def clean_upload_zip(self):
+        upload_zip = self.cleaned_data.get('upload_zip')
+        if upload_zip and not zipfile.is_zipfile(upload_zip):
+            raise forms.ValidationError('File ZIP không hợp lệ!')
+        return upload_zip
+
+
 @admin.register(Chapter)
-class ChapterAdmin(admin.ModelAdmin):
+class ChapterAdmin(LargeTableAdmin):
+    form = ChapterAdminForm
     list_display = ('manga', 'chapter_number', 'title', 'views', 'image_count', 'created_at')
-    list_filter = ('manga', 'created_at')
+    # Không lọc theo truyện ở sidebar (liệt kê mọi truyện); tìm theo tên truyện
+    # hoặc mở từ link "chapter" của truyện (?manga__id__exact=...)
+    list_filter = ('created_at',)
+    list_select_related = ('manga',)
     search_fields = ('manga__title', 'title')
+    autocomplete_fields = ('manga',)
     prepopulated_fields = {'slug': ('title',)}
     inlines = [ChapterImageInline]
 
@@ -121,52 +162,30 @@ class ChapterAdmin(admin.ModelAdmin):
 
     readonly_fields = ('views',)
 
-    def get_form(self, request, obj=None, **kwargs):
-        form = super().get_form(request, obj, **kwargs)
-        # Thêm field upload ZIP
-        from django import forms
-        form.base_fields['upload_zip'] = forms.FileField(required=False, help_text='Upload file ZIP chứa ảnh')
-        return form
-
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
 
-        # Xử lý upload ZIP
-        if 'upload_zip' in request.FILES:
-            zip_file = request.FILES['upload_zip']
-
-            with zipfile.ZipFile(zip_file, 'r') as zip_ref:
-                # Lấy danh sách file ảnh
-                image_files = sorted([f for f in zip_ref.namelist()
-                                      if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))])
-
-                for idx, img_name in enumerate(image_files, start=1):
-                    # Đọc ảnh từ ZIP
-                    img_data = zip_ref.read(img_name)
+        # Xử lý upload ZIP (dùng chung engine với trang CRUD)
+        if form.cleaned_data.get('upload_zip'):
+            report = ingest.ingest_zip(obj, form.cleaned_data['upload_zip'])
+            self.message_user(request, f'Đã thêm {report}')
 
-                    # Tạo ChapterImage
-                    chapter_image = ChapterImage(
-                        chapter=obj,
-                        page_number=idx
-                    )
-
-                    # Lưu ảnh
-                    chapter_image.image.save(
-                        f"chapter_{obj.id}_page_{idx}.jpg",
-                        File(io.BytesIO(img_data)),
-                        save=True
-                    )
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(image_total=Count('images'))
 
     def image_count(self, obj):
-        return obj.images.count()
+        return obj.image_total
 
     image_count.short_description = 'Số trang'
+    image_count.admin_order_field = 'image_total'
 
 
 # ==================== USER PROFILE ADMIN ====================
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'created_at', 'avatar_preview')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
     search_fields = ('user__username', 'user__email')
 
     def avatar_preview(self, obj):
@@ -179,27 +198,33 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 # ==================== FOLLOW ADMIN ====================
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin):
     list_display = ('user', 'manga', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('user', 'manga')
+    raw_id_fields = ('user', 'manga')
     search_fields = ('user__username', 'manga__title')
     date_hierarchy = 'created_at'
 
 
-# ==================== READING HISTORY ADMIN ====================
-@admin.register(ReadingHistory)
-class ReadingHistoryAdmin(admin.ModelAdmin):
-    list_display = ('user', 'manga', 'chapter', 'last_read_at')
-    list_filter = ('last_read_at',)
+# ==================== READING PROGRESS ADMIN ====================
+@admin.register(ReadingProgress)
+class ReadingProgressAdmin(LargeTableAdmin):
+    list_display = ('user', 'manga', 'chapter', 'page', 'updated_at')
+    list_filter = ('updated_at',)
+    list_select_related = ('user', 'manga', 'chapter__manga')
     search_fields = ('user__username', 'manga__title')
-    date_hierarchy = 'last_read_at'
+    date_hierarchy = 'updated_at'
+    raw_id_fields = ('user', 'manga', 'chapter')
 
 
 # ==================== COMMENT ADMIN ====================
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = ('user', 'manga', 'content_preview', 'created_at')
     list_filter = ('created_at',)
+    list_select_related = ('user', 'manga')
+    raw_id_fields = ('user', 'manga', 'chapter', 'parent', 'root')
     search_fields = ('user__username', 'manga__title', 'content')
     date_hierarchy = 'created_at'
 
@@ -211,21 +236,34 @@ class CommentAdmin(admin.ModelAdmin):
 
 # ==================== RATING ADMIN ====================
 @admin.register(Rating)
-class RatingAdmin(admin.ModelAdmin):
+class RatingAdmin(LargeTableAdmin):
     list_display = ('user', 'manga', 'score', 'created_at')
     list_filter = ('score', 'created_at')
+    list_select_related = ('user', 'manga')
+    raw_id_fields = ('user', 'manga')
     search_fields = ('user__username', 'manga__title')
 
 
 # ==================== VIEW COUNT ADMIN ====================
 @admin.register(ViewCount)
-class ViewCountAdmin(admin.ModelAdmin):
+class ViewCountAdmin(LargeTableAdmin):
     list_display = ('manga', 'date', 'count')
     list_filter = ('date',)
+    list_select_related = ('manga',)
+    raw_id_fields = ('manga',)
     search_fields = ('manga__title',)
     date_hierarchy = 'date'
 
 
+# ==================== TRENDING ADMIN ====================
+@admin.register(TrendingEntry)
+class TrendingEntryAdmin(admin.ModelAdmin):
+    list_display = ('window_days', 'rank', 'manga', 'views', 'computed_at')
+    list_filter = ('window_days',)
+    list_select_related = ('manga',)
+    raw_id_fields = ('manga',)
+
+
 # Tùy chỉnh Admin site
 admin.site.site_header = "Manga Website Admin"
 admin.site.site_title = "Manga Admin"
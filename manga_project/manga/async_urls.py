@@ -0,0 +1,19 @@
+"""
+URL của app khi chạy qua ASGI: giống manga/urls.py, riêng trang chủ, trang
+truyện và trang đọc dùng view async (manga/async_views.py).
+"""
+from django.urls import path
+
+from . import async_views, urls
+
+ASYNC_VIEWS = {
+    'home': async_views.home,
+    'manga_detail': async_views.manga_detail,
+    'read_chapter': async_views.read_chapter,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], name=pattern.name)
+    if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urls.urlpatterns
+]
@@ -0,0 +1,174 @@
+"""
+Phiên bản async của trang chủ, trang truyện và trang đọc, dùng khi chạy qua
+ASGI (xem manga_project/asgi.py và manga_project/asgi_urls.py).
+
+Khác với view sync (manga/views.py) chạy các query lần lượt:
+
+- các query độc lập của một trang chạy song song, mỗi query ở một luồng riêng
+  với kết nối DB riêng (``parallel``);
+- việc ghi phụ (lượt xem, tiến độ đọc) chạy nền, không chờ trước khi trả
+  response (``fire_and_forget``);
+- template được render trong luồng sync của request (các quan hệ được nạp
+  lười trong template vẫn dùng được).
+
+Context truyền vào template giống hệt view sync.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import Http404
+from django.shortcuts import render
+
+from . import comments as thread_comments
+from . import conditional, manifest, reading_progress, recommendations, toc, trending, view_counter
+from .conditional import conditional_page
+from .models import Category, Chapter, Follow, Manga
+from .replicas import read_replica
+
+logger = logging.getLogger(__name__)
+
+_background_tasks = set()
+
+render_async = sync_to_async(render)
+
+
+def _in_thread(func):
+    # Luồng trong pool giữ kết nối DB riêng: đóng/tái sử dụng theo CONN_MAX_AGE như một request
+    def run(*args):
+        close_old_connections()
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+def parallel(*funcs):
+    """Chạy đồng thời các hàm sync (mỗi hàm thường là một query), trả về list kết quả"""
+    return asyncio.gather(*(_in_thread(func)() for func in funcs))
+
+
+def _log_failure(task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error('Tác vụ nền thất bại', exc_info=task.exception())
+
+
+def fire_and_forget(func, *args):
+    """Chạy ``func(*args)`` nền trên event loop hiện tại, không chờ kết quả"""
+    task = asyncio.get_running_loop().create_task(_in_thread(func)(*args))
+    # Giữ tham chiếu để task không bị thu gom trước khi chạy xong
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_failure)
+
+
+# ==================== TRANG CHỦ ====================
+@read_replica
+@conditional_page(conditional.home_state)
+async def home(request):
+    latest_manga, top_today, top_week, top_month, categories = await parallel(
+        lambda: list(Manga.objects.order_by('-updated_at')[:20]),
+        lambda: trending.get_trending(1),
+        lambda: trending.get_trending(7),
+        lambda: trending.get_trending(30),
+        lambda: list(Category.objects.all()),
+    )
+
+    context = {
+        'latest_manga': latest_manga,
+        'top_today': top_today,
+        'top_week': top_week,
+        'top_month': top_month,
+        'categories': categories,
+    }
+    return await render_async(request, 'home.html', context)
+
+
+# ==================== CHI TIẾT TRUYỆN ====================
+@read_replica
+@conditional_page(
+    conditional.manga_detail_state,
+    on_not_modified=lambda state: view_counter.record_manga_view(state['manga_id']),
+)
+async def manga_detail(request, slug):
+    manga = await Manga.objects.select_related('author').filter(slug=slug).afirst()
+    if manga is None:
+        raise Http404
+
+    if not view_counter.is_prefetch(request):
+        fire_and_forget(view_counter.record_manga_view, manga.id)
+
+    user = await request.auser()
+    queries = [
+        lambda: list(manga.chapters.all().order_by('-chapter_number')),
+        lambda: thread_comments.get_thread_page(manga.id, cursor=request.GET.get('comments')),
+        lambda: recommendations.get_similar(manga.id),
+    ]
+    if user.is_authenticated:
+        queries += [
+            lambda: Follow.objects.filter(user=user, manga=manga).exists(),
+            lambda: reading_progress.get_continue_reading(user.id, manga.id),
+        ]
+    chapters, comments, similar, *personal = await parallel(*queries)
+    is_following, continue_reading = personal or (False, None)
+
+    context = {
+        'manga': manga,
+        'chapters': chapters,
+        'is_following': is_following,
+        'continue_reading': continue_reading,
+        'comments': comments,
+        'similar': similar,
+        'avg_rating': round(manga.rating, 1),
+    }
+    return await render_async(request, 'manga_detail.html', context)
+
+
+# ==================== TRANG ĐỌC TRUYỆN ====================
+@read_replica
+@conditional_page(
+    conditional.read_chapter_state,
+    on_not_modified=lambda state: view_counter.record_chapter_view(state['chapter_id']),
+)
+async def read_chapter(request, manga_slug, chapter_slug):
+    chapter = await (
+        Chapter.objects.select_related('manga')
+        .filter(slug=chapter_slug, manga__slug=manga_slug)
+        .afirst()
+    )
+    if chapter is None:
+        raise Http404
+
+    user = await request.auser()
+    if not view_counter.is_prefetch(request):
+        fire_and_forget(view_counter.record_chapter_view, chapter.id)
+        if user.is_authenticated:
+            fire_and_forget(reading_progress.record_progress, user.id, chapter.manga_id, chapter.id)
+
+    # Manifest và mục lục thường nằm sẵn trong cache, bình luận là 1-2 query
+    chapter_manifest, manga_toc, comments = await parallel(
+        lambda: manifest.get_manifest(chapter.id),
+        lambda: toc.get_toc(chapter.manga_id),
+        lambda: thread_comments.get_thread_page(
+            chapter.manga_id, chapter.id, cursor=request.GET.get('comments'),
+        ),
+    )
+    pages = chapter_manifest['pages']
+
+    context = {
+        'chapter': chapter,
+        'manga': chapter.manga,
+        'pages': pages,
+        'preload_pages': manifest.PRELOAD_PAGES,
+        'page_sizes': manifest.PAGE_SIZES,
+        'next_chapter': manga_toc.next_of(chapter.chapter_number),
+        'prev_chapter': manga_toc.previous_of(chapter.chapter_number),
+        'comments': comments,
+    }
+    response = await render_async(request, 'reader.html', context)
+
+    if pages:
+        response['Link'] = manifest.preload_links(pages)
+    return response
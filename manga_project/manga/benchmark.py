@@ -0,0 +1,529 @@
+"""
+Dữ liệu giả lập và đo tải cho các trang công khai.
+
+``manage.py seed_benchmark`` sinh dữ liệu với khối lượng tùy chọn (truyện,
+chapter, trang, người dùng, theo dõi, đánh giá, bình luận, lượt xem theo
+ngày) bằng ``bulk_create``. Mọi trang truyện dùng chung vài ảnh giả lưu trên
+đĩa (storage lưu theo nội dung nên mỗi ảnh chỉ có một file). Độ phổ biến của
+truyện lệch như thực tế: vài truyện đầu nhận phần lớn lượt xem / theo dõi.
+
+``manage.py run_benchmark`` gọi các trang trang chủ, chi tiết truyện, đọc
+chapter, tìm kiếm và thể loại với nhiều luồng cùng lúc, qua test client (trong
+tiến trình) hoặc qua một server đang chạy, rồi ghi p50/p95/p99, số query mỗi
+request và thông lượng ra file JSON để so sánh giữa các lần chạy.
+"""
+import json
+import random
+import re
+import statistics
+import subprocess
+import threading
+import time
+from datetime import timedelta
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import connection, connections, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageDraw
+
+from . import comments as thread_comments, imaging, search_index, toc, trending
+from .instrumentation import get_config, profile
+from .models import (
+    Author, Category, Chapter, ChapterImage, Comment, Follow, Manga, Rating,
+    UserProfile, ViewCount, allocate_slugs,
+)
+from .storage import add_references
+
+# ==================== SINH DỮ LIỆU ====================
+PLACEHOLDER_PAGES = 4
+PAGE_SIZE = (800, 1200)
+COVER_SIZE = (300, 450)
+JPEG_QUALITY = 70
+
+CATEGORY_NAMES = [
+    'Hành động', 'Phiêu lưu', 'Hài hước', 'Tình cảm', 'Kinh dị', 'Học đường',
+    'Giả tưởng', 'Đời thường', 'Thể thao', 'Trinh thám', 'Khoa học viễn tưởng', 'Lịch sử',
+]
+TITLE_WORDS = [
+    'Kiếm', 'Rồng', 'Học viện', 'Bóng tối', 'Thợ săn', 'Huyền thoại', 'Ma pháp', 'Vương quốc',
+    'Ánh trăng', 'Mùa hè', 'Thành phố', 'Linh hồn', 'Bầu trời', 'Chiến binh', 'Hoa anh đào', 'Bí mật',
+]
+COMMENT_TEXTS = [
+    'Hay quá!', 'Chờ chapter mới', 'Tranh đẹp thật', 'Đoạn này cảm động ghê',
+    'Ai giải thích giúp mình với', 'Nhân vật chính mạnh quá', 'Cảm ơn nhóm dịch',
+]
+REPLY_SHARE = 0.3
+CHAPTER_COMMENT_SHARE = 0.3
+TOP_DAILY_VIEWS = 5000
+
+
+def _render_placeholder(size, color, label):
+    image = Image.new('RGB', size, color)
+    ImageDraw.Draw(image).text((20, 20), label, fill=(255, 255, 255))
+    buffer = BytesIO()
+    image.save(buffer, 'JPEG', quality=JPEG_QUALITY)
+    return image, buffer.getvalue()
+
+
+def _popularity(count, rng):
+    """Trọng số kiểu Zipf cho ``count`` truyện theo thứ tự ngẫu nhiên"""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** 0.8 for rank in ranks]
+
+
+class DatasetSeeder:
+    def __init__(self, mangas=100, chapters=20, pages=10, users=200, follows=10, ratings=5,
+                 comments=1000, days=30, batch_size=1000, prefix='bench', seed=None, log=print):
+        self.counts = {
+            'mangas': mangas, 'chapters': chapters, 'pages': pages, 'users': users,
+            'follows': follows, 'ratings': ratings, 'comments': comments, 'days': days,
+        }
+        self.batch_size = batch_size
+        self.prefix = prefix
+        self.rng = random.Random(seed)
+        self.log = log
+
+    def run(self):
+        self.create_placeholders()
+        user_ids = self.ensure_users()
+        manga_ids = self.create_mangas()
+        if manga_ids:
+            self.weights = _popularity(len(manga_ids), self.rng)
+            self.create_chapters(manga_ids)
+            self.create_follows(user_ids, manga_ids)
+            self.create_ratings(user_ids, manga_ids)
+            self.create_comments(user_ids, manga_ids)
+            self.create_views(manga_ids)
+        self.finish(manga_ids)
+        return manga_ids
+
+    def pick_mangas(self, manga_ids, k):
+        """``k`` truyện khác nhau, truyện phổ biến dễ được chọn hơn"""
+        k = min(k, len(manga_ids))
+        picked = set()
+        while len(picked) < k:
+            picked.update(self.rng.choices(manga_ids, weights=self.weights, k=k - len(picked)))
+        return picked
+
+    # ---------- ảnh giả ----------
+
+    def create_placeholders(self):
+        # Tham chiếu được thêm khi tạo từng bản ghi dùng ảnh (xem manga/storage.py)
+        page_storage = ChapterImage._meta.get_field('image').storage
+        cover_storage = Manga._meta.get_field('cover_image').storage
+        save_page = getattr(page_storage, 'save_unreferenced', page_storage.save)
+        save_cover = getattr(cover_storage, 'save_unreferenced', cover_storage.save)
+
+        self.pages = []
+        for index in range(PLACEHOLDER_PAGES):
+            color = (40 + 50 * index, 60, 120 - 20 * index)
+            image, data = _render_placeholder(PAGE_SIZE, color, f'{self.prefix} page {index + 1}')
+            name = save_page(f'chapters/{self.prefix}/page-{index + 1}.jpg', ContentFile(data))
+            self.pages.append((name, imaging.describe(image, len(data))))
+
+        image, data = _render_placeholder(COVER_SIZE, (90, 30, 60), f'{self.prefix} cover')
+        self.cover = save_cover(f'covers/{self.prefix}-cover.jpg', ContentFile(data))
+        self.cover_metadata = imaging.describe(image, len(data))
+
+    # ---------- người dùng ----------
+
+    def ensure_users(self):
+        usernames = [f'{self.prefix}-user-{i}' for i in range(self.counts['users'])]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        # Mật khẩu không dùng được: không tốn thời gian băm, không ai đăng nhập được
+        password = make_password(None)
+        missing = [name for name in usernames if name not in existing]
+        for start in range(0, len(missing), self.batch_size):
+            User.objects.bulk_create([
+                User(username=name, password=password)
+                for name in missing[start:start + self.batch_size]
+            ])
+
+        user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user_id=user_id) for user_id in
+             User.objects.filter(id__in=user_ids, profile__isnull=True).values_list('id', flat=True)],
+            batch_size=self.batch_size,
+        )
+        self.log(f'Người dùng: {len(missing)} mới, {len(user_ids)} tổng')
+        return user_ids
+
+    # ---------- truyện ----------
+
+    def ensure_named(self, model, names):
+        existing = dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+        missing = [name for name in names if name not in existing]
+        if missing:
+            slugs = allocate_slugs(model, missing)
+            model.objects.bulk_create([model(name=name, slug=slug) for name, slug in zip(missing, slugs)])
+            existing.update(model.objects.filter(slug__in=slugs).values_list('name', 'id'))
+        return [existing[name] for name in names]
+
+    def create_mangas(self):
+        total = self.counts['mangas']
+        author_ids = self.ensure_named(
+            Author, [f'Tác giả {self.prefix} {i}' for i in range(max(1, total // 5))],
+        )
+        category_ids = self.ensure_named(Category, CATEGORY_NAMES)
+        statuses = [value for value, _ in Manga.STATUS_CHOICES]
+
+        manga_ids = []
+        for start in range(0, total, self.batch_size):
+            titles = [
+                f'{self.rng.choice(TITLE_WORDS)} {self.rng.choice(TITLE_WORDS).lower()} {self.prefix} {i}'
+                for i in range(start, min(start + self.batch_size, total))
+            ]
+            slugs = allocate_slugs(Manga, titles)
+
+            mangas = []
+            for title, slug in zip(titles, slugs):
+                manga = Manga(
+                    title=title,
+                    slug=slug,
+                    author_id=self.rng.choice(author_ids),
+                    description=f'Truyện giả lập để đo tải: {title}.',
+                    cover_image=self.cover,
+                    status=self.rng.choice(statuses),
+                )
+                manga.set_cover_metadata(self.cover_metadata)
+                mangas.append(manga)
+
+            with transaction.atomic():
+                add_references([self.cover] * len(mangas))
+                Manga.objects.bulk_create(mangas)
+                ids = dict(Manga.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+
+                Through = Manga.categories.through
+                Through.objects.bulk_create([
+                    Through(manga_id=ids[slug], category_id=category_id)
+                    for slug in slugs
+                    for category_id in self.rng.sample(category_ids, self.rng.randint(1, 3))
+                ])
+
+            manga_ids.extend(ids[slug] for slug in slugs)
+            self.log(f'Đã tạo {len(manga_ids)}/{total} truyện')
+
+        self.manga_slugs = dict(Manga.objects.filter(id__in=manga_ids).values_list('id', 'slug'))
+        return manga_ids
+
+    def create_chapters(self, manga_ids):
+        chapters, pages = self.counts['chapters'], self.counts['pages']
+        # Mỗi lô gồm khoảng batch_size chapter
+        group = max(1, self.batch_size // max(chapters, 1))
+
+        for start in range(0, len(manga_ids), group):
+            batch = manga_ids[start:start + group]
+            with transaction.atomic():
+                Chapter.objects.bulk_create([
+                    Chapter(
+                        manga_id=manga_id,
+                        chapter_number=number,
+                        slug=Chapter.build_slug(self.manga_slugs[manga_id], number),
+                    )
+                    for manga_id in batch
+                    for number in range(1, chapters + 1)
+                ])
+                chapter_ids = Chapter.objects.filter(manga_id__in=batch).values_list('id', flat=True)
+
+                images = [
+                    ChapterImage(chapter_id=chapter_id, page_number=page, image=name, **metadata)
+                    for chapter_id in chapter_ids
+                    for page in range(1, pages + 1)
+                    for name, metadata in [self.pages[(page - 1) % len(self.pages)]]
+                ]
+                add_references(image.image.name for image in images)
+                ChapterImage.objects.bulk_create(images, batch_size=self.batch_size)
+
+            Manga.refresh_chapter_stats_bulk(batch)
+            self.log(f'Đã tạo chapter cho {min(start + group, len(manga_ids))}/{len(manga_ids)} truyện')
+
+    # ---------- tương tác ----------
+
+    def create_follows(self, user_ids, manga_ids):
+        follows = [
+            Follow(user_id=user_id, manga_id=manga_id)
+            for user_id in user_ids
+            for manga_id in self.pick_mangas(manga_ids, self.counts['follows'])
+        ]
+        Follow.objects.bulk_create(follows, ignore_conflicts=True, batch_size=self.batch_size)
+        # Chưa đọc chapter nào: mọi chapter đều là chapter mới
+        follow_ids = list(Follow.objects.filter(manga_id__in=manga_ids).values_list('id', flat=True))
+        for start in range(0, len(follow_ids), self.batch_size):
+            Follow.reconcile_unread(follow_ids[start:start + self.batch_size])
+        self.log(f'Đã tạo {len(follows)} lượt theo dõi')
+
+    def create_ratings(self, user_ids, manga_ids):
+        ratings = [
+            Rating(user_id=user_id, manga_id=manga_id, score=self.rng.choice([5, 6, 7, 7, 8, 8, 8, 9, 9, 10]))
+            for user_id in user_ids
+            for manga_id in self.pick_mangas(manga_ids, self.counts['ratings'])
+        ]
+        Rating.objects.bulk_create(ratings, ignore_conflicts=True, batch_size=self.batch_size)
+        for start in range(0, len(manga_ids), 500):
+            Manga.reconcile_ratings(manga_ids[start:start + 500])
+        self.log(f'Đã tạo {len(ratings)} lượt đánh giá')
+
+    def create_comments(self, user_ids, manga_ids):
+        total = self.counts['comments']
+        if not total or not user_ids:
+            return
+
+        chapter_ids = {}
+        for chapter_id, manga_id in Chapter.objects.filter(manga_id__in=manga_ids).values_list('id', 'manga_id'):
+            chapter_ids.setdefault(manga_id, []).append(chapter_id)
+
+        def comment(**kwargs):
+            return Comment(user_id=self.rng.choice(user_ids), content=self.rng.choice(COMMENT_TEXTS), **kwargs)
+
+        roots = []
+        for manga_id in self.rng.choices(manga_ids, weights=self.weights, k=total - int(total * REPLY_SHARE)):
+            chapter_id = None
+            if chapter_ids.get(manga_id) and self.rng.random() < CHAPTER_COMMENT_SHARE:
+                chapter_id = self.rng.choice(chapter_ids[manga_id])
+            roots.append(comment(manga_id=manga_id, chapter_id=chapter_id))
+        Comment.objects.bulk_create(roots, batch_size=self.batch_size)
+
+        # bulk_create không trả id trên MySQL: lấy lại các bình luận gốc vừa tạo
+        created = list(
+            Comment.objects.filter(manga_id__in=manga_ids, parent__isnull=True)
+            .values_list('id', 'manga_id', 'chapter_id')
+        )
+        replies = [
+            comment(manga_id=manga_id, chapter_id=chapter_id, parent_id=root_id, root_id=root_id)
+            for root_id, manga_id, chapter_id in self.rng.choices(created, k=int(total * REPLY_SHARE))
+        ]
+        Comment.objects.bulk_create(replies, batch_size=self.batch_size)
+
+        thread_comments.refresh_counts(manga_ids)
+        self.log(f'Đã tạo {len(roots) + len(replies)} bình luận')
+
+    def create_views(self, manga_ids):
+        today = timezone.localdate()
+        totals = {}
+        rows = []
+        for manga_id, weight in zip(manga_ids, self.weights):
+            for day in range(self.counts['days']):
+                count = int(TOP_DAILY_VIEWS * weight * self.rng.uniform(0.5, 1.5))
+                rows.append(ViewCount(manga_id=manga_id, date=today - timedelta(days=day), count=count))
+                totals[manga_id] = totals.get(manga_id, 0) + count
+
+            if len(rows) >= self.batch_size:
+                ViewCount.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        ViewCount.objects.bulk_create(rows, ignore_conflicts=True)
+
+        Manga.objects.bulk_update(
+            [Manga(id=manga_id, views=views) for manga_id, views in totals.items()],
+            ['views'], batch_size=self.batch_size,
+        )
+        self.log(f'Đã tạo lượt xem {self.counts["days"]} ngày cho {len(manga_ids)} truyện')
+
+    def finish(self, manga_ids):
+        # bulk_create không gửi signal: tự cập nhật các dữ liệu phụ thuộc
+        for manga_id in manga_ids:
+            toc.invalidate(manga_id)
+        search_index.invalidate()
+        trending.refresh_all()
+
+
+# ==================== ĐO TẢI ====================
+SCENARIOS = ['home', 'manga_detail', 'read_chapter', 'search', 'category_view']
+PATH_POOL_SIZE = 200
+SERVER_TIMING_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+
+
+def summarize(latencies, elapsed, errors, queries=None):
+    """Thông lượng, p50/p95/p99 (ms) và số query trung bình mỗi request"""
+    latencies = sorted(latencies)
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    result = {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0,
+        'p50': quantiles[49] * 1000 if quantiles else None,
+        'p95': quantiles[94] * 1000 if quantiles else None,
+        'p99': quantiles[98] * 1000 if quantiles else None,
+    }
+    queries = [count for count in queries or [] if count is not None]
+    if queries:
+        result['queries_mean'] = statistics.fmean(queries)
+        result['queries_max'] = max(queries)
+    return result
+
+
+def scenario_paths(scenario, rng=random):
+    """Các URL của một kịch bản, lấy từ truyện được xem nhiều nhất (giống lưu lượng thật)"""
+    popular = Manga.objects.order_by('-views', 'id')[:PATH_POOL_SIZE]
+
+    if scenario == 'home':
+        return [reverse('home')]
+    if scenario == 'manga_detail':
+        return [reverse('manga_detail', args=[slug]) for slug in popular.values_list('slug', flat=True)]
+    if scenario == 'read_chapter':
+        manga_ids = list(popular.values_list('id', flat=True)[:PATH_POOL_SIZE // 10])
+        chapters = (
+            Chapter.objects.filter(manga_id__in=manga_ids).order_by('manga_id', 'chapter_number')
+            .values_list('manga__slug', 'slug')[:PATH_POOL_SIZE]
+        )
+        return [reverse('read_chapter', args=[manga_slug, slug]) for manga_slug, slug in chapters]
+    if scenario == 'search':
+        words = {word for title in popular.values_list('title', flat=True) for word in title.split()[:2]}
+        paths = [f'{reverse("search")}?{urlencode({"q": word})}' for word in sorted(words)]
+        paths.append(f'{reverse("search")}?{urlencode({"status": "ongoing"})}')
+        rng.shuffle(paths)
+        return paths[:PATH_POOL_SIZE]
+    if scenario == 'category_view':
+        return [
+            reverse('category', args=[slug])
+            for slug in Category.objects.order_by('id').values_list('slug', flat=True)[:PATH_POOL_SIZE]
+        ]
+    raise ValueError(f'Không có kịch bản {scenario}')
+
+
+def dataset_size():
+    return {
+        'mangas': Manga.objects.count(),
+        'chapters': Chapter.objects.count(),
+        'pages': ChapterImage.objects.count(),
+        'users': User.objects.count(),
+        'follows': Follow.objects.count(),
+        'ratings': Rating.objects.count(),
+        'comments': Comment.objects.count(),
+        'view_days': ViewCount.objects.aggregate(days=Count('date', distinct=True))['days'],
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, timeout=5,
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class LoadRunner:
+    """
+    Chạy ``requests`` request cho từng kịch bản với ``concurrency`` luồng.
+
+    ``base_url`` rỗng: gọi qua test client trong tiến trình, số query đo trực
+    tiếp. Có ``base_url``: gửi HTTP tới server đang chạy, số query đọc từ
+    header Server-Timing (cần INSTRUMENTATION['SERVER_TIMING']).
+    """
+
+    def __init__(self, requests=200, concurrency=8, base_url=None, username=None, warmup=True):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.user = User.objects.get(username=username) if username else None
+        self.warmup = warmup
+
+    def fetch(self, client, path):
+        """Trả về (status, số query hoặc None)"""
+        if self.base_url is None:
+            with profile(trace_memory=False) as result:
+                response = client.get(path)
+            return response.status_code, result.query_count
+
+        try:
+            with urlopen(self.base_url + path) as response:
+                response.read()
+                status, timing = response.status, response.headers.get('Server-Timing', '')
+        except HTTPError as e:
+            status, timing = e.code, e.headers.get('Server-Timing', '')
+        match = SERVER_TIMING_QUERIES_RE.search(timing)
+        return status, int(match.group(1)) if match else None
+
+    def make_client(self):
+        if self.base_url is not None:
+            return None
+        client = Client()
+        if self.user is not None:
+            client.force_login(self.user)
+        return client
+
+    def run_scenario(self, paths):
+        latencies, queries = [], []
+        errors = [0]
+        counter = iter(range(self.requests))
+        lock = threading.Lock()
+
+        def worker():
+            client = self.make_client()
+            try:
+                while True:
+                    with lock:
+                        index = next(counter, None)
+                    if index is None:
+                        return
+                    started = time.perf_counter()
+                    status, count = self.fetch(client, paths[index % len(paths)])
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        queries.append(count)
+                        errors[0] += status != 200
+            finally:
+                connections.close_all()
+
+        if self.warmup:
+            # Làm nóng cache (mục lục, manifest, chỉ mục tìm kiếm) trước khi đo
+            client = self.make_client()
+            for path in paths[:self.concurrency]:
+                self.fetch(client, path)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, time.perf_counter() - started, errors[0], queries)
+
+    def run(self, scenarios=SCENARIOS, log=print):
+        results = {}
+        # Không ghi log từng request của middleware đo trong lúc chạy
+        with override_settings(INSTRUMENTATION={**get_config(), 'LOG': False}):
+            for scenario in scenarios:
+                paths = scenario_paths(scenario)
+                if not paths:
+                    log(f'Bỏ qua {scenario}: không có dữ liệu')
+                    continue
+                results[scenario] = self.run_scenario(paths)
+                log(f'Xong {scenario}')
+
+        return {
+            'timestamp': timezone.now().isoformat(),
+            'revision': git_revision(),
+            'target': self.base_url or 'test-client',
+            'database': connection.vendor,
+            'logged_in': self.user is not None,
+            'requests': self.requests,
+            'concurrency': self.concurrency,
+            'dataset': dataset_size(),
+            'scenarios': results,
+        }
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+def load_results(path):
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
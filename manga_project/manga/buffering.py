@@ -0,0 +1,126 @@
+"""
+Khung chung cho các bộ đệm ghi trễ (write-behind).
+
+Dữ liệu được gom trong bộ nhớ của từng tiến trình, một luồng nền định kỳ
+lấy ra (``drain``) và ghi xuống DB theo lô (``write``). Nếu ghi lỗi, dữ liệu
+được trả lại bộ đệm (``restore``) để lần sau ghi tiếp. Lỗi tạm thời của DB
+(mất kết nối, khóa) luôn được thử lại; lỗi khác (sai dữ liệu, backend không hỗ
+trợ câu lệnh) lặp lại ``max_failures`` lần liên tiếp thì bỏ lô đó, tránh bộ đệm
+phình mãi. Dùng cho bộ đếm lượt xem (manga/view_counter.py) và tiến độ đọc
+(manga/reading_progress.py).
+"""
+import atexit
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+
+from django.db import InterfaceError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedWriter(ABC):
+    """Lớp con cài đặt ``drain``, ``restore`` và ``write``"""
+
+    thread_name = 'buffer-flush'
+    # Số lần lỗi không tạm thời liên tiếp trước khi bỏ lô
+    max_failures = 5
+
+    def __init__(self, flush_interval=10):
+        self.flush_interval = flush_interval
+        self._failures = 0
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._start_lock = threading.Lock()
+        self._atexit_registered = False
+
+    @abstractmethod
+    def drain(self):
+        """Lấy ra và xóa toàn bộ dữ liệu đang chờ"""
+
+    @abstractmethod
+    def restore(self, pending):
+        """Trả lại dữ liệu khi ghi DB thất bại để không bị mất"""
+
+    @abstractmethod
+    def write(self, pending):
+        """Ghi một lô xuống DB"""
+
+    def size(self, pending):
+        return len(pending)
+
+    def schedule(self):
+        """Gọi sau mỗi lần thêm dữ liệu: ghi ngay hoặc để luồng nền ghi"""
+        if not self.flush_interval:
+            self.flush()
+        else:
+            self._ensure_started()
+
+    def flush(self):
+        """Ghi toàn bộ dữ liệu đang chờ xuống DB, trả về số mục đã ghi"""
+        pending = self.drain()
+        if not pending:
+            return 0
+
+        try:
+            self.write(pending)
+        except (OperationalError, InterfaceError):
+            # DB tạm thời không ghi được: giữ lại, không tính vào số lần lỗi
+            logger.exception('%s: không ghi được %d mục, sẽ thử lại', type(self).__name__, self.size(pending))
+            self.restore(pending)
+            return 0
+        except Exception:
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                logger.exception(
+                    '%s: ghi lỗi %d lần liên tiếp, bỏ %d mục',
+                    type(self).__name__, self._failures, self.size(pending),
+                )
+                self._failures = 0
+                return 0
+            logger.exception('%s: không ghi được %d mục, sẽ thử lại', type(self).__name__, self.size(pending))
+            self.restore(pending)
+            return 0
+
+        self._failures = 0
+        return self.size(pending)
+
+    def stop(self):
+        """
+        Dừng luồng nền và ghi nốt phần còn lại (gọi khi tắt tiến trình, hoặc
+        cuối bộ test khi DB test còn tồn tại). Lần ghi sau sẽ khởi động lại luồng.
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=self.flush_interval + 5)
+        self._thread = None
+
+        with self._start_lock:
+            if self._atexit_registered:
+                atexit.unregister(self.stop)
+                self._atexit_registered = False
+        self.flush()
+
+    def _ensure_started(self):
+        # Sau khi fork (gunicorn --preload) luồng cũ không còn, phải khởi động lại
+        if self._thread is not None and self._pid == os.getpid():
+            return
+
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,124 @@
+"""
+Tải bình luận theo luồng (bình luận gốc + cây trả lời).
+
+Mỗi bình luận lưu ``root`` (bình luận gốc của luồng) nên một trang bình luận
+chỉ tốn đúng 2 query bất kể số trả lời:
+
+1. một trang bình luận gốc, phân trang theo con trỏ (``-created_at, -id``);
+2. các trả lời của những bình luận gốc đó, mỗi luồng tối đa
+   ``REPLIES_PER_THREAD`` trả lời đầu tiên (hàm cửa sổ ROW_NUMBER).
+
+Người viết được nạp cùng bằng select_related. Số bình luận của truyện /
+chapter và số trả lời của luồng được cộng dồn trong manga/signals.py.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Chapter, Comment, Manga
+from .pagination import KeysetPaginator
+
+PER_PAGE = 10
+REPLIES_PER_THREAD = 20
+# Trả lời sâu hơn vẫn được hiển thị, chỉ không thụt lề thêm
+MAX_DEPTH = 4
+
+
+def root_comments(manga_id, chapter_id=None):
+    """Bình luận gốc ở trang truyện (chapter_id=None) hoặc ở một chapter"""
+    return Comment.objects.filter(manga_id=manga_id, chapter_id=chapter_id, root__isnull=True)
+
+
+def _thread_replies(root_ids, limit):
+    replies = (
+        Comment.objects.filter(root_id__in=root_ids)
+        .select_related('user')
+        .annotate(position=Window(
+            RowNumber(), partition_by=[F('root_id')], order_by=[F('created_at').asc(), F('id').asc()],
+        ))
+        .filter(position__lte=limit)
+        .order_by('created_at', 'id')
+    )
+
+    by_root = defaultdict(list)
+    for reply in replies:
+        by_root[reply.root_id].append(reply)
+    return by_root
+
+
+def _flatten(root, replies):
+    """Sắp trả lời theo thứ tự duyệt cây (mỗi trả lời ngay dưới bình luận cha) và gán depth"""
+    children = defaultdict(list)
+    loaded = {reply.id for reply in replies}
+    for reply in replies:
+        # Cha nằm ngoài phần đã tải (luồng dài): gắn thẳng vào bình luận gốc
+        parent_id = reply.parent_id if reply.parent_id in loaded else root.id
+        children[parent_id].append(reply)
+
+    ordered = []
+    stack = [(reply, 1) for reply in reversed(children[root.id])]
+    while stack:
+        reply, depth = stack.pop()
+        reply.depth = min(depth, MAX_DEPTH)
+        ordered.append(reply)
+        stack.extend((child, depth + 1) for child in reversed(children[reply.id]))
+    return ordered
+
+
+def get_thread_page(manga_id, chapter_id=None, cursor=None, per_page=PER_PAGE,
+                    replies_per_thread=REPLIES_PER_THREAD):
+    """
+    Một trang bình luận gốc kèm trả lời. Mỗi bình luận gốc có thêm
+    ``thread_replies`` (danh sách đã sắp, mỗi phần tử có ``depth``) và
+    ``hidden_replies`` (số trả lời không được tải).
+    """
+    paginator = KeysetPaginator(
+        root_comments(manga_id, chapter_id).select_related('user'),
+        ['-created_at', '-id'],
+        per_page=per_page,
+    )
+    page = paginator.get_page(cursor)
+
+    # Chỉ query trả lời cho các luồng có trả lời
+    root_ids = [comment.id for comment in page if comment.reply_count]
+    by_root = _thread_replies(root_ids, replies_per_thread) if root_ids else {}
+
+    for comment in page:
+        comment.thread_replies = _flatten(comment, by_root.get(comment.id, []))
+        comment.hidden_replies = max(comment.reply_count - len(comment.thread_replies), 0)
+    return page
+
+
+def refresh_counts(manga_ids, batch_size=1000):
+    """
+    Tính lại số bình luận của truyện / chapter và số trả lời của từng luồng.
+    Dùng sau khi tạo bình luận bằng bulk_create (không có signal).
+    """
+    comments = Comment.objects.filter(manga_id__in=manga_ids).order_by()
+    with transaction.atomic():
+        comments.filter(reply_count__gt=0).update(reply_count=0)
+        Chapter.objects.filter(manga_id__in=manga_ids, comment_count__gt=0).update(comment_count=0)
+        _write_counts(comments, manga_ids, batch_size)
+
+
+def _write_counts(comments, manga_ids, batch_size):
+    replies = comments.filter(root__isnull=False).values('root_id').annotate(count=Count('id'))
+    Comment.objects.bulk_update(
+        [Comment(id=row['root_id'], reply_count=row['count']) for row in replies],
+        ['reply_count'], batch_size=batch_size,
+    )
+
+    per_manga = dict(comments.filter(chapter__isnull=True).values('manga_id').annotate(count=Count('id'))
+                     .values_list('manga_id', 'count'))
+    Manga.objects.bulk_update(
+        [Manga(id=manga_id, comment_count=per_manga.get(manga_id, 0)) for manga_id in manga_ids],
+        ['comment_count'], batch_size=batch_size,
+    )
+
+    per_chapter = comments.filter(chapter__isnull=False).values('chapter_id').annotate(count=Count('id'))
+    Chapter.objects.bulk_update(
+        [Chapter(id=row['chapter_id'], comment_count=row['count']) for row in per_chapter],
+        ['comment_count'], batch_size=batch_size,
+    )
@@ -0,0 +1,210 @@
+"""
+Conditional GET (ETag / Last-Modified, 304) cho các trang công khai.
+
+Với khách chưa đăng nhập, trước khi render view ta tính một "trạng thái" rẻ
+(một vài query aggregate hoặc đọc cache) từ updated_at và các trường tính
+sẵn. Nếu trình duyệt/proxy gửi lại đúng ETag thì trả 304 mà không render.
+
+Người dùng đã đăng nhập luôn được render đầy đủ vì trang có nội dung riêng
+(theo dõi, đánh giá, form bình luận).
+"""
+import hashlib
+import time
+from datetime import datetime, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from . import manifest, toc
+from .models import Category, Chapter, Comment, Manga, SimilarManga, TrendingEntry
+from .view_counter import is_prefetch
+
+DEFAULT_WINDOW = 300
+
+
+def get_window():
+    # Lượt xem không làm đổi updated_at: số lượt xem hiển thị có thể cũ tối đa chừng này giây
+    return getattr(settings, 'CONDITIONAL_GET_WINDOW', DEFAULT_WINDOW)
+
+
+def make_state(parts, timestamps, **extra):
+    window = get_window()
+    bucket = int(time.time() // window) if window else 0
+    source = repr((bucket, *parts)).encode()
+
+    last_modified = max((ts for ts in timestamps if ts is not None), default=None)
+    if window:
+        bucket_start = datetime.fromtimestamp(bucket * window, tz=dt_timezone.utc)
+        last_modified = max(last_modified, bucket_start) if last_modified else bucket_start
+
+    return {
+        'etag': quote_etag(hashlib.md5(source).hexdigest()),
+        'last_modified': int(last_modified.timestamp()) if last_modified else None,
+        **extra,
+    }
+
+
+def _aggregate(queryset, group_by, aggregate):
+    """Subquery một giá trị aggregate của bảng con theo từng dòng cha"""
+    return Subquery(queryset.order_by().values(group_by).annotate(value=aggregate).values('value')[:1])
+
+
+# ==================== TRẠNG THÁI TỪNG TRANG ====================
+
+def home_state():
+    mangas = Manga.objects.aggregate(
+        updated=Max('updated_at'), latest_chapter=Max('latest_chapter_at'), total=Count('id'),
+    )
+    trending_at = TrendingEntry.objects.aggregate(computed=Max('computed_at'))['computed']
+    categories = Category.objects.aggregate(total=Count('id'), last=Max('id'))
+
+    return make_state(
+        (mangas['updated'], mangas['latest_chapter'], mangas['total'], trending_at,
+         categories['total'], categories['last']),
+        (mangas['updated'], mangas['latest_chapter'], trending_at),
+    )
+
+
+def manga_detail_state(slug):
+    # comment_count tính sẵn; updated_at mới nhất để bắt cả bình luận bị sửa trong admin
+    comments = Comment.objects.filter(manga=OuterRef('pk'), chapter__isnull=True)
+    # Truyện tương tự được job tính lại định kỳ
+    similar = SimilarManga.objects.filter(manga=OuterRef('pk'))
+    state = (
+        Manga.objects.filter(slug=slug)
+        .annotate(
+            last_comment=_aggregate(comments, 'manga', Max('updated_at')),
+            similar_at=_aggregate(similar, 'manga', Max('computed_at')),
+        )
+        .values('id', 'updated_at', 'latest_chapter_at', 'chapter_count',
+                'comment_count', 'last_comment', 'similar_at', 'rating_sum', 'rating_count')
+        .first()
+    )
+    if state is None:
+        return None
+
+    return make_state(
+        tuple(state.values()),
+        (state['updated_at'], state['latest_chapter_at'], state['last_comment'], state['similar_at']),
+        manga_id=state['id'],
+    )
+
+
+def read_chapter_state(manga_slug, chapter_slug):
+    comments = Comment.objects.filter(chapter=OuterRef('pk'))
+    state = (
+        Chapter.objects.filter(slug=chapter_slug, manga__slug=manga_slug)
+        .annotate(last_comment=_aggregate(comments, 'chapter', Max('updated_at')))
+        .values('id', 'manga_id', 'updated_at', 'manga__updated_at', 'comment_count', 'last_comment')
+        .first()
+    )
+    if state is None:
+        return None
+
+    # Danh sách trang và chapter trước/sau lấy version từ cache
+    chapter_manifest = manifest.get_manifest(state['id'])
+    toc_version = toc.get_version(state['manga_id'])
+
+    return make_state(
+        (*state.values(), chapter_manifest['etag'] if chapter_manifest else None, toc_version),
+        (state['updated_at'], state['manga__updated_at'], state['last_comment']),
+        chapter_id=state['id'],
+    )
+
+
+def category_state(slug):
+    state = (
+        Category.objects.filter(slug=slug)
+        .annotate(last_updated=Max('mangas__updated_at'), total=Count('mangas'))
+        .values('id', 'name', 'description', 'last_updated', 'total')
+        .first()
+    )
+    if state is None:
+        return None
+
+    return make_state(tuple(state.values()), (state['last_updated'],))
+
+
+# ==================== DECORATOR ====================
+
+def _skip(request, user):
+    return (
+        request.method not in ('GET', 'HEAD')
+        or user.is_authenticated
+        # Trang có flash message phải được render để hiện message
+        or len(messages.get_messages(request))
+    )
+
+
+def _apply_state(request, response, state):
+    if response.status_code in (200, 304):
+        response['ETag'] = state['etag']
+        if state['last_modified'] is not None:
+            response['Last-Modified'] = http_date(state['last_modified'])
+
+        # Trang có đặt cookie (CSRF, session) thì proxy không được dùng chung
+        shared = not response.cookies and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+        if shared:
+            patch_cache_control(response, public=True, no_cache=True)
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def conditional_page(get_state, on_not_modified=None):
+    """
+    Trả 304 cho khách chưa đăng nhập khi ETag/Last-Modified chưa đổi.
+
+    ``get_state`` nhận cùng tham số URL với view, trả về kết quả của
+    ``make_state`` hoặc None (khi đó view chạy bình thường, ví dụ để trả 404).
+    ``on_not_modified(state)`` chạy khi trả 304, dùng để vẫn đếm lượt xem
+    (bỏ qua với request tải trước, xem ``view_counter.is_prefetch``).
+    Dùng được cho cả view async (manga/async_views.py).
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                user = await request.auser()
+                if await sync_to_async(_skip)(request, user):
+                    return await view(request, *args, **kwargs)
+
+                state = await sync_to_async(get_state)(*args, **kwargs)
+                if state is None:
+                    return await view(request, *args, **kwargs)
+
+                response = get_conditional_response(
+                    request, etag=state['etag'], last_modified=state['last_modified'],
+                )
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                elif on_not_modified is not None and not is_prefetch(request):
+                    await sync_to_async(on_not_modified)(state)
+                return _apply_state(request, response, state)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if _skip(request, request.user):
+                return view(request, *args, **kwargs)
+
+            state = get_state(*args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+
+            response = get_conditional_response(
+                request, etag=state['etag'], last_modified=state['last_modified'],
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+            elif on_not_modified is not None and not is_prefetch(request):
+                on_not_modified(state)
+            return _apply_state(request, response, state)
+        return wrapper
+    return decorator
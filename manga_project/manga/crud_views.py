@@ -1,11 +1,12 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.db.models import Count
 from .models import Manga, Chapter, ChapterImage, Category, Author
-from django.core.files.storage import FileSystemStorage
-from django.core.files.base import ContentFile
+from .pagination import KeysetPaginator
+from django.db import transaction
+from . import ingest
 import zipfile
-import os
 
 
 def is_admin(user):
@@ -18,7 +19,8 @@ def is_admin(user):
 @user_passes_test(is_admin)
 def manga_list(request):
     """Danh sách tất cả truyện"""
-    mangas = Manga.objects.all().order_by('-created_at')
+    mangas = Manga.objects.select_related('author')
+    mangas = KeysetPaginator(mangas, ('-created_at', 'id'), 50).get_page(request.GET.get('cursor'))
     return render(request, 'crud/manga_list.html', {'mangas': mangas})
 
 
@@ -139,7 +141,9 @@ def manga_delete(request, manga_id):
 def chapter_list(request, manga_id):
     """Danh sách chapter của truyện"""
     manga = get_object_or_404(Manga, id=manga_id)
-    chapters = manga.chapters.all().order_by('-chapter_number')
+    chapters = KeysetPaginator(
+        manga.chapters.annotate(image_total=Count('images')), ('-chapter_number', 'id'), 50
+    ).get_page(request.GET.get('cursor'))
     return render(request, 'crud/chapter_list.html', {
         'manga': manga,
         'chapters': chapters
@@ -167,81 +171,45 @@ def chapter_create(request, manga_id):
                 messages.error(request, f'Chapter {chapter_number} đã tồn tại!')
                 return redirect('crud_chapter_create', manga_id=manga_id)
 
-            # Tạo chapter
-            chapter = Chapter.objects.create(
-                manga=manga,
-                chapter_number=float(chapter_number),
-                title=title
-            )
-
-            # Xử lý upload ảnh từng file
             images = request.FILES.getlist('images')
-            if images:
-                for idx, image in enumerate(images, start=1):
-                    ChapterImage.objects.create(
-                        chapter=chapter,
-                        image=image,
-                        page_number=idx
+            zip_file = request.FILES.get('zip_file')
+            reports = []
+
+            try:
+                # Tạo chapter và ảnh trong một transaction: lỗi thì không để lại chapter rỗng
+                with transaction.atomic():
+                    chapter = Chapter.objects.create(
+                        manga=manga,
+                        chapter_number=float(chapter_number),
+                        title=title
                     )
 
-            # Xử lý upload ZIP
-            zip_file = request.FILES.get('zip_file')
-            if zip_file:
-                try:
-                    # Lưu file tạm
-                    fs = FileSystemStorage()
-                    filename = fs.save(zip_file.name, zip_file)
-                    uploaded_file_path = fs.path(filename)
-
-                    # Giải nén
-                    with zipfile.ZipFile(uploaded_file_path, 'r') as zip_ref:
-                        # Lấy danh sách file ảnh và sắp xếp
-                        image_files = sorted([
-                            f for f in zip_ref.namelist()
-                            if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp'))
-                               and not f.startswith('__MACOSX')
-                               and not f.startswith('.')
-                        ])
-
-                        # Tạo ChapterImage từ mỗi ảnh
-                        for idx, img_name in enumerate(image_files, start=1):
-                            img_data = zip_ref.read(img_name)
-
-                            # Lấy extension từ file gốc
-                            ext = os.path.splitext(img_name)[1].lower()
-                            if not ext:
-                                ext = '.jpg'
-
-                            chapter_image = ChapterImage(
-                                chapter=chapter,
-                                page_number=idx
-                            )
-
-                            # Lưu ảnh với tên file mới
-                            filename = f"ch{chapter.chapter_number}_p{idx:03d}{ext}"
-                            chapter_image.image.save(
-                                filename,
-                                ContentFile(img_data),
-                                save=True
-                            )
-
-                    # Xóa file ZIP tạm
-                    os.remove(uploaded_file_path)
-
-                except zipfile.BadZipFile:
+                    # Xử lý upload ảnh từng file
+                    if images:
+                        reports.append(ingest.ingest_files(chapter, images))
+
+                    # Xử lý upload ZIP (đọc thẳng từ file upload, không lưu file tạm)
+                    if zip_file:
+                        reports.append(ingest.ingest_zip(chapter, zip_file))
+
+            except Exception as e:
+                # Chapter đã rollback, xóa luôn các ảnh đã ghi ra đĩa
+                for report in reports:
+                    report.discard()
+
+                if isinstance(e, zipfile.BadZipFile):
                     messages.error(request, 'File ZIP không hợp lệ!')
-                    chapter.delete()
-                    return redirect('crud_chapter_create', manga_id=manga_id)
-                except Exception as e:
-                    messages.error(request, f'Lỗi khi xử lý ZIP: {str(e)}')
-                    chapter.delete()
-                    return redirect('crud_chapter_create', manga_id=manga_id)
+                else:
+                    messages.error(request, f'Lỗi khi xử lý ảnh: {str(e)}')
+                return redirect('crud_chapter_create', manga_id=manga_id)
 
             # Kiểm tra có ảnh không
-            if not chapter.images.exists():
+            pages = sum(report.pages for report in reports)
+            if not pages:
                 messages.warning(request, f'Chapter {chapter_number} đã được tạo nhưng chưa có ảnh!')
             else:
-                messages.success(request, f'Đã tạo Chapter {chapter_number} với {chapter.images.count()} trang!')
+                elapsed = sum(report.elapsed for report in reports)
+                messages.success(request, f'Đã tạo Chapter {chapter_number} với {pages} trang ({elapsed:.1f}s)!')
 
             return redirect('crud_chapter_list', manga_id=manga.id)
 
@@ -325,7 +293,8 @@ def chapter_delete(request, chapter_id):
 @user_passes_test(is_admin)
 def category_list(request):
     """Danh sách thể loại"""
-    categories = Category.objects.all().order_by('name')
+    categories = Category.objects.annotate(manga_total=Count('mangas'))
+    categories = KeysetPaginator(categories, ('name', 'id'), 50).get_page(request.GET.get('cursor'))
     return render(request, 'crud/category_list.html', {'categories': categories})
 
 
@@ -400,7 +369,8 @@ def category_delete(request, category_id):
 @user_passes_test(is_admin)
 def author_list(request):
     """Danh sách tác giả"""
-    authors = Author.objects.all().order_by('name')
+    authors = Author.objects.annotate(manga_total=Count('manga'))
+    authors = KeysetPaginator(authors, ('name', 'id'), 50).get_page(request.GET.get('cursor'))
     return render(request, 'crud/author_list.html', {'authors': authors})
 
 
@@ -0,0 +1,204 @@
+"""
+Feed "chapter mới của truyện đang theo dõi" cho từng người dùng.
+
+Ghi (fan-out on write): khi có chapter mới, một bước chạy nền sau commit chép
+chapter đó vào ``FeedEntry`` của mọi người theo dõi truyện, theo từng lô
+``BATCH_SIZE`` người bằng bulk_create.
+
+Truyện có hơn ``FANOUT_LIMIT`` người theo dõi thì không chép (quá nhiều dòng
+cho một chapter): chapter được đánh dấu ``fanout_on_read`` và feed tự đọc các
+chapter này của những truyện người dùng theo dõi (fan-out on read).
+
+Đọc: một trang feed là MỘT query ``UNION ALL`` của hai nhánh, cả hai đi theo
+index và chỉ lấy ``per_page + 1`` dòng, phân trang bằng con trỏ
+(``created_at, chapter``)::
+
+    FEED = {
+        'FANOUT_LIMIT': 5000,
+        'BATCH_SIZE': 1000,
+        'ASYNC': True,      # False: chạy ngay sau commit trong request (test)
+    }
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Chapter, FeedEntry, Follow, Manga
+from .pagination import NEXT, CursorPage, decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FANOUT_LIMIT': 5000,
+    'BATCH_SIZE': 1000,
+    'ASYNC': True,
+}
+PER_PAGE = 20
+
+_executor = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'FEED', {})}
+
+
+# ==================== GHI ====================
+
+def fan_out(chapter_ids):
+    """Ghi các chapter vào feed của người theo dõi, trả về số dòng đã ghi"""
+    config = get_config()
+    by_manga = {}
+    for chapter in Chapter.objects.filter(id__in=chapter_ids, fanout_on_read=False).values('id', 'manga_id', 'created_at'):
+        by_manga.setdefault(chapter['manga_id'], []).append(chapter)
+
+    written = 0
+    for manga_id, chapters in by_manga.items():
+        followers = Follow.objects.filter(manga_id=manga_id)
+
+        if followers[:config['FANOUT_LIMIT'] + 1].count() > config['FANOUT_LIMIT']:
+            Chapter.objects.filter(id__in=[chapter['id'] for chapter in chapters]).update(fanout_on_read=True)
+            continue
+
+        # Duyệt người theo dõi theo id để mỗi lô là một query có index
+        last_id = 0
+        while True:
+            batch = list(
+                followers.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'user_id')[:config['BATCH_SIZE']]
+            )
+            if not batch:
+                break
+            FeedEntry.objects.bulk_create([
+                FeedEntry(user_id=user_id, manga_id=manga_id, chapter_id=chapter['id'], created_at=chapter['created_at'])
+                for _, user_id in batch
+                for chapter in chapters
+            ], ignore_conflicts=True, batch_size=config['BATCH_SIZE'])
+            written += len(batch) * len(chapters)
+            last_id = batch[-1][0]
+
+    return written
+
+
+def _fan_out_in_thread(chapter_ids):
+    try:
+        fan_out(chapter_ids)
+    except Exception:
+        logger.exception('Không ghi được feed cho chapter %s', chapter_ids)
+    finally:
+        # Luồng nền tự mở kết nối DB riêng, phải đóng lại khi xong
+        connection.close()
+
+
+def schedule_fan_out(chapter_ids):
+    """Ghi feed ở luồng nền sau khi transaction hiện tại commit"""
+    chapter_ids = list(chapter_ids)
+    if not chapter_ids:
+        return
+
+    if not get_config()['ASYNC']:
+        transaction.on_commit(lambda: fan_out(chapter_ids))
+        return
+
+    def submit():
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='feed-fanout')
+        _executor.submit(_fan_out_in_thread, chapter_ids)
+
+    transaction.on_commit(submit)
+
+
+def remove_manga(user_id, manga_id):
+    """Bỏ theo dõi: xóa các chapter của truyện khỏi feed"""
+    FeedEntry.objects.filter(user_id=user_id, manga_id=manga_id).delete()
+
+
+def prune(days):
+    """Xóa các dòng feed cũ hơn ``days`` ngày, trả về số dòng đã xóa"""
+    return FeedEntry.objects.filter(created_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
+
+
+# ==================== ĐỌC ====================
+
+def _columns(chapter, manga):
+    """Các cột chung của hai nhánh UNION (``chapter`` / ``manga``: đường dẫn tới quan hệ)"""
+    return {
+        'chapter_pk': F(f'{chapter}id'),
+        'number': F(f'{chapter}chapter_number'),
+        'chapter_title': F(f'{chapter}title'),
+        'chapter_slug': F(f'{chapter}slug'),
+        'manga_pk': F(f'{manga}id'),
+        'manga_slug': F(f'{manga}slug'),
+        'manga_title': F(f'{manga}title'),
+        'cover_name': F(f'{manga}cover_image'),
+        'cover_width': F(f'{manga}cover_width'),
+        'cover_height': F(f'{manga}cover_height'),
+        'cover_placeholder': F(f'{manga}cover_placeholder'),
+    }
+
+
+def _after(values, created_at, chapter):
+    created, chapter_id = values
+    return Q(**{f'{created_at}__lt': created}) | Q(**{created_at: created, f'{chapter}__lt': chapter_id})
+
+
+def feed_query(user_id, after=None, limit=PER_PAGE + 1):
+    """
+    Queryset UNION ALL: dòng feed đã ghi sẵn + chapter ``fanout_on_read`` của
+    truyện đang theo dõi (đăng sau lúc bắt đầu theo dõi).
+    """
+    written = FeedEntry.objects.filter(user_id=user_id)
+    pulled = Chapter.objects.filter(
+        fanout_on_read=True,
+        manga__followers__user_id=user_id,
+        manga__followers__created_at__lte=F('created_at'),
+    )
+    if after is not None:
+        written = written.filter(_after(after, 'created_at', 'chapter_id'))
+        pulled = pulled.filter(_after(after, 'created_at', 'id'))
+
+    written = written.values(published_at=F('created_at'), **_columns('chapter__', 'chapter__manga__'))
+    pulled = pulled.values(published_at=F('created_at'), **_columns('', 'manga__'))
+
+    if connection.features.supports_slicing_ordering_in_compound:
+        # Mỗi nhánh tự dừng sau ``limit`` dòng theo index
+        written = written.order_by('-published_at', '-chapter_pk')[:limit]
+        pulled = pulled.order_by('-published_at', '-chapter_pk')[:limit]
+    else:
+        written = written.order_by()
+        pulled = pulled.order_by()
+
+    return written.union(pulled, all=True).order_by('-published_at', '-chapter_pk')[:limit]
+
+
+def get_feed_page(user_id, cursor=None, per_page=PER_PAGE):
+    """Một trang feed (mới nhất trước), chỉ có nút sang trang cũ hơn"""
+    data = decode_cursor(cursor)
+    after = None
+    number = 1
+    if data and data.get('d') == NEXT and len(data.get('v', [])) == 2:
+        try:
+            after = (FeedEntry._meta.get_field('created_at').to_python(data['v'][0]), int(data['v'][1]))
+            number = max(1, int(data.get('p', 1)))
+        except Exception:
+            after = None
+            number = 1
+
+    rows = list(feed_query(user_id, after, per_page + 1))
+    has_next = len(rows) > per_page
+    items = rows[:per_page]
+
+    storage = Manga._meta.get_field('cover_image').storage
+    for item in items:
+        item['cover_url'] = storage.url(item['cover_name']) if item['cover_name'] else ''
+
+    next_cursor = None
+    if has_next:
+        last = items[-1]
+        next_cursor = encode_cursor({'v': [last['published_at'], last['chapter_pk']], 'd': NEXT, 'p': number + 1})
+    return CursorPage(items, number, None, has_next, after is not None, next_cursor=next_cursor)
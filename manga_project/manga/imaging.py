@@ -0,0 +1,202 @@
+"""
+Tạo ảnh phái sinh (WebP nhiều kích thước) cho trang truyện.
+
+Ảnh gốc được giữ nguyên; mỗi ChapterImage có thêm các bản WebP theo các độ
+rộng trong IMAGE_VARIANT_WIDTHS để reader dùng ``srcset``. Kết quả lưu trong
+``ChapterImage.variants`` dạng ``{"480": "chapters/variants/..._480.webp"}``.
+
+Cùng lúc đó ghi lại kích thước, dung lượng và một ảnh mờ rất nhỏ (data URI)
+để template đặt sẵn ``width``/``height`` và hiện ảnh mờ trong lúc chờ tải.
+
+``build_variants`` chỉ ghi file (chạy được ở tiến trình con), ``save_results``
+ghi kết quả vào DB cùng tham chiếu tới các file mới (xem manga/storage.py).
+"""
+import base64
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from .storage import add_references, release_files
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = [480, 800, 1200]
+WEBP_QUALITY = 80
+VARIANT_DIR = 'chapters/variants'
+PLACEHOLDER_WIDTH = 16
+PLACEHOLDER_MAX_HEIGHT = 64
+PLACEHOLDER_QUALITY = 30
+FIELDS = ['variants', 'width', 'height', 'file_size', 'placeholder']
+
+_executor = None
+
+
+def get_widths():
+    return getattr(settings, 'IMAGE_VARIANT_WIDTHS', DEFAULT_WIDTHS)
+
+
+def _to_webp(image):
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    return ContentFile(buffer.getvalue())
+
+
+def _open(f):
+    image = Image.open(f)
+    image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+
+def make_placeholder(image):
+    """Ảnh WebP cực nhỏ dạng data URI; trình duyệt tự phóng to thành ảnh mờ"""
+    width, height = image.size
+    target = (
+        min(PLACEHOLDER_WIDTH, width),
+        max(1, min(PLACEHOLDER_MAX_HEIGHT, round(height * PLACEHOLDER_WIDTH / width))),
+    )
+    buffer = BytesIO()
+    image.resize(target, Image.BILINEAR).save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def describe(image, file_size):
+    width, height = image.size
+    return {
+        'width': width,
+        'height': height,
+        'file_size': file_size,
+        'placeholder': make_placeholder(image),
+    }
+
+
+def read_metadata(f):
+    """Kích thước, dung lượng và ảnh mờ của một file ảnh (file-like, ví dụ ảnh vừa upload)"""
+    f.seek(0)
+    image = _open(f)
+    f.seek(0)
+    return describe(image, f.size)
+
+
+def build_variants(name, storage=default_storage, widths=None):
+    """
+    Đọc ảnh gốc ``name`` từ storage, lưu các bản WebP và trả về dict các
+    trường cần cập nhật cho ChapterImage (variants, width, height, ...).
+    Không đụng tới DB: kết quả phải được lưu bằng ``save_results``.
+    """
+    widths = sorted(widths or get_widths())
+    save = getattr(storage, 'save_unreferenced', storage.save)
+    stem = os.path.splitext(os.path.basename(name))[0]
+
+    with storage.open(name, 'rb') as f:
+        image = _open(f)
+
+    original_width, original_height = image.size
+
+    # Không phóng to ảnh: bỏ các độ rộng lớn hơn ảnh gốc, thay bằng bản đúng kích thước gốc
+    targets = [width for width in widths if width < original_width]
+    targets.append(original_width)
+
+    variants = {}
+    for width in targets:
+        if width == original_width:
+            resized = image
+        else:
+            height = max(1, round(original_height * width / original_width))
+            resized = image.resize((width, height), Image.LANCZOS)
+
+        path = save(f'{VARIANT_DIR}/{stem}_{width}.webp', _to_webp(resized))
+        variants[str(width)] = path
+
+    return {'variants': variants, **describe(image, storage.size(name))}
+
+
+def build_metadata(name, storage=default_storage):
+    """Chỉ đo kích thước / tạo ảnh mờ, không tạo lại các bản WebP"""
+    with storage.open(name, 'rb') as f:
+        image = _open(f)
+    return describe(image, storage.size(name))
+
+
+def save_results(results):
+    """
+    Lưu kết quả ``build_variants`` [(ChapterImage, fields)] theo lô. Tham chiếu
+    tới các file WebP được thêm trong cùng transaction với bản ghi; các bản
+    phái sinh cũ (khi tạo lại) trả lại tham chiếu sau commit.
+    """
+    from .models import ChapterImage
+
+    if not results:
+        return
+
+    with transaction.atomic():
+        previous = dict(
+            ChapterImage.objects.select_for_update()
+            .filter(id__in=[chapter_image.id for chapter_image, _ in results])
+            .values_list('id', 'variants')
+        )
+        add_references(name for _, fields in results for name in fields['variants'].values())
+        for chapter_image, fields in results:
+            # File trùng nội dung vừa bị xóa trước khi kịp giữ chỗ: tạo lại
+            storage = chapter_image.image.storage
+            if not all(storage.exists(name) for name in fields['variants'].values()):
+                build_variants(chapter_image.image.name, storage)
+
+        ChapterImage.objects.bulk_update(
+            [ChapterImage(id=chapter_image.id, **fields) for chapter_image, fields in results], FIELDS,
+        )
+        for chapter_image, _ in results:
+            release_files(chapter_image.image.storage, (previous.get(chapter_image.id) or {}).values())
+
+
+def generate_variants(image_ids):
+    """Tạo ảnh phái sinh cho các ChapterImage và lưu vào DB"""
+    from . import manifest
+    from .models import ChapterImage
+
+    results = []
+    for chapter_image in ChapterImage.objects.filter(id__in=image_ids).only('id', 'chapter_id', 'image'):
+        try:
+            fields = build_variants(chapter_image.image.name, chapter_image.image.storage)
+        except Exception:
+            logger.exception('Không tạo được ảnh phái sinh cho ChapterImage %s', chapter_image.id)
+            continue
+        results.append((chapter_image, fields))
+
+    save_results(results)
+    manifest.invalidate({chapter_image.chapter_id for chapter_image, _ in results})
+
+
+def _generate_in_thread(image_ids):
+    try:
+        generate_variants(image_ids)
+    finally:
+        # Luồng nền tự mở kết nối DB riêng, phải đóng lại khi xong
+        connection.close()
+
+
+def schedule_variants(image_ids):
+    """Tạo ảnh phái sinh ở luồng nền sau khi transaction hiện tại commit"""
+    image_ids = list(image_ids)
+    if not image_ids:
+        return
+
+    if not getattr(settings, 'IMAGE_VARIANTS_ASYNC', True):
+        transaction.on_commit(lambda: generate_variants(image_ids))
+        return
+
+    def submit():
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='image-variants')
+        _executor.submit(_generate_in_thread, image_ids)
+
+    transaction.on_commit(submit)
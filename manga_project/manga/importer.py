@@ -0,0 +1,410 @@
+"""
+Nhập hàng loạt truyện/chapter từ một thư mục (``manage.py import_catalog``).
+
+Cấu trúc thư mục:
+
+    <root>/
+        manifest.json
+        one-piece/
+            cover.jpg
+            chapter-001/            <- thư mục chứa ảnh các trang
+                001.jpg
+                002.jpg
+            chapter-002.cbz         <- hoặc một file CBZ/ZIP cho mỗi chapter
+
+manifest.json là danh sách truyện:
+
+    [
+        {
+            "path": "one-piece",
+            "title": "One Piece",
+            "alternative_title": "",
+            "author": "Oda Eiichiro",
+            "categories": ["Hành động", "Phiêu lưu"],
+            "status": "ongoing",
+            "description": "...",
+            "cover": "cover.jpg",
+            "chapters": [{"path": "chapter-001", "number": 1, "title": ""}]
+        }
+    ]
+
+Nếu không khai báo "chapters", các thư mục con và file .cbz/.zip trong thư
+mục truyện được dùng làm chapter, số chapter lấy từ số cuối cùng trong tên.
+
+Tiến độ được ghi vào file trạng thái sau mỗi lô, chạy lại lệnh sẽ bỏ qua
+những gì đã nhập xong. Trước khi ghi một lô vào DB, slug truyện / chapter của
+lô được ghi trước vào trạng thái (``pending``): nếu lệnh bị ngắt sau khi
+transaction đã commit nhưng trước khi kịp lưu trạng thái, lần chạy sau nhận
+lại đúng các dòng đó thay vì tạo bản trùng. Các truyện đã nhập chapter cũng
+được lưu lại để lần chạy sau vẫn cập nhật số liệu, mục lục và feed cho chúng.
+"""
+import json
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files import File
+from django.db import connections, transaction
+
+from . import feed, imaging, search_index, toc
+from .ingest import is_image_name, list_zip_images, natural_key
+from .models import (
+    Author, Category, Chapter, ChapterImage, Follow, Manga, allocate_slugs,
+)
+from .storage import add_references
+
+ARCHIVE_EXTENSIONS = ('.cbz', '.zip')
+NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+
+
+# ==================== XỬ LÝ FILE (CHẠY Ở TIẾN TRÌNH CON) ====================
+
+def _init_worker():
+    # Tiến trình con khởi tạo bằng spawn (Windows/macOS) chưa có Django
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _extension(name):
+    return os.path.splitext(name)[1].lower() or '.jpg'
+
+
+def _saver(storage):
+    # Tiến trình con chỉ ghi file, tham chiếu được thêm trong transaction của tiến trình cha
+    return getattr(storage, 'save_unreferenced', storage.save)
+
+
+def copy_cover(source, name):
+    save = _saver(Manga._meta.get_field('cover_image').storage)
+    with open(source, 'rb') as f:
+        cover = File(f)
+        metadata = imaging.read_metadata(cover)
+        return save(name + _extension(source), cover), metadata
+
+
+def copy_chapter(source, dest_dir):
+    """Chép các trang của một chapter (thư mục hoặc CBZ/ZIP) vào storage"""
+    save = _saver(ChapterImage._meta.get_field('image').storage)
+    names = []
+
+    if os.path.isdir(source):
+        files = sorted((f for f in os.listdir(source) if is_image_name(f)), key=natural_key)
+        for page_number, filename in enumerate(files, start=1):
+            with open(os.path.join(source, filename), 'rb') as f:
+                names.append(save(f'{dest_dir}/p{page_number:03d}{_extension(filename)}', File(f)))
+    else:
+        with zipfile.ZipFile(source) as zip_ref:
+            for page_number, member in enumerate(list_zip_images(zip_ref), start=1):
+                with zip_ref.open(member) as f:
+                    names.append(save(
+                        f'{dest_dir}/p{page_number:03d}{_extension(member)}',
+                        File(f, name=member),
+                    ))
+
+    return names
+
+
+# ==================== ĐỌC MANIFEST ====================
+
+def parse_chapter_number(name):
+    numbers = NUMBER_RE.findall(os.path.splitext(name)[0])
+    return float(numbers[-1]) if numbers else None
+
+
+def discover_chapters(manga_dir):
+    chapters = []
+    for name in os.listdir(manga_dir):
+        path = os.path.join(manga_dir, name)
+        if name.startswith('.'):
+            continue
+        if not (os.path.isdir(path) or name.lower().endswith(ARCHIVE_EXTENSIONS)):
+            continue
+
+        number = parse_chapter_number(name)
+        if number is not None:
+            chapters.append({'path': name, 'number': number, 'title': ''})
+
+    return sorted(chapters, key=lambda chapter: chapter['number'])
+
+
+def load_manifest(root, manifest=None):
+    with open(manifest or os.path.join(root, 'manifest.json'), encoding='utf-8') as f:
+        entries = json.load(f)
+
+    for entry in entries:
+        entry.setdefault('alternative_title', '')
+        entry.setdefault('author', '')
+        entry.setdefault('categories', [])
+        entry.setdefault('status', 'ongoing')
+        entry.setdefault('description', '')
+        if 'chapters' not in entry:
+            entry['chapters'] = discover_chapters(os.path.join(root, entry['path']))
+
+    return entries
+
+
+# ==================== NHẬP DỮ LIỆU ====================
+
+class CatalogImporter:
+    def __init__(self, root, manifest=None, state_file=None, workers=None, batch_size=100, log=print):
+        self.root = root
+        self.manifest = manifest
+        self.state_file = state_file or os.path.join(root, '.import_state.json')
+        self.workers = workers or os.cpu_count() or 2
+        self.batch_size = batch_size
+        self.log = log
+        self.state = self.load_state()
+        # Lưu trong file trạng thái: lần chạy bị ngắt vẫn được cập nhật ở finish của lần sau
+        self.touched = self.state['touched']
+        self.new_chapters = self.state['new_chapters']
+        self.updated = []
+
+    # ---------- trạng thái để chạy tiếp khi bị ngắt ----------
+
+    def load_state(self):
+        if os.path.exists(self.state_file):
+            with open(self.state_file, encoding='utf-8') as f:
+                state = json.load(f)
+        else:
+            state = {}
+        state.setdefault('mangas', {})
+        state.setdefault('pending_mangas', {})
+        for key in ('chapters', 'pending_chapters', 'touched', 'new_chapters'):
+            state[key] = set(state.get(key, []))
+        return state
+
+    def save_state(self):
+        data = {
+            'mangas': self.state['mangas'],
+            'pending_mangas': self.state['pending_mangas'],
+            **{
+                key: sorted(self.state[key])
+                for key in ('chapters', 'pending_chapters', 'touched', 'new_chapters')
+            },
+        }
+        tmp = self.state_file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.state_file)
+
+    # ---------- chạy ----------
+
+    def run(self):
+        entries = load_manifest(self.root, self.manifest)
+
+        # Tiến trình con không được dùng chung kết nối DB với tiến trình cha
+        connections.close_all()
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+            self.pool = pool
+            authors = self.ensure_authors({entry['author'] for entry in entries if entry['author']})
+            categories = self.ensure_categories({name for entry in entries for name in entry['categories']})
+            self.ensure_mangas(entries, authors, categories)
+            self.import_chapters(entries)
+
+        self.finish()
+
+    def ensure_authors(self, names):
+        existing = {}
+        for name, author_id in Author.objects.filter(name__in=names).order_by('id').values_list('name', 'id'):
+            existing.setdefault(name, author_id)
+
+        missing = sorted(names - set(existing))
+        if missing:
+            slugs = allocate_slugs(Author, missing)
+            Author.objects.bulk_create([Author(name=name, slug=slug) for name, slug in zip(missing, slugs)])
+            existing.update(Author.objects.filter(slug__in=slugs).values_list('name', 'id'))
+            self.log(f'Đã tạo {len(missing)} tác giả')
+
+        return existing
+
+    def ensure_categories(self, names):
+        existing = dict(Category.objects.filter(name__in=names).values_list('name', 'id'))
+
+        missing = sorted(names - set(existing))
+        if missing:
+            slugs = allocate_slugs(Category, missing)
+            Category.objects.bulk_create([Category(name=name, slug=slug) for name, slug in zip(missing, slugs)])
+            existing.update(Category.objects.filter(slug__in=slugs).values_list('name', 'id'))
+            self.log(f'Đã tạo {len(missing)} thể loại')
+
+        return existing
+
+    def resume_pending_mangas(self):
+        """Nhận lại các truyện của lô đã commit nhưng chưa kịp lưu trạng thái"""
+        pending = self.state['pending_mangas']
+        if not pending:
+            return
+
+        created = {
+            slug: (manga_id, title)
+            for slug, manga_id, title in Manga.objects.filter(slug__in=[slug for slug, _ in pending.values()])
+            .values_list('slug', 'id', 'title')
+        }
+        for path, (slug, title) in pending.items():
+            if slug in created and created[slug][1] == title:
+                self.state['mangas'][path] = created[slug][0]
+
+        self.state['pending_mangas'] = {}
+        self.save_state()
+
+    def ensure_mangas(self, entries, authors, categories):
+        self.resume_pending_mangas()
+        todo = [entry for entry in entries if entry['path'] not in self.state['mangas']]
+
+        for start in range(0, len(todo), self.batch_size):
+            batch = todo[start:start + self.batch_size]
+            slugs = allocate_slugs(Manga, [entry['title'] for entry in batch])
+
+            # Chép ảnh bìa song song
+            covers = {}
+            for entry, slug in zip(batch, slugs):
+                if entry.get('cover'):
+                    source = os.path.join(self.root, entry['path'], entry['cover'])
+                    covers[slug] = (source, self.pool.submit(copy_cover, source, f'covers/{slug}'))
+
+            mangas = []
+            for entry, slug in zip(batch, slugs):
+                manga = Manga(
+                    title=entry['title'],
+                    slug=slug,
+                    alternative_title=entry['alternative_title'],
+                    author_id=authors.get(entry['author']),
+                    description=entry['description'],
+                    status=entry['status'],
+                )
+                if slug in covers:
+                    manga.cover_image, metadata = covers[slug][1].result()
+                    manga.set_cover_metadata(metadata)
+                mangas.append(manga)
+
+            self.state['pending_mangas'] = {
+                entry['path']: [slug, entry['title']] for entry, slug in zip(batch, slugs)
+            }
+            self.save_state()
+
+            with transaction.atomic():
+                add_references(manga.cover_image.name for manga in mangas)
+                for manga in mangas:
+                    # File trùng nội dung bị xóa trước khi kịp giữ chỗ: chép lại
+                    if manga.cover_image and not manga.cover_image.storage.exists(manga.cover_image.name):
+                        copy_cover(covers[manga.slug][0], f'covers/{manga.slug}')
+                Manga.objects.bulk_create(mangas)
+                ids = dict(Manga.objects.filter(slug__in=slugs).values_list('slug', 'id'))
+
+                Through = Manga.categories.through
+                Through.objects.bulk_create([
+                    Through(manga_id=ids[slug], category_id=categories[name])
+                    for entry, slug in zip(batch, slugs)
+                    for name in entry['categories']
+                ])
+
+            for entry, slug in zip(batch, slugs):
+                self.state['mangas'][entry['path']] = ids[slug]
+            self.state['pending_mangas'] = {}
+            self.save_state()
+            self.log(f'Đã tạo {start + len(batch)}/{len(todo)} truyện')
+
+    def import_chapters(self, entries):
+        manga_ids = {entry['path']: self.state['mangas'][entry['path']] for entry in entries}
+        manga_slugs = dict(Manga.objects.filter(id__in=manga_ids.values()).values_list('id', 'slug'))
+
+        todo = []
+        for entry in entries:
+            for chapter in entry['chapters']:
+                key = f"{entry['path']}/{chapter['path']}"
+                if key not in self.state['chapters']:
+                    todo.append((key, manga_ids[entry['path']], entry['path'], chapter))
+
+        for start in range(0, len(todo), self.batch_size):
+            self.import_chapter_batch(todo[start:start + self.batch_size], manga_slugs)
+            self.log(f'Đã nhập {min(start + self.batch_size, len(todo))}/{len(todo)} chapter')
+
+    def import_chapter_batch(self, batch, manga_slugs):
+        # Chapter đã có trong DB (ví dụ lần trước dừng sau khi commit) thì bỏ qua
+        existing = {
+            (manga_id, number): chapter_id
+            for chapter_id, manga_id, number in Chapter.objects.filter(
+                manga_id__in={manga_id for _, manga_id, _, _ in batch}
+            ).values_list('id', 'manga_id', 'chapter_number')
+        }
+
+        jobs = []
+        sources = {}
+        for key, manga_id, manga_path, chapter in batch:
+            number = float(chapter['number'])
+            if (manga_id, number) in existing:
+                # Do lần chạy bị ngắt tạo ra: vẫn phải cập nhật số liệu và feed
+                if key in self.state['pending_chapters']:
+                    self.touched.add(manga_id)
+                    self.new_chapters.add(existing[(manga_id, number)])
+                self.state['chapters'].add(key)
+                continue
+
+            source = os.path.join(self.root, manga_path, chapter['path'])
+            dest_dir = f"chapters/{manga_slugs[manga_id]}/{number:g}".replace('.', '-')
+            sources[key] = (source, dest_dir)
+            jobs.append((key, manga_id, number, chapter, self.pool.submit(copy_chapter, source, dest_dir)))
+
+        if jobs:
+            pages = {key: future.result() for key, _, _, _, future in jobs}
+            storage = ChapterImage._meta.get_field('image').storage
+
+            self.state['pending_chapters'] |= {key for key, _, _, _, _ in jobs}
+            self.save_state()
+
+            with transaction.atomic():
+                add_references(name for names in pages.values() for name in names)
+                for key, names in pages.items():
+                    if not all(storage.exists(name) for name in names):
+                        copy_chapter(*sources[key])
+
+                Chapter.objects.bulk_create([
+                    Chapter(
+                        manga_id=manga_id,
+                        chapter_number=number,
+                        title=chapter.get('title', ''),
+                        slug=Chapter.build_slug(manga_slugs[manga_id], number),
+                    )
+                    for key, manga_id, number, chapter, _ in jobs
+                ])
+
+                chapter_ids = {
+                    (manga_id, number): chapter_id
+                    for chapter_id, manga_id, number in Chapter.objects.filter(
+                        manga_id__in={manga_id for _, manga_id, _, _, _ in jobs}
+                    ).values_list('id', 'manga_id', 'chapter_number')
+                }
+
+                ChapterImage.objects.bulk_create([
+                    ChapterImage(chapter_id=chapter_ids[(manga_id, number)], image=name, page_number=page_number)
+                    for key, manga_id, number, _, _ in jobs
+                    for page_number, name in enumerate(pages[key], start=1)
+                ], batch_size=1000)
+
+            for key, manga_id, number, _, _ in jobs:
+                self.state['chapters'].add(key)
+                self.touched.add(manga_id)
+                self.new_chapters.add(chapter_ids[(manga_id, number)])
+
+        self.state['pending_chapters'] -= {key for key, _, _, _ in batch}
+        self.save_state()
+
+    def finish(self):
+        # bulk_create không gửi signal: tự cập nhật các dữ liệu phụ thuộc
+        touched = self.updated = sorted(self.touched)
+        for start in range(0, len(touched), 500):
+            Manga.refresh_chapter_stats_bulk(touched[start:start + 500])
+        follow_ids = list(Follow.objects.filter(manga_id__in=touched).values_list('id', flat=True))
+        for start in range(0, len(follow_ids), 500):
+            Follow.reconcile_unread(follow_ids[start:start + 500])
+        for manga_id in touched:
+            toc.invalidate(manga_id)
+        search_index.invalidate()
+        feed.schedule_fan_out(sorted(self.new_chapters))
+
+        self.touched.clear()
+        self.new_chapters.clear()
+        self.save_state()
@@ -0,0 +1,197 @@
+"""
+Nạp ảnh cho chapter (dùng chung cho CRUD và admin).
+
+Ảnh được đọc thẳng từ file upload (ZIP hoặc từng ảnh), ghi xuống storage bằng
+một thread pool giới hạn, rồi tạo toàn bộ ChapterImage bằng một câu
+``bulk_create`` trong một transaction. Tham chiếu tới file (manga/storage.py)
+được thêm trong chính transaction đó, các luồng ghi file không đụng tới DB.
+Nếu có lỗi, các file đã ghi sẽ bị xóa.
+"""
+import logging
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Max
+
+from . import imaging, manifest
+from .models import ChapterImage
+from .storage import add_references
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp', '.bmp')
+DEFAULT_WORKERS = 8
+
+
+class IngestReport:
+    """Kết quả nạp ảnh: số trang, thời gian tổng và thời gian từng trang"""
+
+    def __init__(self):
+        self.pages = 0
+        self.elapsed = 0.0
+        self.timings = []  # (page_number, tên file gốc, số giây)
+        self.files = []    # tên các file đã ghi vào storage
+
+    @property
+    def slowest(self):
+        return max(self.timings, key=lambda timing: timing[2], default=None)
+
+    def __str__(self):
+        return f'{self.pages} trang trong {self.elapsed:.2f}s'
+
+    def discard(self):
+        """Xóa các file đã ghi (khi transaction bên ngoài bị rollback)"""
+        _discard_files(ChapterImage._meta.get_field('image').storage, self.files)
+        self.files = []
+
+
+def _discard_files(storage, names):
+    # Tham chiếu đã rollback cùng transaction: chỉ xóa file không còn ai dùng
+    discard = getattr(storage, 'discard', storage.delete)
+    for name in names:
+        discard(name)
+
+
+def is_image_name(name):
+    basename = os.path.basename(name)
+    return (
+        name.lower().endswith(IMAGE_EXTENSIONS)
+        and not name.startswith('__MACOSX')
+        and not basename.startswith('.')
+    )
+
+
+def natural_key(name):
+    """Khóa sắp xếp tự nhiên: p2.jpg đứng trước p10.jpg"""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def list_zip_images(zip_ref):
+    """Tên các file ảnh trong ZIP, sắp xếp tự nhiên theo tên"""
+    return sorted(
+        (info.filename for info in zip_ref.infolist()
+         if not info.is_dir() and is_image_name(info.filename)),
+        key=natural_key,
+    )
+
+
+def _page_filename(chapter, page_number, original_name):
+    ext = os.path.splitext(original_name)[1].lower() or '.jpg'
+    # Không để dấu chấm trong tên (1.5 -> 1-5), tránh lẫn với phần mở rộng
+    number = f'{chapter.chapter_number:g}'.replace('.', '-')
+    return f"ch{number}_p{page_number:03d}{ext}"
+
+
+def ingest_pages(chapter, pages, start_page=None, max_workers=None):
+    """
+    Ghi các trang và tạo ChapterImage.
+
+    ``pages`` là danh sách ``(tên gốc, hàm mở file)``; hàm mở file trả về
+    file-like để storage đọc dần theo chunk, không nạp cả ảnh vào bộ nhớ.
+    """
+    report = IngestReport()
+    if not pages:
+        return report
+
+    started = time.perf_counter()
+    storage = ChapterImage._meta.get_field('image').storage
+    save = getattr(storage, 'save_unreferenced', storage.save)
+    upload_to = ChapterImage._meta.get_field('image').upload_to
+    max_workers = max_workers or getattr(settings, 'INGEST_WORKERS', DEFAULT_WORKERS)
+
+    if start_page is None:
+        last_page = chapter.images.aggregate(last=Max('page_number'))['last'] or 0
+        start_page = last_page + 1
+
+    def store(job):
+        page_number, original_name, opener = job
+        page_started = time.perf_counter()
+        with opener() as source:
+            name = save(
+                os.path.join(upload_to, _page_filename(chapter, page_number, original_name)),
+                File(source, name=original_name),
+            )
+        return page_number, name, original_name, time.perf_counter() - page_started
+
+    jobs = [
+        (page_number, original_name, opener)
+        for page_number, (original_name, opener) in enumerate(pages, start=start_page)
+    ]
+
+    jobs_by_page = {job[0]: job for job in jobs}
+    saved = []
+    errors = []
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest') as pool:
+        futures = [pool.submit(store, job) for job in jobs]
+
+    for future in futures:
+        try:
+            page_number, name, original_name, seconds = future.result()
+        except Exception as e:
+            errors.append(e)
+            continue
+        saved.append((page_number, name))
+        report.timings.append((page_number, original_name, seconds))
+
+    try:
+        if errors:
+            raise errors[0]
+
+        with transaction.atomic():
+            add_references(name for _, name in saved)
+            # File trùng nội dung vừa bị xóa cùng lúc (trước khi kịp giữ chỗ): ghi lại
+            for page_number, name in saved:
+                if not storage.exists(name):
+                    store(jobs_by_page[page_number])
+
+            ChapterImage.objects.bulk_create([
+                ChapterImage(chapter=chapter, image=name, page_number=page_number)
+                for page_number, name in saved
+            ])
+    except Exception:
+        # Dọn các file đã ghi để không để lại ảnh mồ côi
+        _discard_files(storage, [name for _, name in saved])
+        raise
+
+    # bulk_create không gửi signal: tự làm mới manifest và lên lịch tạo ảnh WebP
+    manifest.invalidate([chapter.id])
+    imaging.schedule_variants(
+        ChapterImage.objects.filter(chapter=chapter, page_number__in=[page for page, _ in saved])
+        .values_list('id', flat=True)
+    )
+
+    report.pages = len(saved)
+    report.files = [name for _, name in saved]
+    report.elapsed = time.perf_counter() - started
+    logger.info('Chapter %s: nạp %s (chậm nhất: %s)', chapter.pk, report, report.slowest)
+    return report
+
+
+def ingest_zip(chapter, zip_file, start_page=None, max_workers=None):
+    """Nạp ảnh từ file ZIP (UploadedFile, đường dẫn hoặc file-like) mà không giải nén ra đĩa"""
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        def opener(name):
+            def open_member():
+                return zip_ref.open(name)
+            return open_member
+
+        pages = [(name, opener(name)) for name in list_zip_images(zip_ref)]
+        return ingest_pages(chapter, pages, start_page=start_page, max_workers=max_workers)
+
+
+def ingest_files(chapter, files, start_page=None, max_workers=None):
+    """Nạp các ảnh upload riêng lẻ, giữ nguyên thứ tự upload"""
+    def opener(uploaded):
+        def open_upload():
+            uploaded.seek(0)
+            return uploaded
+        return open_upload
+
+    pages = [(uploaded.name, opener(uploaded)) for uploaded in files]
+    return ingest_pages(chapter, pages, start_page=start_page, max_workers=max_workers)
@@ -0,0 +1,298 @@
+"""
+Đo số query, thời gian SQL / template / Python và bộ nhớ của từng request.
+
+- ``profile()``: context manager đo một đoạn code (shell, test, lệnh quản lý).
+- ``RequestProfileMiddleware``: đo mỗi request, trả header ``Server-Timing``
+  (xem ở tab Network của trình duyệt) và ghi một dòng log
+  ``manga.instrumentation``.
+- ``assert_query_budget(view, n)``: dùng trong test, báo lỗi khi một trang
+  vượt quá ``n`` query (bắt lỗi N+1 trong template).
+
+Query được bắt bằng execute wrapper gắn vào mọi kết nối DB, phiên đo hiện tại
+nằm trong ContextVar nên query chạy ở luồng khác của cùng request (view async,
+manga/async_views.py) vẫn được tính. Thời gian template đo ở
+``Template.render`` ngoài cùng (không tính trùng các template include).
+
+Cấu hình trong settings:
+
+    INSTRUMENTATION = {
+        'ENABLED': True,
+        'SERVER_TIMING': DEBUG,      # header Server-Timing
+        'LOG': True,                 # một dòng log cho mỗi request
+        'TRACE_MEMORY': False,       # đỉnh bộ nhớ bằng tracemalloc (chậm, chỉ bật khi cần)
+        'SIMILAR_QUERY_THRESHOLD': 5,  # số query cùng câu SQL (khác tham số) coi là N+1
+    }
+"""
+import logging
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Template
+from django.urls import reverse
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SERVER_TIMING': False,
+    'LOG': True,
+    'TRACE_MEMORY': False,
+    'SIMILAR_QUERY_THRESHOLD': 5,
+}
+
+# Các phiên đo đang mở (lồng nhau được, ví dụ assert_query_budget bao ngoài middleware)
+_current = ContextVar('request_profiles', default=())
+_install_lock = threading.Lock()
+_installed = False
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'INSTRUMENTATION', {})}
+
+
+class RequestProfile:
+    """Kết quả đo của một request / một đoạn code"""
+
+    def __init__(self):
+        self.queries = []  # (sql, params, giây)
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self.peak_memory = None
+        self._template_depth = 0
+        self._lock = threading.Lock()
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def sql_time(self):
+        return sum(duration for _, _, duration in self.queries)
+
+    @property
+    def python_time(self):
+        return max(self.total_time - self.sql_time - self.template_time, 0.0)
+
+    @property
+    def duplicates(self):
+        """Các query giống hệt nhau (cả tham số) chạy nhiều lần: {(sql, params): số lần}"""
+        counts = Counter((sql, repr(params)) for sql, params, _ in self.queries)
+        return {key: count for key, count in counts.items() if count > 1}
+
+    @property
+    def similar(self):
+        """Cùng câu SQL, khác tham số: dấu hiệu N+1. {sql: số lần}, nhiều nhất trước"""
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return {sql: count for sql, count in counts.most_common() if count > 1}
+
+    def as_dict(self):
+        return {
+            'queries': self.query_count,
+            'duplicate_queries': sum(count - 1 for count in self.duplicates.values()),
+            'sql_ms': round(self.sql_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'python_ms': round(self.python_time * 1000, 2),
+            'total_ms': round(self.total_time * 1000, 2),
+            'peak_memory_kb': round(self.peak_memory / 1024) if self.peak_memory is not None else None,
+        }
+
+    def server_timing(self):
+        data = self.as_dict()
+        parts = [
+            f'db;dur={data["sql_ms"]};desc="{data["queries"]} queries"',
+            f'tpl;dur={data["template_ms"]}',
+            f'app;dur={data["python_ms"]}',
+            f'total;dur={data["total_ms"]}',
+        ]
+        return ', '.join(parts)
+
+    def report(self):
+        """Danh sách query dạng text, dùng trong thông báo lỗi của test"""
+        lines = [f'{index}. {sql}' for index, (sql, _, _) in enumerate(self.queries, 1)]
+        for sql, count in self.similar.items():
+            lines.append(f'  lặp {count} lần: {sql}')
+        return '\n'.join(lines)
+
+
+# ==================== HOOK ====================
+def _record_query(execute, sql, params, many, context):
+    profiles = _current.get()
+    if not profiles:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        for profile in profiles:
+            with profile._lock:
+                profile.queries.append((sql, params, duration))
+
+
+def _attach(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+_original_render = Template.render
+
+
+def _timed_render(self, context):
+    profiles = _current.get()
+    if not profiles:
+        return _original_render(self, context)
+
+    # Template include lồng nhau: chỉ tính lần render ngoài cùng
+    for profile in profiles:
+        profile._template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        duration = time.perf_counter() - started
+        for profile in profiles:
+            profile._template_depth -= 1
+            if not profile._template_depth:
+                profile.template_time += duration
+
+
+def install():
+    """Gắn hook vào mọi kết nối DB (kể cả kết nối tạo sau này) và Template.render"""
+    global _installed
+
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        connection_created.connect(_attach, dispatch_uid='manga.instrumentation')
+        for connection in connections.all(initialized_only=True):
+            _attach(connection)
+        Template.render = _timed_render
+        _installed = True
+
+
+@contextmanager
+def profile(trace_memory=None):
+    """Đo query / thời gian của đoạn code bên trong: ``with profile() as p: ...``"""
+    install()
+    if trace_memory is None:
+        trace_memory = get_config()['TRACE_MEMORY']
+
+    result = RequestProfile()
+    token = _current.set(_current.get() + (result,))
+
+    started_tracing = False
+    if trace_memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    try:
+        yield result
+    finally:
+        result.total_time = time.perf_counter() - started
+        if trace_memory:
+            result.peak_memory = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+            if started_tracing:
+                tracemalloc.stop()
+        _current.reset(token)
+
+
+# ==================== MIDDLEWARE ====================
+class RequestProfileMiddleware:
+    """
+    Đặt đầu danh sách MIDDLEWARE để đo cả thời gian của các middleware khác.
+    Chạy được cả qua WSGI và ASGI (query ở các luồng của sync_to_async vẫn
+    được tính vì profile nằm trong contextvar).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.config = config
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        with profile(self.config['TRACE_MEMORY']) as result:
+            response = self.get_response(request)
+        return self.finish(request, response, result)
+
+    async def __acall__(self, request):
+        with profile(self.config['TRACE_MEMORY']) as result:
+            response = await self.get_response(request)
+        return self.finish(request, response, result)
+
+    def finish(self, request, response, result):
+        if self.config['SERVER_TIMING']:
+            response['Server-Timing'] = result.server_timing()
+        if self.config['LOG']:
+            self.log(request, response, result)
+        return response
+
+    def log(self, request, response, result):
+        match = getattr(request, 'resolver_match', None)
+        data = {
+            'view': match.view_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **result.as_dict(),
+        }
+        message = ' '.join(f'{key}={value}' for key, value in data.items())
+
+        threshold = self.config['SIMILAR_QUERY_THRESHOLD']
+        repeated = {sql: count for sql, count in result.similar.items() if count >= threshold}
+        if repeated:
+            sql, count = next(iter(repeated.items()))
+            logger.warning('%s n_plus_one=%d sql=%r', message, count, sql[:200], extra={'profile': data})
+        else:
+            logger.info(message, extra={'profile': data})
+
+
+# ==================== TEST ====================
+def assert_query_budget(view, n, args=None, kwargs=None, client=None, data=None):
+    """
+    Gọi một trang qua test client và báo lỗi nếu vượt quá ``n`` query.
+
+    ``view`` là URL hoặc hàm view (được reverse với ``args`` / ``kwargs``).
+    Trả về (response, profile) để kiểm tra thêm.
+    """
+    from django.test import Client
+
+    url = view if isinstance(view, str) else reverse(view, args=args, kwargs=kwargs)
+    client = client or Client()
+
+    with profile(trace_memory=False) as result:
+        response = client.get(url, data)
+
+    if response.status_code >= 400:
+        raise AssertionError(f'{url} trả về {response.status_code}')
+    if result.query_count > n:
+        raise AssertionError(
+            f'{url} chạy {result.query_count} query, vượt ngân sách {n}:\n{result.report()}'
+        )
+    return response, result
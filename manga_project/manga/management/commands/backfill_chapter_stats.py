@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from manga.models import Manga
+
+
+class Command(BaseCommand):
+    help = 'Tính lại latest_chapter_* và chapter_count cho tất cả truyện'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        manga_ids = list(Manga.objects.order_by('id').values_list('id', flat=True))
+
+        for start in range(0, len(manga_ids), batch_size):
+            batch = manga_ids[start:start + batch_size]
+            Manga.refresh_chapter_stats_bulk(batch)
+            self.stdout.write(f'Đã xử lý {min(start + batch_size, len(manga_ids))}/{len(manga_ids)} truyện')
+
+        self.stdout.write(self.style.SUCCESS('Hoàn tất!'))
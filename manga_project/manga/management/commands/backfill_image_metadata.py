@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from manga import imaging, manifest
+from manga.models import ChapterImage, Manga
+
+FIELDS = ['width', 'height', 'file_size', 'placeholder']
+COVER_FIELDS = ['cover_width', 'cover_height', 'cover_size', 'cover_placeholder']
+
+
+def _init_worker():
+    # Tiến trình con khởi tạo bằng spawn (Windows/macOS) chưa có Django
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _describe(key, name):
+    try:
+        return key, imaging.build_metadata(name), None
+    except Exception as e:
+        return key, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Ghi kích thước, dung lượng và ảnh mờ cho trang truyện và ảnh bìa còn thiếu'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Tính lại cả ảnh đã có thông tin')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = ChapterImage.objects.order_by('id')
+        mangas = Manga.objects.exclude(cover_image='').order_by('id')
+        if not options['force']:
+            images = images.filter(width__isnull=True)
+            mangas = mangas.filter(cover_width__isnull=True)
+
+        todo = [(('image', pk), name) for pk, name in images.values_list('id', 'image')]
+        todo += [(('manga', pk), name) for pk, name in mangas.values_list('id', 'cover_image')]
+        total = len(todo)
+        self.stdout.write(f'Cần xử lý {total} ảnh với {options["workers"]} tiến trình')
+
+        # Không để tiến trình con kế thừa kết nối DB đang mở
+        connections.close_all()
+
+        done = failed = 0
+        pending = {'image': [], 'manga': []}
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_describe, key, name) for key, name in todo]
+
+            for future in as_completed(futures):
+                (kind, pk), metadata, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Lỗi ảnh {kind} {pk}: {error}')
+                    continue
+
+                if kind == 'image':
+                    pending['image'].append(ChapterImage(id=pk, **metadata))
+                else:
+                    manga = Manga(id=pk)
+                    manga.set_cover_metadata(metadata)
+                    pending['manga'].append(manga)
+                done += 1
+
+                if done % options['batch_size'] == 0:
+                    self.flush(pending)
+                    self.stdout.write(f'Đã xử lý {done}/{total} ảnh')
+
+        self.flush(pending)
+        # bulk_update không gửi signal: tự làm mới toàn bộ manifest
+        manifest.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Hoàn tất: {done} ảnh, {failed} lỗi'))
+
+    def flush(self, pending):
+        if pending['image']:
+            ChapterImage.objects.bulk_update(pending['image'], FIELDS)
+        if pending['manga']:
+            Manga.objects.bulk_update(pending['manga'], COVER_FIELDS)
+        pending['image'] = []
+        pending['manga'] = []
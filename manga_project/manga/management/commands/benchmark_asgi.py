@@ -0,0 +1,117 @@
+import asyncio
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from manga.benchmark import summarize
+from manga.models import Chapter, Manga
+
+ASGI_URLCONF = 'manga_project.asgi_urls'
+
+
+class Command(BaseCommand):
+    help = (
+        'So sánh thông lượng view sync (WSGI, luồng) với view async (ASGI) cho trang chủ, '
+        'trang truyện và trang đọc, với nhiều người đọc cùng lúc (chạy trong tiến trình, không qua mạng)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Số request cho mỗi chế độ')
+        parser.add_argument('--concurrency', type=int, default=16, help='Số người đọc cùng lúc')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help='URL cần đo, có thể lặp lại (mặc định: trang chủ, một truyện, một chapter)',
+        )
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or self.default_paths()
+        total = options['requests']
+        concurrency = options['concurrency']
+
+        self.stdout.write(f'{total} request / chế độ, {concurrency} người đọc cùng lúc:')
+        for path in paths:
+            self.stdout.write(f'  {path}')
+
+        # Làm nóng cache (mục lục, manifest, bảng xếp hạng) trước khi đo
+        warm = Client()
+        for path in paths:
+            warm.get(path)
+
+        results = {
+            'sync (WSGI)': self.run_sync(paths, total, concurrency),
+            'async (ASGI)': self.run_async(paths, total, concurrency),
+        }
+
+        self.stdout.write(f'\n{"Chế độ":<14}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}{"lỗi":>7}')
+        for mode, result in results.items():
+            self.stdout.write(
+                f'{mode:<14}{result["throughput"]:>10.1f}{result["p50"]:>10.1f}'
+                f'{result["p95"]:>10.1f}{result["errors"]:>7}'
+            )
+
+    def default_paths(self):
+        chapter = Chapter.objects.select_related('manga').order_by('-manga__views', 'chapter_number').first()
+        if chapter is None:
+            raise CommandError('Chưa có dữ liệu truyện để đo (chạy seed hoặc import trước)')
+        manga = Manga.objects.order_by('-views').first()
+        return ['/', f'/manga/{manga.slug}/', f'/manga/{chapter.manga.slug}/{chapter.slug}/']
+
+    def run_sync(self, paths, total, concurrency):
+        """Mỗi người đọc là một luồng dùng Client riêng (giống worker WSGI nhiều luồng)"""
+        latencies = []
+        errors = [0]
+        counter = iter(range(total))
+        lock = threading.Lock()
+
+        def reader():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        index = next(counter, None)
+                    if index is None:
+                        return
+                    started = time.perf_counter()
+                    response = client.get(paths[index % len(paths)])
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        latencies.append(elapsed)
+                        errors[0] += response.status_code != 200
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=reader) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return summarize(latencies, time.perf_counter() - started, errors[0])
+
+    def run_async(self, paths, total, concurrency):
+        """Mỗi người đọc là một coroutine dùng AsyncClient, cùng chung một event loop"""
+        latencies = []
+        errors = 0
+        counter = iter(range(total))
+
+        async def reader():
+            nonlocal errors
+            client = AsyncClient()
+            for index in counter:
+                started = time.perf_counter()
+                response = await client.get(paths[index % len(paths)])
+                latencies.append(time.perf_counter() - started)
+                errors += response.status_code != 200
+
+        async def run():
+            await asyncio.gather(*(reader() for _ in range(concurrency)))
+
+        with override_settings(ROOT_URLCONF=ASGI_URLCONF):
+            started = time.perf_counter()
+            asyncio.run(run())
+            elapsed = time.perf_counter() - started
+        connections.close_all()
+        return summarize(latencies, elapsed, errors)
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from manga import imaging, manifest
+from manga.models import ChapterImage
+
+
+def _init_worker():
+    # Tiến trình con khởi tạo bằng spawn (Windows/macOS) chưa có Django
+    if not django.apps.apps.ready:
+        django.setup()
+
+
+def _build(image_id, name):
+    # Chỉ xử lý file, không đụng DB: tiến trình cha ghi kết quả theo lô
+    try:
+        return image_id, imaging.build_variants(name), None
+    except Exception as e:
+        return image_id, None, str(e)
+
+
+class Command(BaseCommand):
+    help = 'Tạo ảnh WebP nhiều kích thước cho các trang truyện chưa có'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Tạo lại cả ảnh đã có bản phái sinh')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        images = ChapterImage.objects.order_by('id')
+        if not options['force']:
+            images = images.filter(variants={})
+
+        todo = list(images.values_list('id', 'image'))
+        names = dict(todo)
+        total = len(todo)
+        self.stdout.write(f'Cần xử lý {total} ảnh với {options["workers"]} tiến trình')
+
+        # Không để tiến trình con kế thừa kết nối DB đang mở
+        connections.close_all()
+
+        done = failed = 0
+        pending = []
+
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            futures = [pool.submit(_build, image_id, name) for image_id, name in todo]
+
+            for future in as_completed(futures):
+                image_id, fields, error = future.result()
+                if error:
+                    failed += 1
+                    self.stderr.write(f'Lỗi ảnh {image_id}: {error}')
+                    continue
+
+                pending.append((ChapterImage(id=image_id, image=names[image_id]), fields))
+                done += 1
+
+                if len(pending) >= options['batch_size']:
+                    imaging.save_results(pending)
+                    pending = []
+                    self.stdout.write(f'Đã xử lý {done}/{total} ảnh')
+
+        imaging.save_results(pending)
+
+        # bulk_update không gửi signal: tự làm mới toàn bộ manifest
+        manifest.invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Hoàn tất: {done} ảnh, {failed} lỗi'))
@@ -0,0 +1,30 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from manga import recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        'Tính truyện tương tự (đọc chung + thể loại) và lưu vào bảng SimilarManga. '
+        'Mặc định chỉ tính lại truyện có thay đổi từ lần chạy trước'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Tính lại toàn bộ truyện')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=200, help='Số truyện mỗi lô gửi cho tiến trình con')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        done = recommendations.build(
+            full=options['full'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Hoàn tất! Đã tính lại {done} truyện trong {time.perf_counter() - started:.1f}s'
+        ))
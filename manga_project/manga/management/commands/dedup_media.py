@@ -0,0 +1,135 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from manga import manifest
+from manga.storage import (
+    REFERENCES, ContentAddressedStorage, file_hash, hashed_name, is_hashed_name, rebuild_references,
+)
+
+
+class Command(BaseCommand):
+    help = 'Chuyển file media sang dạng lưu theo nội dung, gộp các file trùng nhau'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Chỉ thống kê, không thay đổi gì')
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help='Xóa cả file không còn bản ghi nào tham chiếu')
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('Cần đặt STORAGES["default"] là manga.storage.ContentAddressedStorage')
+
+        self.storage = default_storage
+        self.dry_run = options['dry_run']
+
+        rows = self.collect_references()
+        names = {name for _, _, _, row_names in rows for name in row_names}
+        legacy = sorted(name for name in names if not is_hashed_name(name))
+        self.stdout.write(f'{len(names)} file được tham chiếu, {len(legacy)} file cần chuyển')
+
+        renames = self.hash_files(legacy, options['workers'])
+
+        if not self.dry_run:
+            self.update_references(rows, renames, options['batch_size'])
+            # Đếm lại tham chiếu theo tên mới: file cũ không còn ai dùng nên bị xóa ngay dưới đây
+            rebuild_references(options['batch_size'])
+            self.stdout.write('Đã đếm lại tham chiếu của các file')
+            manifest.invalidate_all()
+            for old_name in renames:
+                self.storage.delete(old_name)
+
+        if options['delete_orphans']:
+            self.delete_orphans(names | set(renames.values()))
+
+        self.stdout.write(self.style.SUCCESS('Hoàn tất!' if not self.dry_run else 'Chạy thử xong, chưa thay đổi gì'))
+
+    def collect_references(self):
+        """[(model, pk, trường, [tên file])] cho mọi bản ghi có file"""
+        rows = []
+        for model_label, field_name in REFERENCES:
+            model = apps.get_model(model_label)
+            is_json = model._meta.get_field(field_name).get_internal_type() == 'JSONField'
+
+            for pk, value in model._default_manager.values_list('pk', field_name).iterator():
+                if is_json:
+                    row_names = [name for name in (value or {}).values() if name]
+                else:
+                    row_names = [value] if value else []
+                if row_names:
+                    rows.append((model, pk, field_name, row_names))
+        return rows
+
+    def hash_files(self, names, workers):
+        """Băm nội dung các file cũ, trả về {tên cũ: tên mới}"""
+        def process(name):
+            if not self.storage.exists(name):
+                return name, None, 0
+            size = self.storage.size(name)
+            with self.storage.open(name, 'rb') as f:
+                if self.dry_run:
+                    return name, hashed_name(name, file_hash(File(f))), size
+                return name, self.storage.save(name, File(f)), size
+
+        renames = {}
+        sizes = {}
+        missing = total = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for done, (name, new_name, size) in enumerate(pool.map(process, names), start=1):
+                if new_name is None:
+                    missing += 1
+                    continue
+                renames[name] = new_name
+                sizes.setdefault(new_name, size)
+                total += size
+                if done % 500 == 0:
+                    self.stdout.write(f'Đã băm {done}/{len(names)} file')
+
+        self.stdout.write(f'{len(renames) - len(sizes)} file trùng nội dung, {missing} file không tồn tại trên đĩa')
+        self.stdout.write(f'Dung lượng: {total / 1024 / 1024:.1f} MB -> {sum(sizes.values()) / 1024 / 1024:.1f} MB')
+        return renames
+
+    def update_references(self, rows, renames, batch_size):
+        changed = {}
+        for model, pk, field_name, row_names in rows:
+            if any(name in renames for name in row_names):
+                changed.setdefault((model, field_name), []).append(pk)
+
+        for (model, field_name), pks in changed.items():
+            for start in range(0, len(pks), batch_size):
+                objs = list(model._default_manager.filter(pk__in=pks[start:start + batch_size]).only('pk', field_name))
+                for obj in objs:
+                    value = getattr(obj, field_name)
+                    if isinstance(value, dict):
+                        # variants: {độ rộng: tên file}
+                        value = {key: renames.get(name, name) for key, name in value.items()}
+                    else:
+                        value = renames.get(value.name, value.name)
+                    setattr(obj, field_name, value)
+
+                with transaction.atomic():
+                    model._default_manager.bulk_update(objs, [field_name])
+
+            self.stdout.write(f'Đã cập nhật {len(pks)} {model._meta.verbose_name} ({field_name})')
+
+    def delete_orphans(self, referenced):
+        namespaces = {name.split('/')[0] for name in referenced if '/' in name}
+        orphans = []
+        for namespace in sorted(namespaces):
+            for dirpath, _, filenames in os.walk(self.storage.path(namespace)):
+                for filename in filenames:
+                    name = os.path.relpath(os.path.join(dirpath, filename), self.storage.location).replace('\\', '/')
+                    if name not in referenced:
+                        orphans.append(name)
+
+        self.stdout.write(f'{len(orphans)} file không còn được tham chiếu')
+        if not self.dry_run:
+            for name in orphans:
+                self.storage.delete(name)
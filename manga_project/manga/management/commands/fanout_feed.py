@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from manga import feed
+from manga.models import Chapter
+
+
+class Command(BaseCommand):
+    help = (
+        'Ghi chapter vào feed của người theo dõi (cho chapter tạo bằng lệnh hàng loạt không qua signal) '
+        'và xóa các dòng feed cũ'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=0, help='Ghi feed cho chapter đăng trong N ngày gần nhất')
+        parser.add_argument('--prune', type=int, metavar='DAYS', help='Xóa dòng feed cũ hơn DAYS ngày')
+        parser.add_argument('--batch-size', type=int, default=500, help='Số chapter mỗi lượt ghi')
+
+    def handle(self, *args, **options):
+        if options['days']:
+            since = timezone.now() - timedelta(days=options['days'])
+            chapter_ids = list(
+                Chapter.objects.filter(created_at__gte=since, fanout_on_read=False)
+                .order_by('id').values_list('id', flat=True)
+            )
+            written = 0
+            for start in range(0, len(chapter_ids), options['batch_size']):
+                written += feed.fan_out(chapter_ids[start:start + options['batch_size']])
+            self.stdout.write(f'Đã ghi {written} dòng feed cho {len(chapter_ids)} chapter')
+
+        if options['prune']:
+            deleted = feed.prune(options['prune'])
+            self.stdout.write(f'Đã xóa {deleted} dòng feed cũ hơn {options["prune"]} ngày')
+
+        self.stdout.write(self.style.SUCCESS('Hoàn tất'))
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from manga.importer import CatalogImporter
+
+
+class Command(BaseCommand):
+    help = 'Nhập hàng loạt truyện và chapter từ một thư mục có manifest.json'
+
+    def add_arguments(self, parser):
+        parser.add_argument('root', help='Thư mục chứa manifest.json và dữ liệu truyện')
+        parser.add_argument('--manifest', help='Đường dẫn manifest (mặc định <root>/manifest.json)')
+        parser.add_argument('--state', help='File lưu tiến độ (mặc định <root>/.import_state.json)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+        parser.add_argument('--batch-size', type=int, default=100)
+
+    def handle(self, *args, **options):
+        root = options['root']
+        if not os.path.isdir(root):
+            raise CommandError(f'Không tìm thấy thư mục {root}')
+
+        importer = CatalogImporter(
+            root,
+            manifest=options['manifest'],
+            state_file=options['state'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
+        importer.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Hoàn tất! Đã cập nhật {len(importer.updated)} truyện. '
+            'Chạy "manage.py build_image_variants" để tạo ảnh WebP cho các trang mới.'
+        ))
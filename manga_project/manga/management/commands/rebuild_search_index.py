@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from manga import search_index
+
+
+class Command(BaseCommand):
+    help = 'Dựng lại chỉ mục tìm kiếm (mọi tiến trình web sẽ nạp lại ở lần tìm kiếm tiếp theo)'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        # Ghi nhật ký "dựng lại toàn bộ" cho các tiến trình web, rồi dựng ở đây để báo số liệu
+        search_index.invalidate()
+        backend = search_index.get_backend()
+        backend.rebuild()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'Đã đánh chỉ mục {len(backend.doc_terms)} truyện, '
+            f'{len(backend.postings)} từ trong {elapsed:.2f}s'
+        )
+        self.stdout.write(self.style.SUCCESS('Hoàn tất!'))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from manga.models import Manga
+
+
+class Command(BaseCommand):
+    help = 'Tính lại rating_sum / rating_count / rating từ bảng Rating cho các truyện bị lệch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        manga_ids = list(Manga.objects.order_by('id').values_list('id', flat=True))
+
+        drifted = 0
+        for start in range(0, len(manga_ids), batch_size):
+            drifted += Manga.reconcile_ratings(manga_ids[start:start + batch_size])
+            self.stdout.write(f'Đã kiểm tra {min(start + batch_size, len(manga_ids))}/{len(manga_ids)} truyện')
+
+        self.stdout.write(self.style.SUCCESS(f'Hoàn tất! Đã sửa {drifted} truyện bị lệch'))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from manga.models import Follow
+
+
+class Command(BaseCommand):
+    help = 'Đếm lại số chapter chưa đọc (Follow.unread_count) từ bảng Chapter cho các lượt theo dõi bị lệch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = Follow.objects.count()
+
+        # Duyệt theo id thay vì lấy hết id vào bộ nhớ: bảng theo dõi có thể rất lớn
+        checked = drifted = last_id = 0
+        while True:
+            follow_ids = list(
+                Follow.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not follow_ids:
+                break
+            drifted += Follow.reconcile_unread(follow_ids)
+            checked += len(follow_ids)
+            last_id = follow_ids[-1]
+            self.stdout.write(f'Đã kiểm tra {checked}/{total} lượt theo dõi')
+
+        self.stdout.write(self.style.SUCCESS(f'Hoàn tất! Đã sửa {drifted} lượt theo dõi bị lệch'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from manga import trending
+
+
+class Command(BaseCommand):
+    help = 'Tính lại bảng xếp hạng truyện hot từ ViewCount (chạy định kỳ bằng cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--window', type=int, action='append', dest='windows',
+            help='Số ngày của cửa sổ, có thể lặp lại (mặc định: TRENDING_WINDOWS)',
+        )
+        parser.add_argument('--size', type=int, help='Số truyện giữ lại cho mỗi cửa sổ')
+
+    def handle(self, *args, **options):
+        results = trending.refresh_all(options['windows'], options['size'])
+
+        for days, entries in results.items():
+            self.stdout.write(f'Top {days} ngày: {len(entries)} truyện')
+
+        self.stdout.write(self.style.SUCCESS('Đã cập nhật bảng xếp hạng!'))
@@ -0,0 +1,83 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from manga.benchmark import SCENARIOS, LoadRunner, load_results, save_results
+
+COLUMNS = [('throughput', 'req/s'), ('p50', 'p50 ms'), ('p95', 'p95 ms'), ('p99', 'p99 ms'), ('queries_mean', 'query')]
+
+
+class Command(BaseCommand):
+    help = (
+        'Đo tải các trang công khai (trang chủ, chi tiết truyện, đọc chapter, tìm kiếm, thể loại) '
+        'với nhiều người đọc cùng lúc, ghi kết quả ra file JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Số request cho mỗi kịch bản')
+        parser.add_argument('--concurrency', type=int, default=8, help='Số người đọc cùng lúc')
+        parser.add_argument(
+            '--scenario', action='append', dest='scenarios', choices=SCENARIOS,
+            help='Kịch bản cần đo, có thể lặp lại (mặc định: tất cả)',
+        )
+        parser.add_argument(
+            '--url', help='Gửi request tới server đang chạy (ví dụ http://127.0.0.1:8000) thay vì test client',
+        )
+        parser.add_argument('--user', help='Đo với người dùng đã đăng nhập (chỉ với test client)')
+        parser.add_argument('--no-warmup', action='store_true', help='Không làm nóng cache trước khi đo')
+        parser.add_argument('--output', help='File JSON kết quả (mặc định benchmarks/<thời điểm>.json)')
+        parser.add_argument('--compare', help='File JSON của lần chạy trước để so sánh')
+
+    def handle(self, *args, **options):
+        if options['url'] and options['user']:
+            raise CommandError('--user chỉ dùng được với test client (không có --url)')
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests và --concurrency phải lớn hơn 0')
+
+        previous = load_results(options['compare']) if options['compare'] else None
+
+        runner = LoadRunner(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            base_url=options['url'],
+            username=options['user'],
+            warmup=not options['no_warmup'],
+        )
+        results = runner.run(options['scenarios'] or SCENARIOS, log=self.stdout.write)
+        if not results['scenarios']:
+            raise CommandError('Chưa có dữ liệu để đo (chạy "manage.py seed_benchmark" trước)')
+
+        self.print_table(results, previous)
+
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', timezone.now().strftime('%Y%m%d-%H%M%S') + '.json',
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        save_results(results, output)
+        self.stdout.write(self.style.SUCCESS(f'Đã ghi kết quả vào {output}'))
+
+    def print_table(self, results, previous=None):
+        self.stdout.write(
+            f'\n{results["requests"]} request / kịch bản, {results["concurrency"]} người đọc cùng lúc, '
+            f'{results["target"]} ({results["database"]})'
+        )
+        header = f'{"Kịch bản":<15}' + ''.join(f'{title:>10}' for _, title in COLUMNS) + f'{"lỗi":>7}'
+        self.stdout.write(header)
+
+        for scenario, result in results['scenarios'].items():
+            row = f'{scenario:<15}'
+            for key, _ in COLUMNS:
+                value = result.get(key)
+                row += f'{value:>10.1f}' if value is not None else f'{"-":>10}'
+            self.stdout.write(row + f'{result["errors"]:>7}')
+
+            before = previous['scenarios'].get(scenario) if previous else None
+            if before:
+                # Thay đổi so với lần chạy trước (%), âm ở p95 / dương ở req/s là tốt hơn
+                row = f'{"  so với trước":<15}'
+                for key, _ in COLUMNS:
+                    old, new = before.get(key), result.get(key)
+                    row += f'{(new - old) / old * 100:>+9.0f}%' if old and new is not None else f'{"-":>10}'
+                self.stdout.write(row)
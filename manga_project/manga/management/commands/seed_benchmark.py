@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from manga.benchmark import DatasetSeeder
+
+
+class Command(BaseCommand):
+    help = (
+        'Sinh dữ liệu giả lập (truyện, chapter, trang, người dùng, theo dõi, đánh giá, bình luận, '
+        'lượt xem theo ngày) để đo tải với khối lượng giống production'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--mangas', type=int, default=100, help='Số truyện')
+        parser.add_argument('--chapters', type=int, default=20, help='Số chapter mỗi truyện')
+        parser.add_argument('--pages', type=int, default=10, help='Số trang mỗi chapter')
+        parser.add_argument('--users', type=int, default=200, help='Số người dùng')
+        parser.add_argument('--follows', type=int, default=10, help='Số truyện mỗi người dùng theo dõi')
+        parser.add_argument('--ratings', type=int, default=5, help='Số truyện mỗi người dùng đánh giá')
+        parser.add_argument('--comments', type=int, default=1000, help='Tổng số bình luận')
+        parser.add_argument('--days', type=int, default=30, help='Số ngày lịch sử lượt xem')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--prefix', default='bench', help='Tiền tố tên người dùng / tác giả / truyện')
+        parser.add_argument('--seed', type=int, help='Seed ngẫu nhiên để tạo lại đúng bộ dữ liệu')
+
+    def handle(self, *args, **options):
+        counts = ['mangas', 'chapters', 'pages', 'users', 'follows', 'ratings', 'comments', 'days']
+        if any(options[name] < 0 for name in counts) or options['batch_size'] < 1:
+            raise CommandError('Các số lượng không được âm, --batch-size phải lớn hơn 0')
+
+        seeder = DatasetSeeder(
+            **{name: options[name] for name in counts},
+            batch_size=options['batch_size'],
+            prefix=options['prefix'],
+            seed=options['seed'],
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        manga_ids = seeder.run()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Hoàn tất trong {time.perf_counter() - started:.1f}s: {len(manga_ids)} truyện mới. '
+            'Chạy "manage.py run_benchmark" để đo tải.'
+        ))
@@ -0,0 +1,99 @@
+"""
+Danh sách trang (manifest) của từng chapter, lưu trong cache.
+
+Reader dùng manifest để render trang mà không cần query ảnh, API trả cùng dữ
+liệu dạng JSON để trình duyệt tải trước chapter kế tiếp. Giống mục lục
+(manga/toc.py), mỗi chapter có version riêng; ngoài ra có thêm một "thế hệ"
+chung để các lệnh xử lý ảnh hàng loạt làm mới toàn bộ manifest một lần.
+"""
+import time
+
+from django.core.cache import cache
+
+from .replicas import use_primary
+
+MANIFEST_TIMEOUT = 60 * 60 * 24
+GENERATION_KEY = 'manifest:generation'
+
+
+def _version_key(chapter_id):
+    return f'manifest:version:{chapter_id}'
+
+
+def _manifest_key(chapter_id, generation, version):
+    return f'manifest:{chapter_id}:{generation}:{version}'
+
+
+def build(chapter_id):
+    """Dựng manifest từ DB (2 query), trả về None nếu không có chapter"""
+    from .models import Chapter, ChapterImage
+
+    chapter = (
+        Chapter.objects.filter(id=chapter_id)
+        .values('id', 'manga_id', 'chapter_number', 'slug', 'title')
+        .first()
+    )
+    if chapter is None:
+        return None
+
+    pages = [
+        {
+            'page': image.page_number,
+            'url': image.image.url,
+            'width': image.width,
+            'height': image.height,
+            'srcset': image.webp_srcset,
+            'placeholder': image.placeholder,
+        }
+        for image in ChapterImage.objects.filter(chapter_id=chapter_id).order_by('page_number')
+    ]
+    return {'chapter': chapter, 'pages': pages}
+
+
+def get_manifest(chapter_id):
+    values = cache.get_many([GENERATION_KEY, _version_key(chapter_id)])
+    generation = values.get(GENERATION_KEY, 0)
+    version = values.get(_version_key(chapter_id))
+    if version is None:
+        version = time.time_ns()
+        # add() để không ghi đè version do tiến trình khác vừa đặt
+        if not cache.add(_version_key(chapter_id), version, MANIFEST_TIMEOUT):
+            version = cache.get(_version_key(chapter_id), version)
+
+    key = _manifest_key(chapter_id, generation, version)
+    manifest = cache.get(key)
+    if manifest is None:
+        # Giống mục lục: dựng từ primary vì manifest được cache tới khi đổi version
+        with use_primary():
+            manifest = build(chapter_id)
+        if manifest is None:
+            return None
+        manifest['etag'] = f'{chapter_id}-{generation}-{version}'
+        cache.set(key, manifest, MANIFEST_TIMEOUT)
+
+    return manifest
+
+
+def invalidate(chapter_ids):
+    cache.set_many({_version_key(chapter_id): time.time_ns() for chapter_id in set(chapter_ids)}, MANIFEST_TIMEOUT)
+
+
+def invalidate_all():
+    """Làm mới manifest của mọi chapter (sau các lệnh cập nhật ảnh hàng loạt)"""
+    cache.set(GENERATION_KEY, time.time_ns(), None)
+
+
+# ==================== PRELOAD ====================
+PRELOAD_PAGES = 2
+PAGE_SIZES = '(max-width: 1000px) 100vw, 960px'
+
+
+def preload_links(pages, count=PRELOAD_PAGES):
+    """Giá trị header ``Link`` để trình duyệt tải sớm các trang đầu"""
+    links = []
+    for page in pages[:count]:
+        link = f'<{page["url"]}>; rel=preload; as=image; fetchpriority=high'
+        if page['srcset']:
+            link += f'; imagesrcset="{page["srcset"]}"; imagesizes="{PAGE_SIZES}"'
+        links.append(link)
+    return ', '.join(links)
@@ -0,0 +1,189 @@
+"""
+Phục vụ file media (ảnh bìa, trang truyện, avatar).
+
+Django chỉ kiểm tra đường dẫn / quyền / file có tồn tại, còn việc gửi file
+giao cho web server qua header:
+
+    MEDIA_DELIVERY = {
+        'METHOD': 'xaccel',                    # nginx: X-Accel-Redirect
+        'XACCEL_PREFIX': '/protected-media/',  # location internal trỏ tới MEDIA_ROOT
+    }
+
+    MEDIA_DELIVERY = {'METHOD': 'xsendfile'}   # Apache mod_xsendfile / lighttpd
+
+Mặc định ('django') file được gửi bằng FileResponse, có hỗ trợ Range (tua /
+tải tiếp), ETag và cache ``immutable`` cho file lưu theo nội dung.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+
+from .storage import is_hashed_name
+
+DEFAULT_DELIVERY = {
+    'METHOD': 'django',
+    'XACCEL_PREFIX': '/protected-media/',
+}
+ALLOWED_PREFIXES = ('chapters/', 'covers/', 'avatars/')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+DEFAULT_MAX_AGE = 60 * 60
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_delivery():
+    return {**DEFAULT_DELIVERY, **getattr(settings, 'MEDIA_DELIVERY', {})}
+
+
+def clean_name(path):
+    """
+    Chuẩn hóa đường dẫn trong URL (đã được giải mã, ``%2e%2e`` thành ``..``).
+    Trả về None nếu có đoạn ``..``, đường dẫn tuyệt đối hoặc ký tự NUL.
+    """
+    name = path.replace('\\', '/')
+    if not name or name.startswith('/') or '\x00' in name or '..' in name.split('/'):
+        return None
+    return posixpath.normpath(name)
+
+
+def is_allowed(name):
+    """Chỉ phục vụ các thư mục media công khai, không lộ file tạm / file, thư mục ẩn"""
+    return (
+        name.startswith(ALLOWED_PREFIXES)
+        and not any(part.startswith('.') for part in name.split('/'))
+        and not name.endswith('.tmp')
+    )
+
+
+def parse_range(header, size):
+    """
+    Trả về (start, end) cho header ``Range: bytes=...`` (chỉ hỗ trợ một khoảng),
+    None nếu không có / không hỗ trợ, hoặc False nếu khoảng không hợp lệ (416).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not size:
+        # File rỗng không có byte nào để chọn (tránh "bytes 0--1/0")
+        return False
+
+    if not start:
+        # bytes=-500: 500 byte cuối
+        length = int(end)
+        if not length:
+            return False
+        return max(0, size - length), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(f, start, length):
+    try:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def serve_media(request, path):
+    name = clean_name(path)
+    if name is None or not is_allowed(name):
+        raise Http404
+
+    try:
+        full_path = default_storage.path(name)
+    except SuspiciousFileOperation:
+        raise Http404
+
+    try:
+        stat = os.stat(full_path)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404
+    if not os.path.isfile(full_path):
+        raise Http404
+
+    if is_hashed_name(name):
+        # Tên file chính là hash nội dung: ETag mạnh, không bao giờ đổi
+        etag = quote_etag(os.path.splitext(os.path.basename(name))[0])
+    else:
+        etag = quote_etag(f'{int(stat.st_mtime):x}-{stat.st_size:x}')
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _deliver(request, name, full_path, stat, etag)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if is_hashed_name(name):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=DEFAULT_MAX_AGE)
+    return response
+
+
+def _deliver(request, name, full_path, stat, etag):
+    content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    method = get_delivery()['METHOD']
+
+    # Web server tự đọc file và xử lý Range
+    if method == 'xaccel':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = get_delivery()['XACCEL_PREFIX'].rstrip('/') + '/' + quote(name)
+        return response
+    if method == 'xsendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = full_path
+        return response
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'), size)
+
+    # If-Range: chỉ trả một phần khi file chưa đổi, ngược lại gửi cả file
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and if_range.strip() not in parse_etags(etag):
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        # FileResponse dùng wsgi.file_wrapper (sendfile) nếu server hỗ trợ
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(
+            _read_range(open(full_path, 'rb'), start, length),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    return response
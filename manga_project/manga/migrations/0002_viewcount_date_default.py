@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='viewcount',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+    ]
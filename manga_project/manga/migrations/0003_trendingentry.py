@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0002_viewcount_date_default'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('window_days', models.PositiveSmallIntegerField()),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('manga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_entries', to='manga.manga')),
+            ],
+            options={
+                'ordering': ['window_days', 'rank'],
+                'unique_together': {('window_days', 'rank')},
+            },
+        ),
+    ]
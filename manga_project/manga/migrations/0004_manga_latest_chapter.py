@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0003_trendingentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manga',
+            name='chapter_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='manga',
+            name='latest_chapter_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='manga',
+            name='latest_chapter_number',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='manga',
+            name='latest_chapter_slug',
+            field=models.SlugField(blank=True),
+        ),
+    ]
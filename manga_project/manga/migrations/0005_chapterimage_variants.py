@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0004_manga_latest_chapter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapterimage',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
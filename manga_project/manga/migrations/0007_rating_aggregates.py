@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:28
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_rating_aggregates(apps, schema_editor):
+    Manga = apps.get_model('manga', 'Manga')
+    Rating = apps.get_model('manga', 'Rating')
+
+    rows = Rating.objects.values('manga_id').annotate(total=Sum('score'), count=Count('id'))
+    for row in rows.iterator():
+        Manga.objects.filter(pk=row['manga_id']).update(
+            rating_sum=row['total'],
+            rating_count=row['count'],
+            rating=(Decimal(row['total']) / row['count']).quantize(Decimal('0.01')),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0006_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='manga',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='manga',
+            name='rating_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='manga',
+            name='rating',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=4),
+        ),
+        migrations.RunPython(fill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:30
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def copy_history(apps, schema_editor):
+    """Giữ lại chapter đọc gần nhất của mỗi (user, manga) trong lịch sử cũ"""
+    ReadingHistory = apps.get_model('manga', 'ReadingHistory')
+    ReadingProgress = apps.get_model('manga', 'ReadingProgress')
+
+    rows = (
+        ReadingHistory.objects.order_by('user_id', 'manga_id', '-last_read_at')
+        .values_list('user_id', 'manga_id', 'chapter_id', 'last_read_at')
+    )
+    batch = []
+    last_key = None
+    for user_id, manga_id, chapter_id, last_read_at in rows.iterator(chunk_size=BATCH_SIZE):
+        if (user_id, manga_id) == last_key:
+            continue
+        last_key = (user_id, manga_id)
+        batch.append(ReadingProgress(
+            user_id=user_id, manga_id=manga_id, chapter_id=chapter_id, page=1, updated_at=last_read_at,
+        ))
+        if len(batch) >= BATCH_SIZE:
+            ReadingProgress.objects.bulk_create(batch)
+            batch = []
+    ReadingProgress.objects.bulk_create(batch)
+
+
+def copy_progress_back(apps, schema_editor):
+    ReadingHistory = apps.get_model('manga', 'ReadingHistory')
+    ReadingProgress = apps.get_model('manga', 'ReadingProgress')
+
+    ReadingHistory.objects.bulk_create(
+        (
+            ReadingHistory(user_id=row.user_id, manga_id=row.manga_id, chapter_id=row.chapter_id)
+            for row in ReadingProgress.objects.iterator(chunk_size=BATCH_SIZE)
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0007_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadingProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page', models.PositiveIntegerField(default=1)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('chapter', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='manga.chapter')),
+                ('manga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to='manga.manga')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reading_progress', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='readingprogress',
+            index=models.Index(fields=['user', '-updated_at'], name='manga_readi_user_id_05a426_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='readingprogress',
+            unique_together={('user', 'manga')},
+        ),
+        migrations.RunPython(copy_history, copy_progress_back),
+        migrations.DeleteModel(
+            name='ReadingHistory',
+        ),
+    ]
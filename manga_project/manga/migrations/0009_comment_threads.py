@@ -0,0 +1,74 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+BATCH_SIZE = 1000
+
+
+def fill_comment_threads(apps, schema_editor):
+    Comment = apps.get_model('manga', 'Comment')
+    Manga = apps.get_model('manga', 'Manga')
+    Chapter = apps.get_model('manga', 'Chapter')
+
+    # Gốc của mỗi bình luận: lần theo parent tới bình luận không có parent
+    parents = dict(Comment.objects.values_list('id', 'parent_id'))
+
+    def find_root(comment_id):
+        seen = set()
+        while parents.get(comment_id) and comment_id not in seen:
+            seen.add(comment_id)
+            comment_id = parents[comment_id]
+        return comment_id
+
+    replies = [Comment(id=pk, root_id=find_root(pk)) for pk, parent_id in parents.items() if parent_id]
+    Comment.objects.bulk_update(replies, ['root'], batch_size=BATCH_SIZE)
+
+    for row in Comment.objects.filter(root__isnull=False).values('root_id').annotate(count=Count('id')).iterator():
+        Comment.objects.filter(id=row['root_id']).update(reply_count=row['count'])
+    for row in Comment.objects.filter(chapter__isnull=True).values('manga_id').annotate(count=Count('id')).iterator():
+        Manga.objects.filter(id=row['manga_id']).update(comment_count=row['count'])
+    for row in Comment.objects.filter(chapter__isnull=False).values('chapter_id').annotate(count=Count('id')).iterator():
+        Chapter.objects.filter(id=row['chapter_id']).update(comment_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0008_reading_progress'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chapter',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='root',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='thread', to='manga.comment'),
+        ),
+        migrations.AddField(
+            model_name='manga',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['manga', 'chapter', 'root', '-created_at'], name='manga_comme_manga_i_4bca8d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['root', 'created_at'], name='manga_comme_root_id_bcbf9c_idx'),
+        ),
+        migrations.RunPython(fill_comment_threads, migrations.RunPython.noop),
+    ]
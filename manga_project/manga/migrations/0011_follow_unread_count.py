@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:48
+
+from bisect import bisect_right
+from collections import defaultdict
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def fill_unread_counts(apps, schema_editor):
+    Follow = apps.get_model('manga', 'Follow')
+    Chapter = apps.get_model('manga', 'Chapter')
+    ReadingProgress = apps.get_model('manga', 'ReadingProgress')
+
+    last_id = 0
+    while True:
+        follows = list(Follow.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+        if not follows:
+            break
+        last_id = follows[-1].id
+        manga_ids = {follow.manga_id for follow in follows}
+
+        numbers = defaultdict(list)
+        for manga_id, number in (
+            Chapter.objects.filter(manga_id__in=manga_ids)
+            .order_by('chapter_number').values_list('manga_id', 'chapter_number')
+        ):
+            numbers[manga_id].append(number)
+
+        # Mốc đã đọc: chapter trong tiến độ đọc, chưa đọc thì coi như đã xem mọi chapter hiện có
+        read = {
+            (user_id, manga_id): number
+            for user_id, manga_id, number in ReadingProgress.objects.filter(
+                user_id__in={follow.user_id for follow in follows}, manga_id__in=manga_ids,
+            ).values_list('user_id', 'manga_id', 'chapter__chapter_number')
+        }
+        for follow in follows:
+            chapters = numbers[follow.manga_id]
+            marker = read.get((follow.user_id, follow.manga_id), chapters[-1] if chapters else None)
+            follow.last_read_chapter_number = marker
+            follow.unread_count = len(chapters) - bisect_right(chapters, marker) if marker is not None else 0
+
+        Follow.objects.bulk_update(follows, ['last_read_chapter_number', 'unread_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0010_update_feed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='last_read_chapter_number',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='follow',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(fill_unread_counts, migrations.RunPython.noop),
+    ]
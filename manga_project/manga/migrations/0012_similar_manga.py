@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0011_follow_unread_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarManga',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('score', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('manga', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_entries', to='manga.manga')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='manga.manga')),
+            ],
+            options={
+                'ordering': ['manga', 'rank'],
+                'unique_together': {('manga', 'rank')},
+            },
+        ),
+    ]
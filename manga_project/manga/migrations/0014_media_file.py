@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:42
+
+from collections import Counter
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# Các trường chứa tên file trong storage (giống manga.storage.REFERENCES lúc tạo migration)
+REFERENCES = [
+    ('ChapterImage', 'image', False),
+    ('ChapterImage', 'variants', True),
+    ('Manga', 'cover_image', False),
+    ('UserProfile', 'avatar', False),
+]
+
+
+def count_references(apps, schema_editor):
+    """Đếm tham chiếu của các file hiện có, trước đây được tính bằng cách quét các bảng"""
+    db_alias = schema_editor.connection.alias
+    MediaFile = apps.get_model('manga', 'MediaFile')
+
+    counts = Counter()
+    for model_name, field_name, is_json in REFERENCES:
+        model = apps.get_model('manga', model_name)
+        values = model.objects.using(db_alias).values_list(field_name, flat=True)
+        for value in values.iterator(chunk_size=BATCH_SIZE):
+            if is_json:
+                counts.update(name for name in (value or {}).values() if name)
+            elif value:
+                counts[value] += 1
+
+    MediaFile.objects.using(db_alias).bulk_create(
+        (MediaFile(name=name, references=count) for name, count in counts.items()),
+        batch_size=BATCH_SIZE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('manga', '0013_search_index_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
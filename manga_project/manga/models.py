@@ -1,7 +1,50 @@
+from bisect import bisect_right
+from collections import defaultdict
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils.text import slugify
-from django.db.models import Avg
+from django.utils import timezone
+from django.db.models import Avg, Case, Count, DecimalField, F, FloatField, Max, Q, Sum, Value, When
+from django.db.models.functions import Cast
+
+from . import imaging, toc
+
+SLUG_BASE_LENGTH = 40
+
+
+def allocate_slugs(model, names, exclude_pk=None):
+    """
+    Cấp slug duy nhất cho nhiều tên cùng lúc (slug, slug-1, slug-2, ...).
+
+    Chỉ một query để lấy các slug đã dùng có cùng tiền tố, thay vì một query
+    cho mỗi lần trùng.
+    """
+    bases = [
+        slugify(name)[:SLUG_BASE_LENGTH].strip('-') or model._meta.model_name
+        for name in names
+    ]
+
+    prefixes = Q(pk__in=[])
+    for base in set(bases):
+        prefixes |= Q(slug__startswith=base)
+
+    existing = model.objects.filter(prefixes)
+    if exclude_pk is not None:
+        existing = existing.exclude(pk=exclude_pk)
+    taken = set(existing.values_list('slug', flat=True))
+
+    slugs = []
+    for base in bases:
+        slug = base
+        counter = 1
+        while slug in taken:
+            slug = f"{base}-{counter}"
+            counter += 1
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
 
 
 class Category(models.Model):
@@ -29,13 +72,7 @@ class Author(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Author.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+            self.slug = allocate_slugs(Author, [self.name], exclude_pk=self.pk)[0]
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -58,7 +95,25 @@ class Manga(models.Model):
     cover_image = models.ImageField(upload_to='covers/')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='ongoing')
     views = models.PositiveIntegerField(default=0)
-    rating = models.DecimalField(max_digits=3, decimal_places=2, default=0)
+    rating = models.DecimalField(max_digits=4, decimal_places=2, default=0)
+    # Tổng điểm và số lượt đánh giá, cộng dồn bằng F() (xem apply_rating_change)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Số bình luận ở trang truyện (không tính bình luận chapter), xem manga/comments.py
+    comment_count = models.PositiveIntegerField(default=0)
+
+    # Thông tin chapter mới nhất (được cập nhật khi chapter thay đổi, xem refresh_chapter_stats)
+    latest_chapter_number = models.FloatField(null=True, blank=True)
+    latest_chapter_slug = models.SlugField(blank=True)
+    latest_chapter_at = models.DateTimeField(null=True, blank=True)
+    chapter_count = models.PositiveIntegerField(default=0)
+
+    # Kích thước và ảnh mờ thay thế của ảnh bìa (xem manga/imaging.py)
+    cover_width = models.PositiveIntegerField(null=True, blank=True)
+    cover_height = models.PositiveIntegerField(null=True, blank=True)
+    cover_size = models.PositiveIntegerField(null=True, blank=True)
+    cover_placeholder = models.TextField(blank=True)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -72,18 +127,106 @@ class Manga(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = slugify(self.title)
-            slug = base_slug
-            counter = 1
-            while Manga.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+            self.slug = allocate_slugs(Manga, [self.title], exclude_pk=self.pk)[0]
+
+        # Ảnh bìa mới upload: đo kích thước và tạo ảnh mờ trước khi lưu
+        if self.cover_image and not self.cover_image._committed:
+            self.set_cover_metadata(imaging.read_metadata(self.cover_image))
         super().save(*args, **kwargs)
 
+    def set_cover_metadata(self, metadata):
+        self.cover_width = metadata['width']
+        self.cover_height = metadata['height']
+        self.cover_size = metadata['file_size']
+        self.cover_placeholder = metadata['placeholder']
+
+    @classmethod
+    def apply_rating_change(cls, manga_id, score_delta, count_delta):
+        """Cộng dồn tổng điểm / số lượt đánh giá rồi tính lại rating trung bình"""
+        mangas = cls.objects.filter(pk=manga_id)
+        mangas.update(
+            rating_sum=F('rating_sum') + score_delta,
+            rating_count=F('rating_count') + count_delta,
+        )
+        # Câu UPDATE riêng: MySQL tính các phép gán trong cùng câu theo thứ tự,
+        # tách ra để trung bình luôn dùng giá trị đã cập nhật ở mọi DB
+        mangas.update(rating=Case(
+            When(rating_count=0, then=Value(Decimal('0'))),
+            default=Cast('rating_sum', FloatField()) / F('rating_count'),
+            output_field=DecimalField(max_digits=4, decimal_places=2),
+        ))
+
+    @classmethod
+    def reconcile_ratings(cls, manga_ids):
+        """Tính lại tổng/số lượt đánh giá từ bảng Rating, trả về số truyện bị lệch"""
+        actual = {
+            row['manga_id']: (row['total'], row['count'])
+            for row in Rating.objects.filter(manga_id__in=manga_ids)
+            .values('manga_id').annotate(total=Sum('score'), count=Count('id'))
+        }
+
+        drifted = []
+        for manga in cls.objects.filter(id__in=manga_ids).only('id', 'rating', 'rating_sum', 'rating_count'):
+            total, count = actual.get(manga.id, (0, 0))
+            rating = (Decimal(total) / count).quantize(Decimal('0.01')) if count else Decimal('0')
+            if (manga.rating_sum, manga.rating_count, manga.rating) != (total, count, rating):
+                manga.rating_sum, manga.rating_count, manga.rating = total, count, rating
+                drifted.append(manga)
+
+        cls.objects.bulk_update(drifted, ['rating_sum', 'rating_count', 'rating'])
+        return len(drifted)
+
     def get_latest_chapters(self, count=3):
         return self.chapters.order_by('-chapter_number')[:count]
 
+    @classmethod
+    def refresh_chapter_stats(cls, manga_id):
+        """Tính lại các trường chapter mới nhất của một truyện từ bảng Chapter"""
+        chapters = Chapter.objects.filter(manga_id=manga_id)
+        latest = chapters.order_by('-chapter_number').values('chapter_number', 'slug', 'created_at').first()
+
+        cls.objects.filter(pk=manga_id).update(
+            latest_chapter_number=latest['chapter_number'] if latest else None,
+            latest_chapter_slug=latest['slug'] if latest else '',
+            latest_chapter_at=latest['created_at'] if latest else None,
+            chapter_count=chapters.count(),
+        )
+
+    @classmethod
+    def refresh_chapter_stats_bulk(cls, manga_ids):
+        """Như refresh_chapter_stats nhưng cho nhiều truyện, số query cố định"""
+        # Số chapter và chapter lớn nhất của từng truyện: một câu GROUP BY
+        stats = {
+            row['manga']: row
+            for row in Chapter.objects.filter(manga_id__in=manga_ids)
+            .values('manga')
+            .annotate(count=Count('id'), latest=Max('chapter_number'))
+        }
+
+        # Slug và ngày tạo của chapter lớn nhất: một câu cho cả lô
+        latest_filter = Q(pk__in=[])
+        for manga_id, row in stats.items():
+            latest_filter |= Q(manga_id=manga_id, chapter_number=row['latest'])
+
+        latest = {
+            row['manga_id']: row
+            for row in Chapter.objects.filter(latest_filter).values('manga_id', 'slug', 'created_at')
+        }
+
+        mangas = list(cls.objects.filter(id__in=manga_ids).only('id'))
+        for manga in mangas:
+            row = stats.get(manga.id)
+            chapter = latest.get(manga.id)
+            manga.chapter_count = row['count'] if row else 0
+            manga.latest_chapter_number = row['latest'] if row else None
+            manga.latest_chapter_slug = chapter['slug'] if chapter else ''
+            manga.latest_chapter_at = chapter['created_at'] if chapter else None
+
+        cls.objects.bulk_update(
+            mangas,
+            ['chapter_count', 'latest_chapter_number', 'latest_chapter_slug', 'latest_chapter_at'],
+        )
+
     def __str__(self):
         return self.title
 
@@ -94,6 +237,9 @@ class Chapter(models.Model):
     title = models.CharField(max_length=255, blank=True)
     slug = models.SlugField(blank=True)
     views = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Truyện quá nhiều người theo dõi: không ghi vào feed từng người, feed tự đọc chapter này (manga/feed.py)
+    fanout_on_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -102,14 +248,18 @@ class Chapter(models.Model):
         unique_together = ['manga', 'chapter_number']
         indexes = [
             models.Index(fields=['manga', '-chapter_number']),
+            models.Index(fields=['manga', 'fanout_on_read', '-created_at']),
         ]
 
     def save(self, *args, **kwargs):
         if not self.slug:
-            base_slug = f"{self.manga.slug}-chapter-{self.chapter_number}"
-            self.slug = base_slug.replace('.', '-')
+            self.slug = self.build_slug(self.manga.slug, self.chapter_number)
         super().save(*args, **kwargs)
 
+    @staticmethod
+    def build_slug(manga_slug, chapter_number):
+        return f"{manga_slug}-chapter-{chapter_number}".replace('.', '-')
+
     def get_next_chapter(self):
         return Chapter.objects.filter(
             manga=self.manga,
@@ -130,11 +280,24 @@ class ChapterImage(models.Model):
     chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='chapters/')
     page_number = models.PositiveIntegerField()
+    # Ảnh WebP theo độ rộng: {"480": "chapters/variants/..."} (xem manga/imaging.py)
+    variants = models.JSONField(default=dict, blank=True)
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    file_size = models.PositiveIntegerField(null=True, blank=True)
+    placeholder = models.TextField(blank=True)  # data URI ảnh WebP rất nhỏ, hiện trong lúc chờ tải
 
     class Meta:
         ordering = ['page_number']
         unique_together = ['chapter', 'page_number']
 
+    @property
+    def webp_srcset(self):
+        return ', '.join(
+            f'{self.image.storage.url(name)} {width}w'
+            for width, name in sorted(self.variants.items(), key=lambda item: int(item[0]))
+        )
+
     def __str__(self):
         return f"{self.chapter} - Page {self.page_number}"
 
@@ -152,6 +315,9 @@ class UserProfile(models.Model):
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follows')
     manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='followers')
+    # Chapter lớn nhất đã đọc (hoặc mới nhất lúc bắt đầu theo dõi) và số chapter sau mốc đó
+    last_read_chapter_number = models.FloatField(null=True, blank=True)
+    unread_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -160,22 +326,109 @@ class Follow(models.Model):
     def __str__(self):
         return f"{self.user.username} follows {self.manga.title}"
 
-
-class ReadingHistory(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_history')
-    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE)
-    manga = models.ForeignKey(Manga, on_delete=models.CASCADE)
-    last_read_at = models.DateTimeField(auto_now=True)
+    @classmethod
+    def count_chapter(cls, manga_id, chapter_number, delta):
+        """Chapter được đăng (delta=1) / bị xóa (delta=-1): cộng dồn số chưa đọc của người theo dõi"""
+        follows = cls.objects.filter(
+            Q(last_read_chapter_number__isnull=True) | Q(last_read_chapter_number__lt=chapter_number),
+            manga_id=manga_id,
+        )
+        if delta < 0:
+            # Không cho số đếm âm (cột UNSIGNED trên MySQL)
+            follows = follows.filter(unread_count__gte=-delta)
+        follows.update(unread_count=F('unread_count') + delta)
+
+    @classmethod
+    def mark_read(cls, read):
+        """
+        Dời mốc đã đọc sau khi ghi tiến độ đọc: ``{(user_id, manga_id): chapter_number}``.
+        Số chưa đọc đếm trên mục lục trong cache (manga/toc.py), không query Chapter.
+        """
+        if not read:
+            return
+        follows = cls.objects.filter(
+            user_id__in={user_id for user_id, _ in read},
+            manga_id__in={manga_id for _, manga_id in read},
+        ).only('id', 'user_id', 'manga_id', 'last_read_chapter_number')
+
+        changed = []
+        for follow in follows:
+            number = read.get((follow.user_id, follow.manga_id))
+            marker = follow.last_read_chapter_number
+            if number is None or (marker is not None and marker >= number):
+                continue
+            follow.last_read_chapter_number = number
+            follow.unread_count = toc.get_toc(follow.manga_id).count_after(number)
+            changed.append(follow)
+
+        cls.objects.bulk_update(changed, ['last_read_chapter_number', 'unread_count'])
+
+    @classmethod
+    def reconcile_unread(cls, follow_ids):
+        """Đếm lại số chapter chưa đọc từ bảng Chapter, trả về số dòng bị lệch"""
+        follows = list(
+            cls.objects.filter(id__in=follow_ids)
+            .only('id', 'manga_id', 'last_read_chapter_number', 'unread_count')
+        )
+
+        # Số chapter của từng truyện, tăng dần: một query cho cả lô
+        numbers = defaultdict(list)
+        for manga_id, number in (
+            Chapter.objects.filter(manga_id__in={follow.manga_id for follow in follows})
+            .order_by('chapter_number').values_list('manga_id', 'chapter_number')
+        ):
+            numbers[manga_id].append(number)
+
+        drifted = []
+        for follow in follows:
+            chapters = numbers[follow.manga_id]
+            unread = len(chapters)
+            if follow.last_read_chapter_number is not None:
+                unread -= bisect_right(chapters, follow.last_read_chapter_number)
+            if follow.unread_count != unread:
+                follow.unread_count = unread
+                drifted.append(follow)
+
+        cls.objects.bulk_update(drifted, ['unread_count'])
+        return len(drifted)
+
+
+class FeedEntry(models.Model):
+    """Chapter mới của truyện đang theo dõi, ghi sẵn cho từng người theo dõi (manga/feed.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='feed_entries')
+    manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='+')
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='feed_entries')
+    # Thời điểm đăng chapter (không phải lúc ghi feed) để trộn với chapter đọc trực tiếp
+    created_at = models.DateTimeField()
 
     class Meta:
         unique_together = ['user', 'chapter']
-        ordering = ['-last_read_at']
         indexes = [
-            models.Index(fields=['user', '-last_read_at']),
+            models.Index(fields=['user', '-created_at', '-chapter']),
         ]
 
     def __str__(self):
-        return f"{self.user.username} read {self.chapter}"
+        return f"{self.user.username}: {self.chapter}"
+
+
+class ReadingProgress(models.Model):
+    """Tiến độ đọc: mỗi người dùng một dòng cho mỗi truyện (chapter và trang đang đọc)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reading_progress')
+    manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='reading_progress')
+    chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, related_name='+')
+    page = models.PositiveIntegerField(default=1)
+    # Ghi từ bộ đệm (manga/reading_progress.py) nên không dùng auto_now
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ['user', 'manga']
+        ordering = ['-updated_at']
+        indexes = [
+            models.Index(fields=['user', '-updated_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} at {self.chapter} p{self.page}"
 
 
 class Comment(models.Model):
@@ -184,11 +437,24 @@ class Comment(models.Model):
     chapter = models.ForeignKey(Chapter, on_delete=models.CASCADE, null=True, blank=True, related_name='comments')
     content = models.TextField()
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='replies')
+    # Bình luận gốc của luồng (None nếu chính nó là gốc): tải cả cây trả lời bằng một query
+    root = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='thread')
+    # Chỉ dùng ở bình luận gốc: số trả lời trong cả luồng
+    reply_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['manga', 'chapter', 'root', '-created_at']),
+            models.Index(fields=['root', 'created_at']),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.parent_id and not self.root_id:
+            self.root_id = self.parent.root_id or self.parent_id
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.user.username} on {self.manga.title}"
@@ -209,11 +475,82 @@ class Rating(models.Model):
 
 class ViewCount(models.Model):
     manga = models.ForeignKey(Manga, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ['manga', 'date']
         indexes = [
             models.Index(fields=['date']),
-        ]
\ No newline at end of file
+        ]
+
+
+class TrendingEntry(models.Model):
+    """Bảng xếp hạng tính sẵn theo cửa sổ N ngày (xem manga/trending.py)"""
+    window_days = models.PositiveSmallIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='trending_entries')
+    views = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['window_days', 'rank']
+        unique_together = ['window_days', 'rank']
+
+    def __str__(self):
+        return f"Top {self.window_days} ngày #{self.rank}: {self.manga.title}"
+
+
+class SearchIndexChange(models.Model):
+    """
+    Nhật ký truyện cần đánh chỉ mục tìm kiếm lại. Mỗi tiến trình web đọc các
+    dòng mới để cập nhật chỉ mục trong bộ nhớ của mình (xem manga/search_index.py).
+    """
+    manga_id = models.PositiveBigIntegerField(null=True)  # None: dựng lại toàn bộ chỉ mục
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Chỉ mục: {self.manga_id or 'toàn bộ'} ({self.created_at})"
+
+
+class MediaFile(models.Model):
+    """
+    Số tham chiếu tới mỗi file của storage lưu theo nội dung (xem manga/storage.py).
+    Mỗi lần ghi file là một tham chiếu, mỗi lần xóa trả lại một; file chỉ bị xóa
+    khỏi đĩa khi không còn tham chiếu nào.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} ({self.references})"
+
+
+class SimilarManga(models.Model):
+    """Top K truyện tương tự tính sẵn cho mỗi truyện (xem manga/recommendations.py)"""
+    manga = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='similar_entries')
+    rank = models.PositiveSmallIntegerField()
+    similar = models.ForeignKey(Manga, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['manga', 'rank']
+        unique_together = ['manga', 'rank']
+
+    def __str__(self):
+        return f"{self.manga.title} #{self.rank}: {self.similar.title}"
+
+
+class SimilarityChange(models.Model):
+    """
+    Cặp người dùng × truyện vừa bị xóa (bỏ theo dõi, xóa tiến độ đọc). Dòng đã
+    xóa không còn để so ``created_at``/``updated_at``, nên job tính truyện
+    tương tự đọc bảng này để biết truyện nào cần tính lại (manga/recommendations.py).
+    """
+    user_id = models.PositiveBigIntegerField()
+    manga_id = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Bỏ {self.user_id} × {self.manga_id} ({self.created_at})"
@@ -0,0 +1,268 @@
+"""
+Phân trang theo con trỏ (keyset pagination).
+
+Thay vì OFFSET, mỗi trang lọc tiếp từ giá trị khóa sắp xếp của dòng cuối trang
+trước (ví dụ ``-updated_at, id``), nên trang 500 tốn như trang 1. Con trỏ được
+mã hóa thành chuỗi base64 ``?cursor=...`` trên URL. Tổng số dòng chỉ đếm tới
+``count_limit`` để tránh COUNT(*) trên toàn bảng.
+
+Admin dùng ``EstimatedCountPaginator``: danh sách chưa lọc lấy số dòng ước
+lượng từ thống kê của DB.
+"""
+import base64
+import datetime
+import json
+import math
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def _json_default(value):
+    # Giữ nguyên micro giây (DjangoJSONEncoder cắt còn mili giây, làm lệch con trỏ)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, default=_json_default, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Giải mã con trỏ, trả về None nếu không hợp lệ"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+class CursorPage:
+    """Một trang kết quả, dùng được trong template như Page của Django"""
+
+    def __init__(self, object_list, number, paginator, has_next, has_previous,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Phân trang queryset theo các trường sắp xếp ổn định.
+
+    ``ordering`` phải xác định thứ tự duy nhất, nên luôn kết thúc bằng ``id``.
+    """
+
+    def __init__(self, queryset, ordering, per_page=24, count_limit=1000):
+        self.queryset = queryset
+        self.ordering = list(ordering)
+        self.per_page = per_page
+        self.count_limit = count_limit
+        self.fields = [field.lstrip('-') for field in self.ordering]
+        self._count = None
+
+    def _raw_count(self):
+        if self._count is None:
+            queryset = self.queryset.order_by()
+            if self.count_limit is not None:
+                queryset = queryset[:self.count_limit + 1]
+            self._count = queryset.count()
+        return self._count
+
+    @property
+    def count(self):
+        """Số dòng, chỉ đếm tối đa tới count_limit (xem count_is_exact)"""
+        if self.count_limit is None:
+            return self._raw_count()
+        return min(self._raw_count(), self.count_limit)
+
+    @property
+    def count_is_exact(self):
+        return self.count_limit is None or self._raw_count() <= self.count_limit
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def _values(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def _parse_values(self, values):
+        model = self.queryset.model
+        parsed = []
+        for name, value in zip(self.fields, values):
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            parsed.append(field.to_python(value))
+        return parsed
+
+    def _after(self, values, reverse=False):
+        """Điều kiện lấy các dòng đứng sau ``values`` theo thứ tự sắp xếp"""
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            equal = {self.fields[i]: values[i] for i in range(index)}
+            condition |= Q(**equal, **{f'{self.fields[index]}__{lookup}': values[index]})
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def get_page(self, cursor=None):
+        data = decode_cursor(cursor)
+        queryset = self.queryset
+        number = 1
+        direction = None
+
+        if data and len(data.get('v', [])) == len(self.fields):
+            try:
+                values = self._parse_values(data['v'])
+                direction = data.get('d')
+                number = max(1, int(data.get('p', 1)))
+            except Exception:
+                direction = None
+
+        if direction == PREVIOUS:
+            rows = list(
+                queryset.filter(self._after(values, reverse=True))
+                .order_by(*self._reversed_ordering())[:self.per_page + 1]
+            )
+            has_previous = len(rows) > self.per_page
+            object_list = rows[:self.per_page][::-1]
+            has_next = True
+            if not has_previous:
+                number = 1
+        else:
+            if direction == NEXT:
+                queryset = queryset.filter(self._after(values))
+            else:
+                number = 1
+            rows = list(queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next = len(rows) > self.per_page
+            object_list = rows[:self.per_page]
+            has_previous = direction == NEXT
+
+        if not object_list:
+            has_next = False
+
+        next_cursor = previous_cursor = None
+        if has_next:
+            next_cursor = encode_cursor({'v': self._values(object_list[-1]), 'd': NEXT, 'p': number + 1})
+        if has_previous and object_list:
+            previous_cursor = encode_cursor({'v': self._values(object_list[0]), 'd': PREVIOUS, 'p': number - 1})
+
+        return CursorPage(object_list, number, self, has_next, has_previous, next_cursor, previous_cursor)
+
+
+class SequencePaginator:
+    """
+    Phân trang một danh sách đã có sẵn trong bộ nhớ (ví dụ id từ chỉ mục tìm
+    kiếm) với cùng giao diện con trỏ như KeysetPaginator.
+    """
+
+    count_is_exact = True
+
+    def __init__(self, sequence, per_page=24):
+        self.sequence = sequence
+        self.per_page = per_page
+
+    @property
+    def count(self):
+        return len(self.sequence)
+
+    @property
+    def num_pages(self):
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def get_page(self, cursor=None):
+        data = decode_cursor(cursor) or {}
+        try:
+            number = min(max(1, int(data.get('p', 1))), self.num_pages)
+        except (TypeError, ValueError):
+            number = 1
+
+        start = (number - 1) * self.per_page
+        object_list = self.sequence[start:start + self.per_page]
+        has_next = number < self.num_pages
+        has_previous = number > 1
+
+        return CursorPage(
+            object_list, number, self, has_next, has_previous,
+            encode_cursor({'p': number + 1}) if has_next else None,
+            encode_cursor({'p': number - 1}) if has_previous else None,
+        )
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Số dòng ước lượng của cả bảng theo thống kê của DB (không quét bảng),
+    None nếu DB không hỗ trợ (SQLite).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES '
+                'WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [table],
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+
+    return int(row[0]) if row and row[0] is not None and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator cho admin: danh sách không lọc của bảng lớn dùng số dòng ước
+    lượng thay cho COUNT(*) trên toàn bảng. Khi có lọc / tìm kiếm thì đếm thật.
+    """
+
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if hasattr(queryset, 'query') and not queryset.query.where:
+            estimate = estimate_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_threshold:
+                return estimate
+        return super().count
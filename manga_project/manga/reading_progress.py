@@ -0,0 +1,249 @@
+"""
+Tiến độ đọc (chapter và trang đang đọc) của người dùng, ghi trễ theo lô.
+
+Mỗi người dùng chỉ có một dòng ``ReadingProgress`` cho mỗi truyện. Khi mở
+chapter hoặc khi reader báo trang đang xem (beacon ``api/progress/``), vị trí
+chỉ được ghi vào bộ đệm trong bộ nhớ; nhiều lần cập nhật cùng một truyện gộp
+lại thành vị trí mới nhất. Luồng nền định kỳ ghi cả lô bằng một câu upsert
+(INSERT ... ON DUPLICATE KEY UPDATE trên MySQL).
+
+Cấu hình trong settings:
+
+    READING_PROGRESS = {
+        'BACKEND': 'manga.reading_progress.MemoryProgressBuffer',
+        'FLUSH_INTERVAL': 10,  # giây, 0 = ghi ngay (dùng khi test)
+    }
+"""
+import threading
+from abc import abstractmethod
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .buffering import BufferedWriter
+
+DEFAULTS = {
+    'BACKEND': 'manga.reading_progress.MemoryProgressBuffer',
+    'FLUSH_INTERVAL': 10,
+}
+
+
+def write_progress(pending):
+    """
+    Ghi một lô vị trí đọc: ``{(user_id, manga_id): (chapter_id, page, updated_at)}``.
+
+    Bỏ qua chapter/người dùng đã bị xóa trong lúc chờ ghi và các vị trí cũ
+    hơn dòng đang có (tiến trình khác đã ghi vị trí mới hơn trước đó).
+    """
+    from .models import Chapter, Follow, ReadingProgress
+
+    chapters = {
+        (chapter_id, manga_id): number
+        for chapter_id, manga_id, number in Chapter.objects.filter(
+            id__in={chapter_id for chapter_id, _, _ in pending.values()}
+        ).values_list('id', 'manga_id', 'chapter_number')
+    }
+    users = set(
+        get_user_model().objects.filter(id__in={user_id for user_id, _ in pending})
+        .values_list('id', flat=True)
+    )
+    current = {
+        (user_id, manga_id): updated_at
+        for user_id, manga_id, updated_at in ReadingProgress.objects.filter(
+            user_id__in=users, manga_id__in={manga_id for _, manga_id in pending},
+        ).values_list('user_id', 'manga_id', 'updated_at')
+    }
+
+    rows = []
+    for (user_id, manga_id), (chapter_id, page, updated_at) in pending.items():
+        if user_id not in users or (chapter_id, manga_id) not in chapters:
+            continue
+        if (user_id, manga_id) in current and current[(user_id, manga_id)] > updated_at:
+            continue
+        rows.append(ReadingProgress(
+            user_id=user_id, manga_id=manga_id, chapter_id=chapter_id, page=page, updated_at=updated_at,
+        ))
+
+    # PostgreSQL/SQLite cần chỉ rõ khóa xung đột (ON CONFLICT (user, manga)); MySQL
+    # không nhận tham số này và tự dựa vào khóa unique (ON DUPLICATE KEY UPDATE)
+    upsert = {'update_conflicts': True, 'update_fields': ['chapter', 'page', 'updated_at']}
+    if connections[ReadingProgress.objects.db].features.supports_update_conflicts_with_target:
+        upsert['unique_fields'] = ['user', 'manga']
+    ReadingProgress.objects.bulk_create(rows, **upsert)
+
+    # Dời mốc đã đọc / số chapter chưa đọc của các truyện đang theo dõi
+    Follow.mark_read({
+        (row.user_id, row.manga_id): chapters[(row.chapter_id, row.manga_id)] for row in rows
+    })
+
+
+class BaseProgressBuffer(BufferedWriter):
+    """
+    Giao diện chung cho các backend đệm tiến độ đọc.
+
+    Backend con cài đặt ``put``, ``get``, ``pending_for_user``, ``drain`` và
+    ``restore``.
+    """
+
+    thread_name = 'reading-progress-flush'
+
+    @abstractmethod
+    def put(self, key, value):
+        """Ghi đè vị trí đang chờ của (user_id, manga_id)"""
+
+    @abstractmethod
+    def get(self, key):
+        """Vị trí đang chờ ghi của (user_id, manga_id), None nếu không có"""
+
+    @abstractmethod
+    def pending_for_user(self, user_id):
+        """Các vị trí đang chờ ghi của một người dùng: ``{manga_id: (chapter_id, page, updated_at)}``"""
+
+    def write(self, pending):
+        write_progress(pending)
+
+    def record(self, user_id, manga_id, chapter_id, page=1):
+        self.put((user_id, manga_id), (chapter_id, page, timezone.now()))
+        self.schedule()
+
+
+class MemoryProgressBuffer(BaseProgressBuffer):
+    """Đệm tiến độ đọc trong bộ nhớ của từng tiến trình"""
+
+    def __init__(self, flush_interval=10):
+        super().__init__(flush_interval)
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def put(self, key, value):
+        with self._lock:
+            self._pending[key] = value
+
+    def get(self, key):
+        with self._lock:
+            return self._pending.get(key)
+
+    def pending_for_user(self, user_id):
+        with self._lock:
+            return {
+                manga_id: value for (pending_user_id, manga_id), value in self._pending.items()
+                if pending_user_id == user_id
+            }
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending):
+        with self._lock:
+            # Vị trí ghi vào sau khi drain mới hơn, giữ nguyên
+            for key, value in pending.items():
+                self._pending.setdefault(key, value)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """Trả về backend đệm tiến độ đọc theo cấu hình READING_PROGRESS"""
+    global _buffer
+
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                config = {**DEFAULTS, **getattr(settings, 'READING_PROGRESS', {})}
+                backend = import_string(config['BACKEND'])
+                _buffer = backend(flush_interval=config['FLUSH_INTERVAL'])
+
+    return _buffer
+
+
+@receiver(setting_changed)
+def reset_buffer(setting, **kwargs):
+    """Đổi READING_PROGRESS (override_settings trong test): ghi nốt rồi tạo lại backend"""
+    global _buffer
+
+    if setting == 'READING_PROGRESS':
+        with _buffer_lock:
+            if _buffer is not None:
+                _buffer.stop()
+            _buffer = None
+
+
+def record_progress(user_id, manga_id, chapter_id, page=1):
+    get_buffer().record(user_id, manga_id, chapter_id, max(1, int(page)))
+
+
+def get_progress(user_id, manga_id):
+    """
+    Vị trí đọc hiện tại ``(chapter_id, page)`` của một truyện, None nếu chưa đọc.
+
+    Ưu tiên vị trí còn trong bộ đệm của tiến trình này, sau đó mới query
+    (một query theo khóa unique).
+    """
+    from .models import ReadingProgress
+
+    pending = get_buffer().get((user_id, manga_id))
+    if pending is not None:
+        return pending[:2]
+
+    return (
+        ReadingProgress.objects.filter(user_id=user_id, manga_id=manga_id)
+        .values_list('chapter_id', 'page')
+        .first()
+    )
+
+
+def get_history(user_id, limit=50):
+    """
+    Lịch sử đọc mới nhất trước, gồm cả các vị trí còn trong bộ đệm của tiến
+    trình này (chưa ghi DB). Không ghi DB trong request: mục chỉ có trong bộ
+    đệm là ``ReadingProgress`` chưa lưu.
+    """
+    from .models import Chapter, ReadingProgress
+
+    history = list(
+        ReadingProgress.objects.filter(user_id=user_id).select_related('manga', 'chapter')[:limit]
+    )
+    pending = get_buffer().pending_for_user(user_id)
+    if not pending:
+        return history
+
+    # Vị trí trong bộ đệm mới hơn dòng đang có; truyện ngoài trang đầu cũng có thể vừa được đọc
+    chapters = Chapter.objects.select_related('manga').in_bulk(
+        {chapter_id for chapter_id, _, _ in pending.values()}
+    )
+    entries = {item.manga_id: item for item in history}
+    for manga_id, (chapter_id, page, updated_at) in pending.items():
+        chapter = chapters.get(chapter_id)
+        if chapter is None or chapter.manga_id != manga_id:
+            continue
+        item = entries.get(manga_id)
+        if item is None:
+            item = entries[manga_id] = ReadingProgress(user_id=user_id, manga=chapter.manga)
+        elif item.updated_at > updated_at:
+            continue
+        item.chapter, item.page, item.updated_at = chapter, page, updated_at
+
+    return sorted(entries.values(), key=lambda item: item.updated_at, reverse=True)[:limit]
+
+
+def get_continue_reading(user_id, manga_id):
+    """Chapter (mục trong mục lục đã cache) và trang để đọc tiếp, None nếu chưa đọc"""
+    from . import toc
+
+    progress = get_progress(user_id, manga_id)
+    if progress is None:
+        return None
+
+    entry = toc.get_toc(manga_id).find(progress[0])
+    if entry is None:
+        return None
+    return {'chapter': entry, 'page': progress[1]}
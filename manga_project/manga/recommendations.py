@@ -0,0 +1,355 @@
+"""
+Truyện tương tự tính sẵn (job ``manage.py build_recommendations``).
+
+Điểm tương tự của hai truyện A, B trộn hai thành phần:
+
+* đọc chung: cosine trên ma trận thưa người dùng × truyện (theo dõi hoặc có
+  tiến độ đọc), với vector nhị phân là ``|U(A) ∩ U(B)| / sqrt(|U(A)|·|U(B)|)``;
+* thể loại: Jaccard trên ma trận truyện × thể loại ``|C(A) ∩ C(B)| / |C(A) ∪ C(B)|``.
+
+Ma trận thưa được giữ dạng danh sách kề (người dùng -> truyện, truyện -> người
+dùng), nên tích vô hướng của một truyện với mọi truyện khác chỉ duyệt qua các
+cặp khác 0. Nếu cài scipy, cả lô truyện được tính bằng phép nhân ma trận
+``scipy.sparse`` (cùng kết quả, nhanh hơn nhiều); không có thì tính bằng Python
+thuần. Truyện có cùng tập thể loại được gom nhóm để Jaccard chỉ tính một lần
+cho mỗi nhóm. Kết quả top K lưu vào ``SimilarManga``; trang truyện đọc
+bằng một query.
+
+Chạy tăng dần: chỉ tính lại truyện có thay đổi từ lần chạy trước (truyện mới
+/ sửa, mọi truyện của người dùng vừa theo dõi, đọc, bỏ theo dõi hoặc bị xóa
+tiến độ đọc, và các truyện đọc chung với truyện vừa được thêm/bớt người đọc vì
+mẫu số cosine của chúng đổi). Cặp bị xóa được signal ghi vào
+``SimilarityChange``. Việc tính điểm chia lô cho nhiều tiến trình::
+
+    RECOMMENDATIONS = {
+        'TOP_K': 12,
+        'CO_READING_WEIGHT': 0.7,
+        'CATEGORY_WEIGHT': 0.3,
+        'MAX_USER_ITEMS': 500,   # bỏ qua người dùng theo dõi/đọc quá nhiều truyện (bot, nhiễu)
+    }
+"""
+import heapq
+import logging
+import math
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Exists, Max, OuterRef
+from django.utils import timezone
+
+try:
+    import numpy
+    from scipy import sparse
+except ImportError:  # không bắt buộc: thiếu scipy thì tính bằng Python thuần
+    numpy = sparse = None
+
+from .models import Follow, Manga, ReadingProgress, SimilarManga, SimilarityChange
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'TOP_K': 12,
+    'CO_READING_WEIGHT': 0.7,
+    'CATEGORY_WEIGHT': 0.3,
+    'MAX_USER_ITEMS': 500,
+}
+EMPTY = frozenset()
+
+_data = None
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'RECOMMENDATIONS', {})}
+
+
+# ==================== ĐỌC ====================
+
+def get_similar(manga_id, limit=None):
+    """Các truyện tương tự đã tính sẵn, giống nhất trước (một query)"""
+    rows = SimilarManga.objects.filter(manga_id=manga_id).select_related('similar').order_by('rank')
+    if limit is not None:
+        rows = rows[:limit]
+    return [row.similar for row in rows]
+
+
+# ==================== DỮ LIỆU ====================
+
+class SimilarityData:
+    """Ma trận thưa người dùng × truyện và truyện × thể loại, đọc một lần từ DB"""
+
+    def __init__(self, max_user_items=DEFAULTS['MAX_USER_ITEMS']):
+        items = defaultdict(set)
+        for model in (Follow, ReadingProgress):
+            for user_id, manga_id in model.objects.values_list('user_id', 'manga_id').iterator(chunk_size=10000):
+                items[user_id].add(manga_id)
+
+        self.items_by_user = {
+            user_id: tuple(manga_ids)
+            for user_id, manga_ids in items.items()
+            if len(manga_ids) <= max_user_items
+        }
+        users = defaultdict(list)
+        for user_id, manga_ids in self.items_by_user.items():
+            for manga_id in manga_ids:
+                users[manga_id].append(user_id)
+        self.users_by_manga = {manga_id: tuple(user_ids) for manga_id, user_ids in users.items()}
+
+        categories = defaultdict(set)
+        for manga_id, category_id in Manga.categories.through.objects.values_list('manga_id', 'category_id'):
+            categories[manga_id].add(category_id)
+        self.categories = {manga_id: frozenset(ids) for manga_id, ids in categories.items()}
+
+        # Nhóm truyện theo tập thể loại, truyện nhiều lượt xem trước
+        self.manga_ids = []
+        self.groups = defaultdict(list)
+        for manga_id in Manga.objects.order_by('-views', 'id').values_list('id', flat=True):
+            self.manga_ids.append(manga_id)
+            self.groups[self.categories.get(manga_id, EMPTY)].append(manga_id)
+        self.popularity = {manga_id: -index for index, manga_id in enumerate(self.manga_ids)}
+
+        self.readers = self.genres = None
+        if sparse is not None:
+            self._build_matrices()
+
+    def _build_matrices(self):
+        # Cột/hàng thứ i là truyện self.manga_ids[i]
+        self.index = {manga_id: column for column, manga_id in enumerate(self.manga_ids)}
+
+        rows, columns = [], []
+        for row, manga_ids in enumerate(self.items_by_user.values()):
+            for manga_id in manga_ids:
+                if manga_id in self.index:
+                    rows.append(row)
+                    columns.append(self.index[manga_id])
+        # Người dùng × truyện, lưu theo cột để cắt nhanh các cột của một lô truyện
+        self.readers = sparse.csc_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int64), (rows, columns)),
+            shape=(len(self.items_by_user), len(self.manga_ids)),
+        )
+
+        rows, columns, category_index = [], [], {}
+        for manga_id, category_ids in self.categories.items():
+            if manga_id in self.index:
+                for category_id in category_ids:
+                    rows.append(self.index[manga_id])
+                    columns.append(category_index.setdefault(category_id, len(category_index)))
+        # Truyện × thể loại
+        self.genres = sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int64), (rows, columns)),
+            shape=(len(self.manga_ids), len(category_index)),
+        )
+
+        # Nhóm (tập thể loại) × thể loại, cùng thứ tự với self.groups
+        self.group_keys = list(self.groups)
+        rows, columns = [], []
+        for row, category_ids in enumerate(self.group_keys):
+            for category_id in category_ids:
+                rows.append(row)
+                columns.append(category_index[category_id])
+        self.group_genres = sparse.csr_matrix(
+            (numpy.ones(len(rows), dtype=numpy.int64), (rows, columns)),
+            shape=(len(self.group_keys), len(category_index)),
+        )
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def top_similar(data, manga_id, top_k, co_weight, category_weight):
+    """Top K (truyện, điểm) giống ``manga_id`` nhất"""
+    categories = data.categories.get(manga_id, EMPTY)
+    scores = {}
+
+    # Đọc chung: chỉ các truyện có ít nhất một người đọc chung
+    users = data.users_by_manga.get(manga_id, ())
+    if users and co_weight:
+        common = Counter()
+        for user_id in users:
+            common.update(data.items_by_user[user_id])
+        common.pop(manga_id, None)
+        for other, count in common.items():
+            cosine = count / math.sqrt(len(users) * len(data.users_by_manga[other]))
+            scores[other] = co_weight * cosine + category_weight * jaccard(categories, data.categories.get(other, EMPTY))
+
+    if categories and category_weight:
+        ranked = sorted(
+            ((jaccard(categories, group), group) for group in data.groups),
+            key=lambda item: item[0], reverse=True,
+        )
+        for other, similarity in category_matches(data, manga_id, ranked, top_k, scores):
+            scores[other] = category_weight * similarity
+
+    return best_scores(data, scores.items(), top_k)
+
+
+def category_matches(data, manga_id, ranked, top_k, exclude):
+    """
+    Chỉ giống thể loại: tối đa K (truyện, Jaccard) lấy lần lượt từ các nhóm
+    ``ranked`` (Jaccard giảm dần), bỏ qua truyện trong ``exclude``.
+    """
+    matches = []
+    for similarity, group in ranked:
+        if similarity == 0 or len(matches) >= top_k:
+            break
+        for other in data.groups[group]:
+            if other != manga_id and other not in exclude:
+                matches.append((other, similarity))
+                if len(matches) >= top_k:
+                    break
+    return matches
+
+
+def best_scores(data, scores, top_k):
+    # Cùng điểm thì truyện nhiều lượt xem hơn đứng trước
+    best = heapq.nlargest(top_k, scores, key=lambda item: (item[1], data.popularity.get(item[0], 0)))
+    return [(other, score) for other, score in best if score > 0]
+
+
+def top_similar_batch(data, manga_ids, top_k, co_weight, category_weight):
+    """
+    ``top_similar`` cho cả lô truyện bằng ma trận thưa (cần scipy):
+    ``|U(A) ∩ U(B)|`` của lô với mọi truyện là ``R[:, lô].T @ R``, số thể loại
+    chung với mọi nhóm thể loại là ``C[lô] @ G.T``.
+    """
+    columns = [data.index[manga_id] for manga_id in manga_ids]
+    reader_counts = numpy.diff(data.readers.indptr)
+    category_counts = numpy.diff(data.genres.indptr)
+    group_counts = numpy.diff(data.group_genres.indptr)
+    common = (data.readers[:, columns].T @ data.readers).tocsr()
+    group_common = (data.genres[columns] @ data.group_genres.T).tocsr()
+
+    results = []
+    for row, (manga_id, column) in enumerate(zip(manga_ids, columns)):
+        start, end = common.indptr[row], common.indptr[row + 1]
+        others, counts = common.indices[start:end], common.data[start:end]
+        keep = others != column
+        others, counts = others[keep], counts[keep]
+
+        scores = []
+        if len(others) and co_weight:
+            # Cùng thứ tự phép tính với top_similar để điểm bằng nhau tuyệt đối
+            cosine = counts / numpy.sqrt(reader_counts[column] * reader_counts[others])
+            shared = (data.genres[others] @ data.genres[column].T).toarray().ravel()
+            union = category_counts[column] + category_counts[others] - shared
+            similarity = numpy.divide(shared, union, out=numpy.zeros(len(others)), where=union > 0)
+            score = co_weight * cosine + category_weight * similarity
+            # Chỉ K truyện đọc chung tốt nhất có thể lọt vào kết quả (cột nhỏ = nhiều lượt xem)
+            order = numpy.lexsort((others, -score))[:top_k]
+            scores = [(data.manga_ids[other], value) for other, value in zip(others[order].tolist(), score[order].tolist())]
+
+        if data.categories.get(manga_id) and category_weight:
+            # Chỉ các nhóm có thể loại chung; cùng Jaccard thì giữ thứ tự nhóm như sorted()
+            start, end = group_common.indptr[row], group_common.indptr[row + 1]
+            groups, shared = group_common.indices[start:end], group_common.data[start:end]
+            similarity = shared / (category_counts[column] + group_counts[groups] - shared)
+            order = numpy.lexsort((groups, -similarity))
+            ranked = zip(similarity[order].tolist(), (data.group_keys[group] for group in groups[order].tolist()))
+
+            exclude = {data.manga_ids[other] for other in others.tolist()} if scores else EMPTY
+            scores.extend(
+                (other, category_weight * similarity)
+                for other, similarity in category_matches(data, manga_id, ranked, top_k, exclude)
+            )
+
+        results.append((manga_id, best_scores(data, scores, top_k)))
+    return results
+
+
+# ==================== TÍNH TOÁN (TIẾN TRÌNH CON) ====================
+
+def _init_worker(data, config):
+    # Tiến trình con nhận dữ liệu một lần, không cần kết nối DB
+    global _data
+    _data = (data, config)
+
+
+def _compute(manga_ids):
+    data, config = _data
+    weights = (config['TOP_K'], config['CO_READING_WEIGHT'], config['CATEGORY_WEIGHT'])
+    if data.readers is not None:
+        return top_similar_batch(data, manga_ids, *weights)
+    return [(manga_id, top_similar(data, manga_id, *weights)) for manga_id in manga_ids]
+
+
+# ==================== JOB ====================
+
+def touched_mangas(data, since):
+    """Truyện cần tính lại kể từ ``since``"""
+    touched = set(Manga.objects.filter(updated_at__gt=since).values_list('id', flat=True))
+    touched.update(
+        Manga.objects.filter(~Exists(SimilarManga.objects.filter(manga=OuterRef('pk'))))
+        .values_list('id', flat=True)
+    )
+
+    # Cặp người dùng × truyện vừa thêm (theo dõi / đọc) hoặc vừa bị xóa
+    changes = set(Follow.objects.filter(created_at__gt=since).values_list('user_id', 'manga_id'))
+    changes.update(ReadingProgress.objects.filter(updated_at__gt=since).values_list('user_id', 'manga_id'))
+    changes.update(SimilarityChange.objects.filter(created_at__gt=since).values_list('user_id', 'manga_id'))
+
+    # Giao của mọi truyện người đó có với truyện vừa đổi thay đổi
+    for user_id in {user_id for user_id, _ in changes}:
+        touched.update(data.items_by_user.get(user_id, ()))
+
+    # Truyện vừa đổi số người đọc làm đổi mẫu số cosine với mọi truyện đọc chung
+    changed = {manga_id for _, manga_id in changes}
+    touched.update(changed)
+    for manga_id in changed:
+        for user_id in data.users_by_manga.get(manga_id, ()):
+            touched.update(data.items_by_user[user_id])
+
+    # Truyện đã bị xóa không cần tính
+    return touched & set(data.manga_ids)
+
+
+def save_results(results, computed_at):
+    rows = [
+        SimilarManga(manga_id=manga_id, rank=rank, similar_id=other, score=score, computed_at=computed_at)
+        for manga_id, similar in results
+        for rank, (other, score) in enumerate(similar, start=1)
+    ]
+    with transaction.atomic():
+        SimilarManga.objects.filter(manga_id__in=[manga_id for manga_id, _ in results]).delete()
+        SimilarManga.objects.bulk_create(rows)
+
+
+def build(full=False, workers=None, batch_size=200, log=logger.info):
+    """Tính và lưu truyện tương tự, trả về số truyện đã tính lại"""
+    config = get_config()
+    started = timezone.now()
+    data = SimilarityData(config['MAX_USER_ITEMS'])
+
+    since = None if full else SimilarManga.objects.aggregate(last=Max('computed_at'))['last']
+    if since is None:
+        todo = list(data.manga_ids)
+    else:
+        todo = sorted(touched_mangas(data, since))
+    log(f'Cần tính {len(todo)}/{len(data.manga_ids)} truyện')
+
+    batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
+    workers = workers or os.cpu_count() or 2
+    done = 0
+
+    if workers == 1 or len(batches) <= 1:
+        _init_worker(data, config)
+        for batch in batches:
+            save_results(_compute(batch), started)
+            done += len(batch)
+            log(f'Đã tính {done}/{len(todo)} truyện')
+    else:
+        # Tiến trình con không được dùng chung kết nối DB với tiến trình cha
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(data, config)) as pool:
+            for results in pool.map(_compute, batches):
+                save_results(results, started)
+                done += len(results)
+                log(f'Đã tính {done}/{len(todo)} truyện')
+
+    # Các cặp bị xóa trước lúc đọc dữ liệu đã được tính
+    SimilarityChange.objects.filter(created_at__lte=started).delete()
+    return done
@@ -0,0 +1,256 @@
+"""
+Đọc từ replica, ghi vào primary.
+
+``DATABASES['default']`` là primary, các replica được thêm trong settings
+(biến môi trường ``MANGA_DB_REPLICAS``). ``ReplicaRouter`` chỉ gửi query đọc
+sang replica khi đang chạy trong một view đánh dấu ``@read_replica`` (trang
+chủ, tìm kiếm, thể loại, trang truyện, trang đọc); admin, job và các view ghi
+luôn đọc primary.
+
+Replica có thể trễ vài giây so với primary, nên để người dùng thấy ngay thứ
+mình vừa ghi (đánh giá, bình luận, theo dõi...):
+
+* request có ghi DB (hoặc không phải GET/HEAD) được ``StickyPrimaryMiddleware``
+  đặt cookie, các request tiếp theo của người đó đọc primary trong
+  ``STICKY_SECONDS`` giây;
+* trong một request, sau lần ghi đầu tiên hoặc khi đang trong transaction thì
+  mọi query đọc đều đi primary;
+* dữ liệu dựng lại vào cache (mục lục, manifest, chỉ mục tìm kiếm) đọc primary
+  (``use_primary``) để cache không giữ bản cũ của replica.
+
+Replica không kết nối / query được (``OperationalError``): view được chạy lại
+một lần trên primary và replica bị bỏ qua trong ``DOWN_SECONDS`` giây::
+
+    READ_REPLICAS = {
+        'ALIASES': ['replica1'],
+        'STICKY_SECONDS': 15,
+        'COOKIE': 'db_primary',
+        'DOWN_SECONDS': 30,
+    }
+"""
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 15,
+    'COOKIE': 'db_primary',
+    'DOWN_SECONDS': 30,
+}
+
+# Session luôn đọc primary: người dùng vừa đăng nhập không bị coi là khách
+PRIMARY_ONLY_APPS = {'sessions'}
+
+# Trạng thái của request hiện tại: replica đang dùng và đã ghi DB hay chưa.
+# Dùng dict (không gán lại) để luồng của sync_to_async cũng cập nhật được.
+_state = ContextVar('replica_state', default=None)
+
+# Replica vừa lỗi -> thời điểm được thử lại (riêng từng tiến trình)
+_down_until = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+def _new_state():
+    return {'alias': None, 'wrote': False}
+
+
+def is_sticky(request, config=None):
+    """Người dùng vừa ghi dữ liệu: còn trong khoảng thời gian phải đọc primary"""
+    config = config or get_config()
+    try:
+        return float(request.COOKIES.get(config['COOKIE'], 0)) > time.time()
+    except ValueError:
+        return False
+
+
+# ==================== ROUTER ====================
+
+class ReplicaRouter:
+    """Đọc replica trong view ``@read_replica``, mọi thứ khác dùng primary"""
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or state['alias'] is None or state['wrote']:
+            return DEFAULT_DB_ALIAS
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        # Đọc trong transaction phải thấy dữ liệu của chính transaction đó
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return state['alias']
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state['wrote'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replica là bản sao của primary nên object từ hai phía vẫn liên kết được
+        databases = {DEFAULT_DB_ALIAS, *get_config()['ALIASES']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+# ==================== VIEW ====================
+
+def _available(aliases):
+    now = time.monotonic()
+    return [alias for alias in aliases if _down_until.get(alias, 0) <= now]
+
+
+def _enter(request):
+    state = _state.get()
+    token = None
+    if state is None:
+        state = _new_state()
+        token = _state.set(state)
+
+    previous = state['alias']
+    config = get_config()
+    aliases = _available(config['ALIASES'])
+    if aliases and request.method in ('GET', 'HEAD') and not state['wrote'] and not is_sticky(request, config):
+        state['alias'] = random.choice(aliases)
+    return state, previous, token
+
+
+def _exit(state, previous, token):
+    state['alias'] = previous
+    if token is not None:
+        _state.reset(token)
+
+
+def _fail_over(state, error):
+    """
+    Query trên replica lỗi: đánh dấu replica hỏng và chuyển request sang
+    primary. Trả về False nếu không thể chạy lại view (lỗi ở primary, hoặc
+    request đã ghi DB).
+    """
+    alias = state['alias']
+    if alias is None or state['wrote']:
+        return False
+
+    logger.warning('Replica %s lỗi, đọc primary: %s', alias, error)
+    _down_until[alias] = time.monotonic() + get_config()['DOWN_SECONDS']
+    try:
+        connections[alias].close()
+    except Exception:
+        pass
+    state['alias'] = None
+    return True
+
+
+def read_replica(view):
+    """
+    View chỉ đọc: các query đọc đi replica, trừ khi người dùng vừa ghi.
+
+    Đặt trên cùng (ngoài ``conditional_page``) để cả query tính ETag cũng
+    đọc replica. Replica lỗi thì view được chạy lại trên primary. Dùng được
+    cho cả view async (manga/async_views.py).
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            entered = _enter(request)
+            try:
+                try:
+                    return await view(request, *args, **kwargs)
+                except OperationalError as error:
+                    if not _fail_over(entered[0], error):
+                        raise
+                    return await view(request, *args, **kwargs)
+            finally:
+                _exit(*entered)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        entered = _enter(request)
+        try:
+            try:
+                return view(request, *args, **kwargs)
+            except OperationalError as error:
+                if not _fail_over(entered[0], error):
+                    raise
+                return view(request, *args, **kwargs)
+        finally:
+            _exit(*entered)
+    return wrapper
+
+
+@contextmanager
+def use_primary():
+    """Đọc primary trong khối ``with`` (dữ liệu sẽ được cache lâu)"""
+    state = _state.get()
+    if state is None or state['alias'] is None:
+        yield
+        return
+
+    previous = state['alias']
+    state['alias'] = None
+    try:
+        yield
+    finally:
+        state['alias'] = previous
+
+
+# ==================== MIDDLEWARE ====================
+
+class StickyPrimaryMiddleware:
+    """
+    Đặt cookie "đọc primary" sau request có ghi DB. Đặt trước
+    SessionMiddleware để việc lưu session (đăng nhập) cũng được tính.
+    Chạy được cả qua WSGI và ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state = _new_state()
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    async def __acall__(self, request):
+        state = _new_state()
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self.process_response(request, response, state)
+
+    def process_response(self, request, response, state):
+        config = get_config()
+        if config['ALIASES'] and (state['wrote'] or request.method not in ('GET', 'HEAD', 'OPTIONS')):
+            response.set_cookie(
+                config['COOKIE'], str(int(time.time() + config['STICKY_SECONDS'])),
+                max_age=config['STICKY_SECONDS'], httponly=True, samesite='Lax',
+            )
+        return response
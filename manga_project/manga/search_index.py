@@ -0,0 +1,377 @@
+"""
+Bộ máy tìm kiếm truyện.
+
+Chỉ mục ngược (inverted index) được giữ trong bộ nhớ của mỗi tiến trình:
+tiêu đề, tên khác và tên tác giả được bỏ dấu tiếng Việt ("tiến hành" ->
+"tien hanh") rồi tách từ. Truy vấn khớp theo từ đầy đủ hoặc tiền tố, lọc thể
+loại/trạng thái ngay trong chỉ mục, xếp hạng theo độ liên quan kết hợp lượt
+xem và đánh giá.
+
+Khi dữ liệu thay đổi, signal ghi id truyện vào bảng ``SearchIndexChange``
+trong cùng transaction. Trước khi tìm kiếm, mỗi tiến trình đọc các dòng mới
+(một query theo index ``created_at``) và chỉ đánh chỉ mục lại các truyện đó;
+chỉ dựng lại toàn bộ khi có dòng "toàn bộ" (đổi tên tác giả, import hàng
+loạt) hoặc khi tiến trình bỏ lỡ quá lâu. Bảng nằm trong DB nên mọi tiến trình
+(kể cả trên máy khác) đều thấy, không phụ thuộc cache có dùng chung hay không.
+
+Id tự tăng không theo thứ tự commit, nên mỗi lần đọc lấy lùi lại ``OVERLAP``
+giây và bỏ qua các dòng đã áp dụng: transaction commit muộn vẫn không bị sót.
+
+Cấu hình trong settings:
+
+    SEARCH_BACKEND = 'manga.search_index.PythonSearchBackend'
+    SEARCH_INDEX = {
+        'POLL_INTERVAL': 1,     # giây giữa hai lần đọc nhật ký thay đổi
+        'OVERLAP': 60,          # giây, lớn hơn transaction dài nhất + độ lệch đồng hồ
+        'RETENTION': 86400,     # giây giữ nhật ký; tiến trình bỏ lỡ lâu hơn thì dựng lại
+    }
+"""
+import math
+import random
+import re
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .replicas import use_primary
+
+DEFAULTS = {
+    'POLL_INTERVAL': 1,
+    'OVERLAP': 60,
+    'RETENTION': 60 * 60 * 24,
+}
+# Trung bình cứ chừng này lần ghi nhật ký thì xóa các dòng cũ một lần
+PRUNE_EVERY = 1000
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Trọng số theo trường
+FIELD_WEIGHTS = {
+    'title': 3.0,
+    'alternative_title': 2.0,
+    'author': 1.0,
+}
+
+PREFIX_PENALTY = 0.7
+MAX_PREFIX_TERMS = 50
+VIEWS_WEIGHT = 0.1
+RATING_WEIGHT = 0.05
+
+
+def fold(text):
+    """Chữ thường, bỏ dấu tiếng Việt"""
+    text = (text or '').lower().replace('đ', 'd')
+    text = unicodedata.normalize('NFD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(fold(text))
+
+
+def load_documents(manga_ids=None):
+    """Đọc dữ liệu cần đánh chỉ mục: 2 query cho bất kỳ số truyện nào"""
+    from .models import Manga
+
+    mangas = Manga.objects.all()
+    if manga_ids is not None:
+        mangas = mangas.filter(id__in=manga_ids)
+
+    documents = {
+        row['id']: {
+            'id': row['id'],
+            'title': row['title'],
+            'alternative_title': row['alternative_title'],
+            'author': row['author__name'] or '',
+            'status': row['status'],
+            'views': row['views'],
+            'rating': float(row['rating'] or 0),
+            'categories': set(),
+        }
+        for row in mangas.values(
+            'id', 'title', 'alternative_title', 'author__name', 'status', 'views', 'rating'
+        )
+    }
+
+    through = Manga.categories.through.objects.filter(manga_id__in=list(documents))
+    for manga_id, slug in through.values_list('manga_id', 'category__slug'):
+        documents[manga_id]['categories'].add(slug)
+
+    return documents
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'SEARCH_INDEX', {})}
+
+
+class BaseSearchBackend(ABC):
+    """
+    ``synced_at`` / ``seen``: lần đọc nhật ký thay đổi gần nhất và các dòng
+    đã áp dụng trong khoảng OVERLAP (xem ``sync``).
+    """
+
+    def __init__(self):
+        self.synced_at = None
+        self.seen = set()
+        self.sync_lock = threading.Lock()
+
+    @abstractmethod
+    def rebuild(self):
+        """Dựng lại toàn bộ chỉ mục từ DB"""
+
+    @abstractmethod
+    def index(self, documents):
+        """Thêm / cập nhật các truyện (kết quả của ``load_documents``)"""
+
+    @abstractmethod
+    def remove(self, manga_id):
+        """Xóa một truyện khỏi chỉ mục"""
+
+    @abstractmethod
+    def search(self, query, category='', status=''):
+        """Trả về danh sách id truyện đã sắp xếp theo độ liên quan"""
+
+
+class PythonSearchBackend(BaseSearchBackend):
+    """Chỉ mục ngược thuần Python, không cần dịch vụ ngoài"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.postings = defaultdict(dict)  # từ -> {manga_id: trọng số}
+        self.doc_terms = {}                # manga_id -> các từ của truyện
+        self.facets = defaultdict(set)     # ('status', x) / ('category', slug) -> {manga_id}
+        self.doc_facets = {}
+        self.popularity = {}
+        self._terms = None                 # danh sách từ đã sắp xếp, dùng cho tiền tố
+
+    def rebuild(self):
+        # Chỉ mục sống lâu trong bộ nhớ: không dựng từ replica có thể đang trễ
+        with use_primary():
+            documents = load_documents()
+        with self._lock:
+            self._reset()
+            self._index(documents)
+
+    def index(self, documents):
+        with self._lock:
+            self._index(documents)
+
+    def _index(self, documents):
+        for doc in documents.values():
+            self._remove(doc['id'])
+
+            weights = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                for term in tokenize(doc[field]):
+                    weights[term] += weight
+
+            for term, weight in weights.items():
+                self.postings[term][doc['id']] = weight
+            self.doc_terms[doc['id']] = list(weights)
+
+            facets = [('status', doc['status'])] + [('category', slug) for slug in doc['categories']]
+            for facet in facets:
+                self.facets[facet].add(doc['id'])
+            self.doc_facets[doc['id']] = facets
+
+            self.popularity[doc['id']] = (
+                1 + VIEWS_WEIGHT * math.log1p(doc['views']) + RATING_WEIGHT * doc['rating']
+            )
+
+        self._terms = None
+
+    def remove(self, manga_id):
+        with self._lock:
+            self._remove(manga_id)
+
+    def _remove(self, manga_id):
+        for term in self.doc_terms.pop(manga_id, []):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(manga_id, None)
+                if not postings:
+                    del self.postings[term]
+                    self._terms = None
+
+        for facet in self.doc_facets.pop(manga_id, []):
+            self.facets[facet].discard(manga_id)
+
+        self.popularity.pop(manga_id, None)
+
+    def _matching_terms(self, token):
+        """Từ khớp chính xác và các từ có tiền tố là ``token``"""
+        if self._terms is None:
+            self._terms = sorted(self.postings)
+
+        matches = []
+        if token in self.postings:
+            matches.append((token, 1.0))
+
+        index = bisect_left(self._terms, token)
+        while index < len(self._terms) and len(matches) < MAX_PREFIX_TERMS:
+            term = self._terms[index]
+            if not term.startswith(token):
+                break
+            if term != token:
+                matches.append((term, PREFIX_PENALTY))
+            index += 1
+
+        return matches
+
+    def search(self, query, category='', status=''):
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+
+        with self._lock:
+            total = len(self.doc_terms) or 1
+            candidates = None
+            scores = defaultdict(float)
+
+            # Lọc thể loại/trạng thái ngay trong chỉ mục
+            for facet in (('category', category), ('status', status)):
+                if facet[1]:
+                    ids = self.facets.get(facet, set())
+                    candidates = set(ids) if candidates is None else candidates & ids
+
+            # Mọi từ trong truy vấn đều phải khớp (AND)
+            for token in tokens:
+                token_ids = set()
+                for term, factor in self._matching_terms(token):
+                    postings = self.postings[term]
+                    idf = math.log(1 + total / len(postings))
+                    for manga_id, weight in postings.items():
+                        if candidates is None or manga_id in candidates:
+                            scores[manga_id] += weight * idf * factor
+                            token_ids.add(manga_id)
+
+                candidates = token_ids if candidates is None else candidates & token_ids
+                if not candidates:
+                    return []
+
+            ranked = sorted(
+                candidates,
+                key=lambda manga_id: (-scores[manga_id] * self.popularity[manga_id], manga_id),
+            )
+
+        return ranked
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', 'manga.search_index.PythonSearchBackend')
+                _backend = import_string(path)()
+
+    return _backend
+
+
+# ==================== ĐỒNG BỘ GIỮA CÁC TIẾN TRÌNH ====================
+
+def apply_changes(backend, manga_ids):
+    """Đánh chỉ mục lại các truyện từ DB, truyện không còn thì xóa khỏi chỉ mục"""
+    manga_ids = set(manga_ids)
+    with use_primary():
+        documents = load_documents(manga_ids)
+    backend.index(documents)
+    for manga_id in manga_ids - set(documents):
+        backend.remove(manga_id)
+
+
+def sync(backend, force=False):
+    """Áp dụng các thay đổi trong nhật ký (của mọi tiến trình) kể từ lần đọc trước"""
+    from .models import SearchIndexChange
+
+    config = get_config()
+    now = timezone.now()
+    if not force and backend.synced_at is not None and (now - backend.synced_at).total_seconds() < config['POLL_INTERVAL']:
+        return
+
+    with backend.sync_lock:
+        if backend.synced_at is None or (now - backend.synced_at).total_seconds() > config['RETENTION']:
+            # Lần đầu hoặc đã bỏ lỡ phần nhật ký bị xóa. Các dòng trong khoảng
+            # OVERLAP vẫn được áp dụng lại ở lần sau (đánh chỉ mục lại không có hại).
+            backend.rebuild()
+            backend.synced_at = now
+            backend.seen = set()
+            return
+
+        with use_primary():
+            changes = list(
+                SearchIndexChange.objects
+                .filter(created_at__gte=backend.synced_at - timedelta(seconds=config['OVERLAP']))
+                .values_list('id', 'manga_id')
+            )
+        new = [manga_id for change_id, manga_id in changes if change_id not in backend.seen]
+        if None in new:
+            backend.rebuild()
+        elif new:
+            apply_changes(backend, new)
+
+        backend.synced_at = now
+        backend.seen = {change_id for change_id, _ in changes}
+
+
+def record_changes(manga_ids):
+    """
+    Ghi nhật ký thay đổi (trong transaction hiện tại, cùng lúc với dữ liệu).
+    ``None`` trong ``manga_ids``: mọi tiến trình dựng lại toàn bộ chỉ mục.
+    """
+    from .models import SearchIndexChange
+
+    manga_ids = list(dict.fromkeys(manga_ids))
+    if not manga_ids:
+        return
+
+    SearchIndexChange.objects.bulk_create([SearchIndexChange(manga_id=manga_id) for manga_id in manga_ids])
+    if random.randrange(PRUNE_EVERY) == 0:
+        retention = timedelta(seconds=get_config()['RETENTION'])
+        SearchIndexChange.objects.filter(created_at__lt=timezone.now() - retention).delete()
+
+    # Tiến trình hiện tại thấy thay đổi ngay sau commit, không chờ lần đọc nhật ký
+    backend = get_backend()
+    if backend.synced_at is not None:
+        if None in manga_ids:
+            transaction.on_commit(lambda: sync(backend, force=True))
+        else:
+            transaction.on_commit(lambda: apply_changes(backend, manga_ids))
+
+
+def search(query, category='', status=''):
+    backend = get_backend()
+    sync(backend)
+    return backend.search(query, category=category, status=status)
+
+
+def index_mangas(manga_ids):
+    """Cập nhật chỉ mục cho các truyện vừa thay đổi"""
+    record_changes(manga_ids)
+
+
+def remove_manga(manga_id):
+    record_changes([manga_id])
+
+
+def invalidate():
+    """Bắt mọi tiến trình dựng lại chỉ mục ở lần tìm kiếm tiếp theo"""
+    record_changes([None])
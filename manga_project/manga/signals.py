@@ -0,0 +1,191 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save, m2m_changed
+from django.db.models import F
+from django.dispatch import receiver
+
+from .models import (
+    Manga, Chapter, ChapterImage, Author, Category, Rating, Comment, Follow, ReadingProgress, SimilarityChange,
+    UserProfile,
+)
+from . import feed, imaging, manifest, search_index, toc
+from .storage import release_files
+
+
+# ==================== CHAPTER ====================
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def update_manga_chapter_stats(sender, instance, **kwargs):
+    # Giữ các trường latest_chapter_* / chapter_count của truyện luôn đúng
+    Manga.refresh_chapter_stats(instance.manga_id)
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def invalidate_chapter_toc(sender, instance, **kwargs):
+    toc.invalidate(instance.manga_id)
+
+
+@receiver(post_save, sender=Chapter)
+@receiver(post_delete, sender=Chapter)
+def invalidate_chapter_manifest(sender, instance, **kwargs):
+    manifest.invalidate([instance.id])
+
+
+@receiver(post_save, sender=Chapter)
+def count_unread_chapter(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Follow.count_chapter(instance.manga_id, instance.chapter_number, 1)
+
+
+@receiver(post_delete, sender=Chapter)
+def uncount_unread_chapter(sender, instance, **kwargs):
+    Follow.count_chapter(instance.manga_id, instance.chapter_number, -1)
+
+
+@receiver(post_save, sender=Chapter)
+def fan_out_new_chapter(sender, instance, created, raw=False, **kwargs):
+    # Chapter mới -> ghi vào feed của người theo dõi ở luồng nền
+    if created and not raw:
+        feed.schedule_fan_out([instance.pk])
+
+
+# ==================== ẢNH CHAPTER ====================
+@receiver(post_save, sender=ChapterImage)
+def build_chapter_image_variants(sender, instance, created, raw=False, **kwargs):
+    # Ảnh mới (CRUD, admin, inline) -> tạo bản WebP nhiều kích thước ở luồng nền
+    if created and not raw and instance.image:
+        imaging.schedule_variants([instance.pk])
+
+
+@receiver(post_save, sender=ChapterImage)
+@receiver(post_delete, sender=ChapterImage)
+def invalidate_page_manifest(sender, instance, **kwargs):
+    manifest.invalidate([instance.chapter_id])
+
+
+# ==================== FILE MEDIA ====================
+# Trường file của từng model: file cũ trả lại tham chiếu khi bị thay (manga/storage.py)
+FILE_FIELDS = {Manga: 'cover_image', ChapterImage: 'image', UserProfile: 'avatar'}
+
+
+@receiver(pre_save, sender=Manga)
+@receiver(pre_save, sender=ChapterImage)
+@receiver(pre_save, sender=UserProfile)
+def find_replaced_file(sender, instance, raw=False, update_fields=None, **kwargs):
+    instance._replaced_file = None
+    field_name = FILE_FIELDS[sender]
+    if raw or instance._state.adding or (update_fields is not None and field_name not in update_fields):
+        return
+
+    # File mới upload (chưa ghi) luôn thêm một tham chiếu, kể cả khi trùng nội dung với file cũ
+    file = getattr(instance, field_name)
+    old = sender._base_manager.filter(pk=instance.pk).values_list(field_name, flat=True).first()
+    if old and (old != file.name or not file._committed):
+        instance._replaced_file = old
+
+
+@receiver(post_save, sender=Manga)
+@receiver(post_save, sender=ChapterImage)
+@receiver(post_save, sender=UserProfile)
+def release_replaced_file(sender, instance, **kwargs):
+    old = getattr(instance, '_replaced_file', None)
+    if old:
+        instance._replaced_file = None
+        release_files(getattr(instance, FILE_FIELDS[sender]).storage, [old])
+
+
+@receiver(post_delete, sender=ChapterImage)
+def release_chapter_image_files(sender, instance, **kwargs):
+    release_files(instance.image.storage, [instance.image.name, *(instance.variants or {}).values()])
+
+
+@receiver(post_delete, sender=Manga)
+def release_manga_cover(sender, instance, **kwargs):
+    release_files(instance.cover_image.storage, [instance.cover_image.name])
+
+
+# ==================== ĐÁNH GIÁ ====================
+@receiver(post_delete, sender=Rating)
+def subtract_deleted_rating(sender, instance, **kwargs):
+    # Xóa đánh giá (admin, xóa user): trừ lại khỏi tổng điểm của truyện
+    Manga.apply_rating_change(instance.manga_id, -instance.score, -1)
+
+
+# ==================== THEO DÕI ====================
+@receiver(post_delete, sender=Follow)
+def clear_unfollowed_feed(sender, instance, **kwargs):
+    feed.remove_manga(instance.user_id, instance.manga_id)
+
+
+# ==================== TRUYỆN TƯƠNG TỰ ====================
+@receiver(post_delete, sender=Follow)
+@receiver(post_delete, sender=ReadingProgress)
+def record_similarity_change(sender, instance, **kwargs):
+    # Bỏ theo dõi / xóa tiến độ đọc làm đổi điểm đọc chung: ghi lại để job tính lại
+    SimilarityChange.objects.create(user_id=instance.user_id, manga_id=instance.manga_id)
+
+
+# ==================== BÌNH LUẬN ====================
+def change_comment_counts(comment, delta):
+    # Không cho số đếm âm (cột UNSIGNED trên MySQL)
+    def apply(queryset, field):
+        if delta < 0:
+            queryset = queryset.filter(**{f'{field}__gte': -delta})
+        queryset.update(**{field: F(field) + delta})
+
+    if comment.chapter_id:
+        apply(Chapter.objects.filter(id=comment.chapter_id), 'comment_count')
+    else:
+        apply(Manga.objects.filter(id=comment.manga_id), 'comment_count')
+    if comment.root_id:
+        apply(Comment.objects.filter(id=comment.root_id), 'reply_count')
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_comment_counts(instance, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comment_counts(instance, -1)
+
+
+# ==================== CHỈ MỤC TÌM KIẾM ====================
+@receiver(post_save, sender=Manga)
+def index_manga(sender, instance, **kwargs):
+    search_index.index_mangas([instance.pk])
+
+
+@receiver(post_delete, sender=Manga)
+def unindex_manga(sender, instance, **kwargs):
+    search_index.remove_manga(instance.pk)
+
+
+@receiver(m2m_changed, sender=Manga.categories.through)
+def reindex_manga_categories(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        search_index.index_mangas([instance.pk])
+    elif pk_set:
+        search_index.index_mangas(pk_set)
+    else:
+        search_index.invalidate()
+
+
+@receiver(post_save, sender=Author)
+def reindex_author_mangas(sender, instance, created, raw=False, **kwargs):
+    # Tên tác giả nằm trong chỉ mục của từng truyện
+    if not created and not raw:
+        search_index.index_mangas(Manga.objects.filter(author=instance).values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def reindex_category_mangas(sender, instance, raw=False, **kwargs):
+    # Slug thể loại là facet trong chỉ mục; trước khi xóa còn đọc được các truyện của thể loại
+    if not raw and instance.pk:
+        search_index.index_mangas(instance.mangas.values_list('id', flat=True))
+
@@ -0,0 +1,213 @@
+"""
+Storage lưu file theo nội dung (content-addressed) để không trùng lặp ảnh.
+
+Tên file là SHA-256 của nội dung, chia thư mục theo 4 ký tự đầu:
+
+    chapters/p001.jpg  ->  chapters/3f/a9/3fa9...e1.jpg
+
+Upload lại cùng một ảnh chỉ trả về tên file đã có, không ghi thêm. Vì nhiều
+bản ghi có thể trỏ chung một file, số tham chiếu của mỗi file được giữ trong
+bảng ``MediaFile`` (tra theo tên, có index):
+
+* ``save()`` thêm một tham chiếu trong transaction hiện tại, cùng lúc với bản
+  ghi sẽ trỏ tới file, rồi mới kiểm tra / ghi file;
+* ``delete()`` trả lại một tham chiếu và chỉ xóa file khi không còn ai dùng.
+
+Cả hai khóa dòng của file tới hết transaction, nên upload chưa commit và lệnh
+xóa cùng một file không chen nhau: file không bị xóa mất ngay trước khi bản
+ghi mới trỏ tới nó được commit.
+
+Luồng / tiến trình phụ (nạp ZIP, nhập hàng loạt) ghi file bằng
+``save_unreferenced()`` rồi tiến trình chính gọi ``add_references()`` trong
+transaction tạo bản ghi và kiểm tra lại file (xem manga/ingest.py).
+"""
+import hashlib
+import os
+import re
+import uuid
+from collections import Counter
+
+from django.apps import apps
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+
+HASH_NAME_RE = re.compile(r'^(?:[^/]+/)?([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}(\.[a-z0-9]+)?$')
+
+# Các trường chứa tên file trong storage: (model, trường)
+REFERENCES = [
+    ('manga.ChapterImage', 'image'),
+    ('manga.ChapterImage', 'variants'),  # JSON {độ rộng: tên file}
+    ('manga.Manga', 'cover_image'),
+    ('manga.UserProfile', 'avatar'),
+]
+
+
+def file_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seekable') and content.seekable():
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+    if hasattr(content, 'seekable') and content.seekable():
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, digest):
+    """Tên theo nội dung, giữ thư mục gốc (chapters/, covers/, ...) và phần mở rộng"""
+    namespace, sep, _ = name.replace('\\', '/').partition('/')
+    ext = os.path.splitext(name)[1].lower()
+    path = f'{digest[:2]}/{digest[2:4]}/{digest}{ext}'
+    return f'{namespace}/{path}' if sep else path
+
+
+def is_hashed_name(name):
+    return bool(HASH_NAME_RE.match(name))
+
+
+# ==================== THAM CHIẾU ====================
+
+def _media_files():
+    return apps.get_model('manga', 'MediaFile')._default_manager
+
+
+def count_references(name):
+    """Số tham chiếu tới file ``name``"""
+    return _media_files().filter(name=name).values_list('references', flat=True).first() or 0
+
+
+def add_references(names):
+    """
+    Thêm tham chiếu cho các file (mỗi lần một tên xuất hiện là một tham chiếu)
+    trong transaction hiện tại. Các dòng bị khóa tới hết transaction.
+    """
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+
+    files = _media_files()
+    with transaction.atomic():
+        files.bulk_create([files.model(name=name) for name in counts], ignore_conflicts=True)
+        # Khóa theo thứ tự tên để hai transaction không khóa chéo nhau
+        list(files.select_for_update().filter(name__in=counts).order_by('name').values_list('id', flat=True))
+
+        by_delta = {}
+        for name, count in counts.items():
+            by_delta.setdefault(count, []).append(name)
+        for delta, group in by_delta.items():
+            files.filter(name__in=group).update(references=F('references') + delta)
+
+
+def release_files(storage, names):
+    """Sau commit, mỗi tên trả lại một tham chiếu; file còn bản ghi khác dùng vẫn được giữ"""
+    names = [name for name in names if name]
+    if names:
+        transaction.on_commit(lambda: [storage.delete(name) for name in names])
+
+
+def count_all_references():
+    """Đếm lại tham chiếu từ các bảng trong REFERENCES: {tên file: số bản ghi}"""
+    counts = Counter()
+    for model_label, field_name in REFERENCES:
+        model = apps.get_model(model_label)
+        is_json = model._meta.get_field(field_name).get_internal_type() == 'JSONField'
+
+        values = model._default_manager.values_list(field_name, flat=True)
+        for value in values.iterator(chunk_size=2000):
+            if is_json:
+                counts.update(name for name in (value or {}).values() if name)
+            elif value:
+                counts[value] += 1
+    return counts
+
+
+def rebuild_references(batch_size=1000):
+    """
+    Dựng lại bảng MediaFile từ dữ liệu thật (sau dedup_media hoặc khi số đếm
+    bị lệch). Chạy khi không có upload đang dở.
+    """
+    counts = count_all_references()
+    files = _media_files()
+    with transaction.atomic():
+        files.all().delete()
+        files.bulk_create(
+            (files.model(name=name, references=count) for name, count in counts.items()),
+            batch_size=batch_size,
+        )
+    return counts
+
+
+# ==================== STORAGE ====================
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def _hashed(self, name, content):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        return hashed_name(self.generate_filename(name), file_hash(content)), content
+
+    def save(self, name, content, max_length=None):
+        name, content = self._hashed(name, content)
+        # Giữ chỗ trước khi kiểm tra file: delete() đang chạy với cùng file phải xong trước
+        with transaction.atomic():
+            add_references([name])
+            if self.exists(name):
+                return name
+            return super().save(name, content, max_length=max_length)
+
+    def save_unreferenced(self, name, content, max_length=None):
+        """
+        Chỉ ghi file, không thêm tham chiếu (dùng ở luồng / tiến trình phụ).
+        Người gọi phải ``add_references`` trong transaction tạo bản ghi rồi
+        kiểm tra lại ``exists``, vì file có thể vừa bị xóa.
+        """
+        name, content = self._hashed(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # Cùng tên nghĩa là cùng nội dung: ghi đè cũng không sao
+        if is_hashed_name(name):
+            return name
+        return super().get_available_name(name, max_length=max_length)
+
+    def _save(self, name, content):
+        if not is_hashed_name(name):
+            return super()._save(name, content)
+
+        # Ghi ra file tạm rồi đổi tên nguyên tử, để người đọc không bao giờ
+        # thấy file ghi dở khi hai request cùng upload một ảnh
+        tmp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(tmp_name), self.path(name))
+        return name
+
+    def delete(self, name):
+        """Trả lại một tham chiếu, xóa file khi không còn ai dùng"""
+        files = _media_files()
+        with transaction.atomic():
+            media = files.select_for_update().filter(name=name).first()
+            if media is not None and media.references > 1:
+                files.filter(pk=media.pk).update(references=F('references') - 1)
+                return
+            if media is not None:
+                media.delete()
+            super().delete(name)
+
+    def discard(self, name):
+        """
+        Xóa file vừa ghi nhưng bản ghi không được tạo (transaction đã rollback
+        cùng tham chiếu): chỉ xóa khi không có ai khác tham chiếu.
+        """
+        files = _media_files()
+        with transaction.atomic():
+            media = files.select_for_update().filter(name=name).first()
+            if media is not None and media.references > 0:
+                return
+            if media is not None:
+                media.delete()
+            super().delete(name)
@@ -0,0 +1,39 @@
+"""
+Thẻ ``<img>`` ảnh bìa dùng chung cho mọi trang danh sách truyện.
+
+Kích thước đặt sẵn (không giật trang khi ảnh tải xong) và ảnh mờ làm nền
+trong lúc chờ (xem manga/imaging.py). Ảnh ngoài màn hình đầu tiên tải lười;
+ảnh nằm trong màn hình đầu tiên (``eager``) tải ngay với độ ưu tiên cao::
+
+    {% load covers %}
+    {% manga_cover manga eager=True %}
+    {% manga_cover manga position=forloop.counter0 %}
+    {% manga_cover src=item.cover_url alt=item.manga_title width=item.cover_width ... %}
+"""
+from django import template
+
+register = template.Library()
+
+# Số ảnh đầu tiên của lưới truyện nằm trong màn hình đầu tiên
+EAGER_COVERS = 6
+
+
+@register.inclusion_tag('manga/cover.html')
+def manga_cover(manga=None, eager=False, position=None, **attrs):
+    """
+    ``manga``: object Manga; dữ liệu dạng dict (feed) thì truyền thẳng
+    src / alt / width / height / placeholder. ``position``: vị trí trong lưới
+    (forloop.counter0), EAGER_COVERS ảnh đầu được coi là ``eager``.
+    """
+    if manga is not None:
+        attrs = {
+            'src': manga.cover_image.url,
+            'alt': manga.title,
+            'width': manga.cover_width,
+            'height': manga.cover_height,
+            'placeholder': manga.cover_placeholder,
+            **attrs,
+        }
+    if position is not None and position < EAGER_COVERS:
+        eager = True
+    return {**attrs, 'eager': eager}
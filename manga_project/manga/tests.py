@@ -1,3 +1,2137 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.db import IntegrityError, OperationalError, connection, connections, router
+from django.db.models import F
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    async_views, feed, imaging, importer, ingest, reading_progress, recommendations, replicas, search_index, toc,
+    trending, view_counter, views,
+)
+from . import comments as thread_comments
+from .benchmark import DatasetSeeder, LoadRunner
+from .instrumentation import RequestProfileMiddleware, assert_query_budget, profile
+from .media import parse_range
+from .pagination import KeysetPaginator, SequencePaginator, encode_cursor
+from .reading_progress import write_progress
+from .storage import count_references, rebuild_references
+from .models import (
+    Author, Category, Chapter, ChapterImage, Comment, FeedEntry, Follow, Manga, MediaFile, Rating,
+    ReadingProgress, SearchIndexChange, SimilarManga, SimilarityChange, TrendingEntry, ViewCount,
+)
+
+# Không ghi log đo request trong khi chạy test
+quiet = override_settings(INSTRUMENTATION={'LOG': False})
+
+
+# Lượt xem/tiến độ đọc ghi ngay trong request (trong transaction của test): không
+# còn gì đọng lại trong bộ đệm chung để luồng nền hoặc atexit ghi sau khi DB test
+# đã bị xóa
+immediate_writes = override_settings(
+    VIEW_COUNTER={**getattr(settings, 'VIEW_COUNTER', {}), 'FLUSH_INTERVAL': 0},
+    READING_PROGRESS={**getattr(settings, 'READING_PROGRESS', {}), 'FLUSH_INTERVAL': 0},
+)
+# Ghi theo lô như production (đo số query của trang, tải đồng thời); test dùng
+# phải gọi stop_buffers trước khi kết thúc
+deferred_writes = override_settings(
+    VIEW_COUNTER={**getattr(settings, 'VIEW_COUNTER', {}), 'FLUSH_INTERVAL': 60},
+    READING_PROGRESS={**getattr(settings, 'READING_PROGRESS', {}), 'FLUSH_INTERVAL': 60},
+)
+
+
+def stop_buffers():
+    # Ghi nốt các bộ đệm và dừng luồng ghi nền (tự chạy lại khi có dữ liệu mới)
+    view_counter.get_view_counter().stop()
+    reading_progress.get_buffer().stop()
+
+
+def setUpModule():
+    immediate_writes.enable()
+
+
+def tearDownModule():
+    immediate_writes.disable()
+
+
+# ==================== LƯỢT XEM ====================
+class ViewCounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        cls.chapter = Chapter.objects.create(manga=cls.manga, chapter_number=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def record(self, counter):
+        for _ in range(3):
+            counter.incr((view_counter.MANGA, self.manga.id, timezone.localdate()))
+        counter.incr((view_counter.CHAPTER, self.chapter.id, timezone.localdate()), 2)
+
+    def assertViews(self, manga_views, chapter_views):
+        self.manga.refresh_from_db()
+        self.chapter.refresh_from_db()
+        self.assertEqual((self.manga.views, self.chapter.views), (manga_views, chapter_views))
+        daily = ViewCount.objects.filter(manga=self.manga, date=timezone.localdate()).values_list('count', flat=True)
+        self.assertEqual(list(daily), [manga_views])
+
+    def test_memory_flush_in_one_batch(self):
+        counter = view_counter.MemoryViewCounter(flush_interval=60)
+        self.record(counter)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counter.flush(), 5)
+        self.assertViews(3, 2)
+        self.assertLessEqual(len(queries), 8)
+        self.assertEqual(counter.flush(), 0)
+
+    def test_failed_write_is_kept(self):
+        counter = view_counter.MemoryViewCounter(flush_interval=60)
+        self.record(counter)
+        with mock.patch.object(view_counter, 'write_view_counts', side_effect=RuntimeError), \
+                self.assertLogs('manga.buffering', 'ERROR'):
+            self.assertEqual(counter.flush(), 0)
+        self.assertEqual(counter.flush(), 5)
+        self.assertViews(3, 2)
+
+    def test_failing_batch_is_dropped(self):
+        counter = view_counter.MemoryViewCounter(flush_interval=60)
+        self.record(counter)
+        with mock.patch.object(view_counter, 'write_view_counts', side_effect=TypeError), \
+                self.assertLogs('manga.buffering', 'ERROR') as logs:
+            for _ in range(counter.max_failures):
+                self.assertEqual(counter.flush(), 0)
+        self.assertIn('bỏ 5 mục', logs.output[-1])
+        self.assertEqual(counter.flush(), 0)
+        self.manga.refresh_from_db()
+        self.assertEqual(self.manga.views, 0)
+        self.assertFalse(ViewCount.objects.exists())
+
+    def test_transient_errors_are_always_retried(self):
+        counter = view_counter.MemoryViewCounter(flush_interval=60)
+        self.record(counter)
+        with mock.patch.object(view_counter, 'write_view_counts', side_effect=OperationalError), \
+                self.assertLogs('manga.buffering', 'ERROR'):
+            for _ in range(counter.max_failures * 2):
+                counter.flush()
+        self.assertEqual(counter.flush(), 5)
+        self.assertViews(3, 2)
+
+    def test_cache_counter_shared_between_processes(self):
+        # Hai đối tượng dùng chung cache giống hai tiến trình
+        first = view_counter.CacheViewCounter(flush_interval=60)
+        second = view_counter.CacheViewCounter(flush_interval=60)
+        self.record(first)
+        self.record(second)
+
+        self.assertEqual(second.flush(), 10)
+        self.assertEqual(first.flush(), 0)
+        self.assertViews(6, 4)
+
+        # Lượt xem mới của khóa đã flush vẫn được đếm tiếp
+        first.incr((view_counter.MANGA, self.manga.id, timezone.localdate()))
+        self.assertEqual(first.flush(), 1)
+        self.assertViews(7, 4)
+
+    def test_cache_counter_skips_while_locked(self):
+        counter = view_counter.CacheViewCounter(flush_interval=60)
+        self.record(counter)
+        cache.add(counter._key('lock'), 1)
+        self.assertEqual(counter.flush(), 0)
+        cache.delete(counter._key('lock'))
+        self.assertEqual(counter.flush(), 5)
+
+    @quiet
+    def test_prefetch_is_not_counted(self):
+        self.client.force_login(User.objects.create_user('reader'))
+        url = f'/manga/{self.manga.slug}/{self.chapter.slug}/'
+        with mock.patch.object(view_counter, 'record_chapter_view') as record_view, \
+                mock.patch.object(reading_progress, 'record_progress') as record_progress:
+            for header in ('Sec-Purpose', 'Purpose'):
+                response = self.client.get(url, headers={header: 'prefetch'})
+                self.assertEqual(response.status_code, 200)
+            self.assertFalse(record_view.called)
+            self.assertFalse(record_progress.called)
+
+            self.client.get(url)
+            record_view.assert_called_once_with(self.chapter.id)
+            record_progress.assert_called_once_with(mock.ANY, self.manga.id, self.chapter.id)
+
+    @quiet
+    def test_reader_prefetches_manifest_not_page(self):
+        Chapter.objects.create(manga=self.manga, chapter_number=2)
+        response = self.client.get(f'/manga/{self.manga.slug}/{self.chapter.slug}/')
+        self.assertContains(response, 'data-next-manifest=')
+        self.assertNotContains(response, 'data-next-url=')
+        self.assertNotContains(response, "rel = 'prefetch'")
+
+
+# ==================== BẢNG XẾP HẠNG ====================
+@quiet
+@override_settings(TRENDING_WINDOWS=[1, 7], TRENDING_SIZE=2)
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mangas = [
+            Manga.objects.create(title=title, description='-', cover_image='covers/cover.jpg') for title in 'ABC'
+        ]
+        today = timezone.localdate()
+        # (truyện, số ngày trước, lượt xem): A nhiều lượt trong một ngày, B đều nhiều ngày
+        for index, days_ago, count in ((0, 0, 50), (1, 0, 10), (1, 2, 30), (1, 5, 30), (2, 0, 5), (2, 40, 500)):
+            ViewCount.objects.create(manga=cls.mangas[index], date=today - timedelta(days=days_ago), count=count)
+
+    def ranking(self, days):
+        return [(manga.title, manga.window_views) for manga in trending.get_trending(days, limit=10)]
+
+    def test_windows_sum_view_counts(self):
+        trending.refresh_all()
+        self.assertEqual(self.ranking(1), [('A', 50), ('B', 10)])
+        self.assertEqual(self.ranking(7), [('B', 70), ('A', 50)])
+
+    def test_custom_window_and_refresh_replaces(self):
+        call_command('refresh_trending', window=[3, 90], size=3, stdout=StringIO())
+        self.assertEqual(self.ranking(3), [('A', 50), ('B', 40), ('C', 5)])
+        self.assertEqual(self.ranking(90), [('C', 505), ('B', 70), ('A', 50)])
+
+        ViewCount.objects.filter(manga=self.mangas[2]).delete()
+        trending.refresh_window(90, size=3)
+        self.assertEqual(self.ranking(90), [('B', 70), ('A', 50)])
+        self.assertEqual(TrendingEntry.objects.filter(window_days=90).count(), 2)
+
+    def test_home_does_not_read_view_counts(self):
+        trending.refresh_all()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/')
+        self.assertContains(response, 'B')
+        self.assertFalse([query for query in queries if 'manga_viewcount' in query['sql']])
+
+
+# ==================== CHAPTER MỚI NHẤT TÍNH SẴN ====================
+@quiet
+class LatestChapterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+
+    def assertLatest(self, number, count):
+        self.manga.refresh_from_db()
+        self.assertEqual((self.manga.latest_chapter_number, self.manga.chapter_count), (number, count))
+
+    def test_kept_current_by_chapter_changes(self):
+        self.assertLatest(None, 0)
+        first = Chapter.objects.create(manga=self.manga, chapter_number=1)
+        second = Chapter.objects.create(manga=self.manga, chapter_number=2.5)
+        self.assertLatest(2.5, 2)
+        self.assertEqual(self.manga.latest_chapter_slug, second.slug)
+        self.assertEqual(self.manga.latest_chapter_at, second.created_at)
+
+        first.chapter_number = 3
+        first.save()
+        self.assertLatest(3, 2)
+
+        first.delete()
+        self.assertLatest(2.5, 1)
+        second.delete()
+        self.assertLatest(None, 0)
+        self.assertEqual(self.manga.latest_chapter_slug, '')
+
+    def test_backfill_command(self):
+        Chapter.objects.create(manga=self.manga, chapter_number=1)
+        Chapter.objects.create(manga=self.manga, chapter_number=2)
+        Manga.objects.filter(id=self.manga.id).update(chapter_count=0, latest_chapter_number=None)
+
+        call_command('backfill_chapter_stats', batch_size=1, stdout=StringIO())
+        self.assertLatest(2, 2)
+
+    def test_home_query_count_does_not_grow_with_chapters(self):
+        for number in range(1, 4):
+            Chapter.objects.create(manga=self.manga, chapter_number=number)
+        other = Manga.objects.create(title='Other', description='-', cover_image='covers/cover.jpg')
+
+        with CaptureQueriesContext(connection) as before:
+            self.client.get('/')
+        for number in range(1, 30):
+            Chapter.objects.create(manga=other, chapter_number=number)
+        cache.clear()
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get('/')
+
+        self.assertEqual(len(after), len(before))
+        self.assertContains(response, 'Chapter 29')
+
+
+# ==================== MỤC LỤC CHAPTER ====================
+@quiet
+class ChapterTOCTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manga = Manga.objects.create(title='Manga', slug='manga', description='-', cover_image='covers/cover.jpg')
+        cls.chapters = {
+            number: Chapter.objects.create(manga=cls.manga, chapter_number=number) for number in (1, 2, 2.5, 10)
+        }
+
+    def setUp(self):
+        cache.clear()
+
+    def test_next_and_previous(self):
+        manga_toc = toc.get_toc(self.manga.id)
+        self.assertEqual(manga_toc.next_of(2).chapter_number, 2.5)
+        self.assertEqual(manga_toc.previous_of(2.5).chapter_number, 2)
+        self.assertEqual(manga_toc.next_of(2.5).id, self.chapters[10].id)
+        self.assertIsNone(manga_toc.previous_of(1))
+        self.assertIsNone(manga_toc.next_of(10))
+        # Số không có trong mục lục (chapter vừa bị xóa) vẫn tìm được hàng xóm
+        self.assertEqual(manga_toc.next_of(3).chapter_number, 10)
+        self.assertEqual(manga_toc.previous_of(3).chapter_number, 2.5)
+        self.assertEqual(manga_toc.count_after(2), 2)
+
+    def test_cached_and_invalidated(self):
+        toc.get_toc(self.manga.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(len(toc.get_toc(self.manga.id)), 4)
+
+        Chapter.objects.create(manga=self.manga, chapter_number=11)
+        self.assertEqual(toc.get_toc(self.manga.id).next_of(10).chapter_number, 11)
+        self.chapters[2.5].delete()
+        self.assertEqual(toc.get_toc(self.manga.id).next_of(2).chapter_number, 10)
+
+    def test_reader_and_json(self):
+        response = self.client.get('/manga/manga/manga-chapter-2-5/')
+        self.assertContains(response, f'href="/manga/manga/{self.chapters[2].slug}/" class="nav-btn prev-btn"')
+        self.assertContains(response, f'href="/manga/manga/{self.chapters[10].slug}/" class="nav-btn next-btn"')
+        self.assertContains(response, 'Chapter 2,5')
+
+        response = self.client.get(f'/api/manga/{self.manga.id}/chapters/')
+        self.assertEqual(
+            response.json()['chapters'],
+            [[1, 'manga-chapter-1', '1,0'], [2, 'manga-chapter-2', '2,0'],
+             [2.5, 'manga-chapter-2-5', '2,5'], [10, 'manga-chapter-10', '10,0']],
+        )
+        self.assertEqual(self.client.get(
+            f'/api/manga/{self.manga.id}/chapters/', HTTP_IF_NONE_MATCH=response['ETag'],
+        ).status_code, 304)
+
+
+# ==================== TÌM KIẾM ====================
+@quiet
+@override_settings(SEARCH_INDEX={'POLL_INTERVAL': 0, 'OVERLAP': 60, 'RETENTION': 3600})
+class SearchIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.action = Category.objects.create(name='Hành động', slug='hanh-dong')
+        author = Author.objects.create(name='Nguyễn Văn Tiến')
+        cls.first = Manga.objects.create(title='Tiến Hành Ca', description='-', cover_image='covers/cover.jpg')
+        cls.second = Manga.objects.create(
+            title='Đảo Hải Tặc', alternative_title='One Piece', author=author,
+            description='-', cover_image='covers/cover.jpg', status='completed',
+        )
+        cls.second.categories.add(cls.action)
+
+    def setUp(self):
+        # Mỗi backend giống chỉ mục trong bộ nhớ của một tiến trình web
+        self.backend = search_index.PythonSearchBackend()
+        search_index.sync(self.backend)
+
+    def search(self, query, **filters):
+        return self.backend.search(query, **filters)
+
+    def test_folding_prefix_and_filters(self):
+        self.assertEqual(self.search('tien hanh'), [self.first.id])
+        self.assertEqual(self.search('dao hai'), [self.second.id])
+        self.assertEqual(self.search('one pi'), [self.second.id])
+        # Tiêu đề xếp trên tên tác giả
+        self.assertEqual(self.search('tien'), [self.first.id, self.second.id])
+        self.assertEqual(self.search('tien', category='hanh-dong'), [self.second.id])
+        self.assertEqual(self.search('tien', status='ongoing'), [self.first.id])
+        self.assertEqual(self.search(''), [])
+
+    def test_other_process_applies_only_changed_mangas(self):
+        self.first.title = 'Vua Hải Tặc'
+        self.first.save()
+        with mock.patch.object(self.backend, 'rebuild') as rebuild:
+            search_index.sync(self.backend)
+        rebuild.assert_not_called()
+        self.assertCountEqual(self.search('hai tac'), [self.second.id, self.first.id])
+
+        # Dòng đã áp dụng không được áp dụng lại
+        with mock.patch.object(search_index, 'apply_changes') as apply_changes:
+            search_index.sync(self.backend)
+        apply_changes.assert_not_called()
+
+        self.second.delete()
+        search_index.sync(self.backend)
+        self.assertEqual(self.search('hai tac'), [self.first.id])
+
+    def test_late_commit_within_overlap_is_applied(self):
+        Manga.objects.filter(id=self.first.id).update(title='Ngọc Rồng')
+        # Transaction bắt đầu trước lần đọc trước, commit sau
+        SearchIndexChange.objects.create(manga_id=self.first.id, created_at=self.backend.synced_at - timedelta(seconds=5))
+        search_index.sync(self.backend)
+        self.assertEqual(self.search('ngoc rong'), [self.first.id])
+
+    def test_author_and_category_changes(self):
+        author = self.second.author
+        author.name = 'Oda'
+        author.save()
+        search_index.sync(self.backend)
+        self.assertEqual(self.search('oda'), [self.second.id])
+
+        self.action.delete()
+        search_index.sync(self.backend)
+        self.assertEqual(self.search('hai', category='hanh-dong'), [])
+
+    def test_full_rebuild_marker_and_stale_process(self):
+        Manga.objects.filter(id=self.first.id).update(title='Ngọc Rồng')
+        search_index.invalidate()
+        with mock.patch.object(self.backend, 'rebuild', wraps=self.backend.rebuild) as rebuild:
+            search_index.sync(self.backend)
+        rebuild.assert_called_once()
+        self.assertEqual(self.search('ngoc'), [self.first.id])
+
+        # Tiến trình bỏ lỡ lâu hơn RETENTION dựng lại toàn bộ
+        self.backend.synced_at -= timedelta(hours=2)
+        with mock.patch.object(self.backend, 'rebuild') as rebuild:
+            search_index.sync(self.backend)
+        rebuild.assert_called_once()
+
+    def test_search_view(self):
+        response = self.client.get('/search/', {'q': 'tien hanh'})
+        self.assertContains(response, 'Tiến Hành Ca')
+        self.assertNotContains(response, 'Đảo Hải Tặc')
+
+
+# ==================== PHÂN TRANG THEO CON TRỎ ====================
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Nhiều truyện trùng lượt xem: id phải phân xử thứ tự giữa các dòng bằng nhau
+        for index, views_count in enumerate([5, 5, 5, 3, 3, 1, 1]):
+            Manga.objects.create(
+                title=f'Truyện {index}', description='-', cover_image='covers/cover.jpg', views=views_count,
+            )
+        cls.expected = list(Manga.objects.order_by('-views', 'id').values_list('id', flat=True))
+
+    def paginator(self, ordering=('-views', 'id'), per_page=3, **kwargs):
+        return KeysetPaginator(Manga.objects.all(), ordering, per_page, **kwargs)
+
+    def ids(self, page):
+        return [manga.id for manga in page]
+
+    def test_forward_and_backward_walk(self):
+        paginator = self.paginator()
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+
+        self.assertEqual([page.number for page in pages], [1, 2, 3])
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum((self.ids(page) for page in pages), []), self.expected)
+        self.assertFalse(pages[0].has_previous())
+        self.assertIsNone(pages[0].previous_cursor)
+        self.assertIsNone(pages[-1].next_cursor)
+
+        # Lùi từ trang cuối về đúng các trang đã đi qua
+        page = pages[-1]
+        for expected in reversed(pages[:-1]):
+            page = paginator.get_page(page.previous_cursor)
+            self.assertEqual(self.ids(page), self.ids(expected))
+            self.assertEqual(page.number, expected.number)
+            self.assertTrue(page.has_next())
+        self.assertFalse(page.has_previous())
+
+    def test_exact_multiple_of_page_size(self):
+        paginator = self.paginator(per_page=7)
+        page = paginator.get_page()
+        self.assertEqual(self.ids(page), self.expected)
+        self.assertFalse(page.has_other_pages())
+        self.assertEqual(paginator.num_pages, 1)
+
+    def test_datetime_cursor_keeps_microseconds(self):
+        paginator = self.paginator(ordering=('-created_at', 'id'), per_page=2)
+        expected = list(Manga.objects.order_by('-created_at', 'id').values_list('id', flat=True))
+        page, seen = paginator.get_page(), []
+        while True:
+            seen += self.ids(page)
+            if not page.has_next():
+                break
+            page = paginator.get_page(page.next_cursor)
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        paginator = self.paginator()
+        first = self.ids(paginator.get_page())
+        for cursor in ['!!!', 'e30', encode_cursor([1, 2]), encode_cursor({'v': [5], 'd': 'n', 'p': 2}),
+                       encode_cursor({'v': ['x', 'y'], 'd': 'n', 'p': 2})]:
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual(self.ids(page), first)
+                self.assertEqual(page.number, 1)
+                self.assertFalse(page.has_previous())
+
+    def test_cursor_past_the_end(self):
+        last = Manga.objects.order_by('-views', 'id').last()
+        page = self.paginator().get_page(encode_cursor({'v': [last.views, last.id], 'd': 'n', 'p': 4}))
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_next())
+
+    def test_count_limit(self):
+        paginator = self.paginator(count_limit=5)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertEqual(self.paginator(count_limit=7).count, 7)
+        self.assertTrue(self.paginator(count_limit=7).count_is_exact)
+
+
+class SequencePaginatorTests(SimpleTestCase):
+    def test_pages_and_clamping(self):
+        paginator = SequencePaginator(list(range(7)), per_page=3)
+        first = paginator.get_page()
+        self.assertEqual(list(first), [0, 1, 2])
+        last = paginator.get_page(paginator.get_page(first.next_cursor).next_cursor)
+        self.assertEqual((list(last), last.number, last.has_next()), ([6], 3, False))
+        self.assertEqual(list(paginator.get_page(last.previous_cursor)), [3, 4, 5])
+
+        # Số trang vượt quá hoặc hỏng được đưa về trong khoảng hợp lệ
+        self.assertEqual(paginator.get_page(encode_cursor({'p': 99})).number, 3)
+        self.assertEqual(paginator.get_page(encode_cursor({'p': -1})).number, 1)
+        self.assertEqual(paginator.get_page(encode_cursor({'p': 'x'})).number, 1)
+        self.assertEqual(paginator.get_page('%%%').number, 1)
+
+    def test_empty_sequence(self):
+        page = SequencePaginator([], per_page=3).get_page()
+        self.assertEqual(len(page), 0)
+        self.assertFalse(page.has_other_pages())
+        self.assertIsNone(page.next_cursor)
+
+
+# ==================== ẢNH WEBP NHIỀU KÍCH THƯỚC ====================
+def make_png(size, mode='RGB'):
+    buffer = BytesIO()
+    image = Image.new(mode, size)
+    image.save(buffer, 'PNG', **({'transparency': 0} if mode == 'P' else {}))
+    return buffer.getvalue()
+
+
+@quiet
+@override_settings(IMAGE_VARIANT_WIDTHS=[480, 800, 1200], IMAGE_VARIANTS_ASYNC=False)
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def save(self, size, mode='RGB'):
+        return default_storage.save('chapters/page.png', ContentFile(make_png(size, mode)))
+
+    def open_variant(self, name):
+        with default_storage.open(name, 'rb') as f:
+            image = Image.open(f)
+            image.load()
+        return image
+
+    def test_widths_never_upscale(self):
+        fields = imaging.build_variants(self.save((1000, 400)))
+        self.assertEqual(list(fields['variants']), ['480', '800', '1000'])
+        for width, name in fields['variants'].items():
+            image = self.open_variant(name)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (int(width), int(width) * 2 // 5))
+        self.assertEqual((fields['width'], fields['height']), (1000, 400))
+        self.assertTrue(fields['placeholder'].startswith('data:image/webp;base64,'))
+        self.assertGreater(fields['file_size'], 0)
+
+    def test_narrow_image_keeps_only_original_width(self):
+        fields = imaging.build_variants(self.save((300, 900)))
+        self.assertEqual(list(fields['variants']), ['300'])
+        self.assertEqual(self.open_variant(fields['variants']['300']).size, (300, 900))
+
+    def test_palette_transparency_is_kept(self):
+        fields = imaging.build_variants(self.save((600, 200), mode='P'))
+        self.assertEqual(self.open_variant(fields['variants']['480']).mode, 'RGBA')
+
+    def test_new_chapter_image_gets_variants_after_commit(self):
+        manga = Manga.objects.create(title='Truyện ảnh', description='-', cover_image='covers/cover.jpg')
+        chapter = Chapter.objects.create(manga=manga, chapter_number=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            page = ChapterImage.objects.create(
+                chapter=chapter, page_number=1, image=ContentFile(make_png((900, 300)), name='1.png'),
+            )
+        page.refresh_from_db()
+        self.assertEqual(list(page.variants), ['480', '800', '900'])
+        self.assertEqual((page.width, page.height), (900, 300))
+        self.assertRegex(page.webp_srcset, r'^\S+ 480w, \S+ 800w, \S+ 900w$')
+
+    def test_broken_image_is_skipped(self):
+        manga = Manga.objects.create(title='Truyện lỗi', description='-', cover_image='covers/cover.jpg')
+        chapter = Chapter.objects.create(manga=manga, chapter_number=1)
+        broken = ChapterImage.objects.create(
+            chapter=chapter, page_number=1, image=ContentFile(b'not an image', name='1.png'),
+        )
+        good = ChapterImage.objects.create(
+            chapter=chapter, page_number=2, image=ContentFile(make_png((500, 100)), name='2.png'),
+        )
+        with self.assertLogs('manga.imaging', 'ERROR'):
+            imaging.generate_variants([broken.id, good.id])
+        broken.refresh_from_db()
+        good.refresh_from_db()
+        self.assertEqual(broken.variants, {})
+        self.assertEqual(list(good.variants), ['480', '500'])
+
+
+# ==================== NẠP ẢNH CHAPTER ====================
+def make_zip(members):
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zip_ref:
+        for name, content in members.items():
+            zip_ref.writestr(name, content)
+    buffer.seek(0)
+    return buffer
+
+
+@quiet
+@override_settings(IMAGE_VARIANTS_ASYNC=False)
+class IngestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manga = Manga.objects.create(title='Truyện nạp ảnh', description='-', cover_image='covers/cover.jpg')
+        cls.chapter = Chapter.objects.create(manga=cls.manga, chapter_number=1.5)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def stored_files(self):
+        return [
+            os.path.relpath(os.path.join(root, name), self.media_root)
+            for root, _, names in os.walk(self.media_root) for name in names
+        ]
+
+    def test_zip_pages_in_natural_order(self):
+        archive = make_zip({
+            'p10.png': make_png((10, 10)), 'p2.png': make_png((20, 10)), 'p1.jpg': make_png((30, 10)),
+            '__MACOSX/._p1.jpg': b'x', '.hidden.png': b'x', 'notes.txt': b'x',
+        })
+        report = ingest.ingest_zip(self.chapter, archive)
+
+        self.assertEqual(report.pages, 3)
+        pages = list(self.chapter.images.values_list('page_number', 'image'))
+        self.assertEqual([page for page, _ in pages], [1, 2, 3])
+        self.assertEqual([os.path.splitext(name)[1] for _, name in pages], ['.jpg', '.png', '.png'])
+        self.assertCountEqual(self.stored_files(), report.files)
+
+        # Lần nạp sau nối tiếp sau trang cuối
+        ingest.ingest_zip(self.chapter, make_zip({'extra.png': make_png((40, 10))}))
+        self.assertEqual(self.chapter.images.latest('page_number').page_number, 4)
+
+    def test_failed_page_removes_written_files(self):
+        archive = make_zip({f'{index}.png': make_png((index, 10)) for index in range(1, 6)})
+        storage = ChapterImage._meta.get_field('image').storage
+        save = storage.save_unreferenced
+
+        def flaky_save(name, content, *args, **kwargs):
+            if content.name == '3.png':
+                raise OSError('disk full')
+            return save(name, content, *args, **kwargs)
+
+        with mock.patch.object(storage, 'save_unreferenced', side_effect=flaky_save):
+            with self.assertRaises(OSError):
+                ingest.ingest_zip(self.chapter, archive)
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(self.chapter.images.exists())
+
+    def test_failed_insert_removes_written_files(self):
+        ChapterImage.objects.bulk_create([ChapterImage(chapter=self.chapter, image='chapters/old.png', page_number=2)])
+        archive = make_zip({'a.png': make_png((10, 10)), 'b.png': make_png((20, 10))})
+        with self.assertRaises(IntegrityError):
+            ingest.ingest_zip(self.chapter, archive, start_page=1)
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(MediaFile.objects.exists())
+        self.assertEqual(self.chapter.images.count(), 1)
+
+    def test_chapter_create_rolls_back_on_bad_zip(self):
+        User.objects.create_user('admin', password='pw', is_staff=True)
+        self.client.login(username='admin', password='pw')
+        response = self.client.post(f'/crud/manga/{self.manga.id}/chapter/create/', {
+            'chapter_number': '2',
+            'images': [ContentFile(make_png((10, 10)), name='1.png')],
+            'zip_file': ContentFile(b'not a zip', name='pages.zip'),
+        })
+        self.assertRedirects(response, f'/crud/manga/{self.manga.id}/chapter/create/', fetch_redirect_response=False)
+        self.assertFalse(Chapter.objects.filter(manga=self.manga, chapter_number=2).exists())
+        self.assertEqual(self.stored_files(), [])
+
+
+# ==================== NHẬP HÀNG LOẠT ====================
+@quiet
+@override_settings(FEED={'ASYNC': False})
+class CatalogImporterTests(TransactionTestCase):
+    """Importer tự mở / đóng kết nối DB nên dữ liệu phải được commit thật"""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(shutil.rmtree, self.root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        entries = []
+        for index, title in enumerate(['Truyện Một', 'Truyện Hai'], start=1):
+            for chapter in (1, 2):
+                chapter_dir = os.path.join(self.root, f'manga-{index}', f'chapter-{chapter}')
+                os.makedirs(chapter_dir)
+                for page in (1, 2):
+                    with open(os.path.join(chapter_dir, f'{page}.png'), 'wb') as f:
+                        f.write(make_png((10 * index + chapter, 10 + page)))
+            entries.append({'path': f'manga-{index}', 'title': title, 'categories': ['Hành động']})
+        with open(os.path.join(self.root, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+
+        # Tiến trình con không thấy DB / MEDIA_ROOT của test: chép file bằng thread
+        pool = mock.patch.object(importer, 'ProcessPoolExecutor', ThreadPoolExecutor)
+        pool.start()
+        self.addCleanup(pool.stop)
+
+    def run_importer(self):
+        catalog = importer.CatalogImporter(self.root, workers=2, batch_size=1, log=lambda message: None)
+        catalog.run()
+        return catalog
+
+    def read_state(self):
+        with open(os.path.join(self.root, '.import_state.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    def write_state(self, state):
+        with open(os.path.join(self.root, '.import_state.json'), 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+
+    def test_import_and_rerun(self):
+        catalog = self.run_importer()
+        self.assertEqual(len(catalog.updated), 2)
+        self.assertEqual(Manga.objects.count(), 2)
+        self.assertEqual(ChapterImage.objects.count(), 8)
+        for manga in Manga.objects.all():
+            self.assertEqual(manga.chapter_count, 2)
+            self.assertEqual(list(manga.categories.values_list('name', flat=True)), ['Hành động'])
+        state = self.read_state()
+        self.assertEqual((state['touched'], state['new_chapters'], state['pending_chapters']), ([], [], []))
+
+        self.assertEqual(self.run_importer().updated, [])
+        self.assertEqual(Manga.objects.count(), 2)
+        self.assertEqual(Chapter.objects.count(), 4)
+
+    def test_committed_batches_are_not_duplicated(self):
+        self.run_importer()
+        # Giả lập bị ngắt ngay sau commit: trạng thái chỉ còn phần "pending" của lô
+        state = self.read_state()
+        mangas = dict(Manga.objects.values_list('id', 'slug'))
+        state['pending_mangas'] = {
+            path: [mangas[manga_id], Manga.objects.get(id=manga_id).title]
+            for path, manga_id in state.pop('mangas').items()
+        }
+        state['pending_chapters'] = state.pop('chapters')
+        self.write_state(state)
+        Manga.objects.update(chapter_count=0)
+
+        catalog = self.run_importer()
+        self.assertEqual(Manga.objects.count(), 2)
+        self.assertEqual(Chapter.objects.count(), 4)
+        self.assertEqual(len(catalog.updated), 2)
+        self.assertEqual(set(Manga.objects.values_list('chapter_count', flat=True)), {2})
+
+    def test_touched_mangas_survive_interrupted_finish(self):
+        with mock.patch.object(importer.CatalogImporter, 'finish', side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                self.run_importer()
+        self.assertEqual(len(self.read_state()['touched']), 2)
+        self.assertEqual(len(self.read_state()['new_chapters']), 4)
+        Manga.objects.update(chapter_count=0)
+
+        catalog = self.run_importer()
+        self.assertEqual(len(catalog.updated), 2)
+        self.assertEqual(set(Manga.objects.values_list('chapter_count', flat=True)), {2})
+
+
+# ==================== THAM CHIẾU FILE MEDIA ====================
+class MediaReferenceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        manga = Manga.objects.create(title='Truyện dùng chung ảnh', description='-', cover_image='covers/cover.jpg')
+        cls.chapter = Chapter.objects.create(manga=manga, chapter_number=1)
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, IMAGE_VARIANTS_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.storage = ChapterImage._meta.get_field('image').storage
+
+    def save(self, content=b'page'):
+        return self.storage.save('chapters/page.png', ContentFile(content))
+
+    def test_save_and_delete_count_references(self):
+        name = self.save()
+        self.assertEqual(self.save(), name)
+        with self.assertNumQueries(1):
+            self.assertEqual(count_references(name), 2)
+
+        self.storage.delete(name)
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(count_references(name), 1)
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+
+    def test_discard_keeps_referenced_files(self):
+        shared = self.save(b'shared')
+        self.assertEqual(self.storage.save_unreferenced('chapters/x.png', ContentFile(b'shared')), shared)
+        self.storage.discard(shared)
+        self.assertTrue(self.storage.exists(shared))
+
+        unused = self.storage.save_unreferenced('chapters/x.png', ContentFile(b'unused'))
+        self.storage.discard(unused)
+        self.assertFalse(self.storage.exists(unused))
+
+    def test_deleted_rows_release_files_after_commit(self):
+        name = self.save()
+        self.save()
+        first = ChapterImage.objects.create(chapter=self.chapter, page_number=1, image=name)
+        second = ChapterImage.objects.create(chapter=self.chapter, page_number=2, image=name)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.storage.exists(name))
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.storage.exists(name))
+
+    def test_replaced_cover_releases_old_file(self):
+        manga = Manga.objects.create(
+            title='Đổi bìa', description='-', cover_image=ContentFile(make_png((30, 40)), name='a.png'),
+        )
+        old = manga.cover_image.name
+        self.assertEqual(count_references(old), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            manga.cover_image = ContentFile(make_png((40, 30)), name='b.png')
+            manga.save()
+        new = manga.cover_image.name
+        self.assertNotEqual(new, old)
+        self.assertEqual((count_references(old), count_references(new)), (0, 1))
+        self.assertFalse(self.storage.exists(old))
+        self.assertTrue(self.storage.exists(new))
+
+        # Upload lại cùng nội dung: tên không đổi, vẫn một tham chiếu
+        with self.captureOnCommitCallbacks(execute=True):
+            manga.cover_image = ContentFile(make_png((40, 30)), name='c.png')
+            manga.save()
+        self.assertEqual(manga.cover_image.name, new)
+        self.assertEqual(count_references(new), 1)
+
+        # Lưu lại không đổi ảnh, hoặc chỉ cập nhật trường khác: không trả tham chiếu
+        with self.captureOnCommitCallbacks(execute=True):
+            manga.save()
+            manga.title = 'Đổi tên'
+            manga.save(update_fields=['title'])
+        self.assertEqual(count_references(new), 1)
+        self.assertTrue(self.storage.exists(new))
+
+    def test_regenerated_variants_release_old_files(self):
+        name = self.storage.save('chapters/page.png', ContentFile(make_png((1200, 800))))
+        with self.captureOnCommitCallbacks(execute=True):
+            chapter_image = ChapterImage.objects.create(chapter=self.chapter, page_number=1, image=name)
+        chapter_image.refresh_from_db()
+        variants = list(chapter_image.variants.values())
+        self.assertTrue(variants)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            imaging.generate_variants([chapter_image.id])
+        for variant in variants:
+            self.assertEqual(count_references(variant), 1)
+            self.assertTrue(self.storage.exists(variant))
+
+    def test_ingest_claims_references_and_rewrites_removed_files(self):
+        archive = make_zip({'1.png': make_png((10, 10)), '2.png': make_png((20, 10))})
+        save = self.storage.save_unreferenced
+        lost = set()
+
+        def save_then_lose(name, content, *args, **kwargs):
+            # Bản ghi cuối cùng dùng file bị xóa ngay sau lần ghi đầu, trước khi giữ chỗ
+            name = save(name, content, *args, **kwargs)
+            if name not in lost:
+                lost.add(name)
+                os.remove(self.storage.path(name))
+            return name
+
+        with mock.patch.object(self.storage, 'save_unreferenced', side_effect=save_then_lose):
+            report = ingest.ingest_zip(self.chapter, archive)
+        for name in report.files:
+            self.assertTrue(self.storage.exists(name))
+            self.assertEqual(count_references(name), 1)
+
+    def test_rebuild_matches_rows(self):
+        name = self.save()
+        ChapterImage.objects.bulk_create([
+            ChapterImage(chapter=self.chapter, page_number=page, image=name, variants={'480': name})
+            for page in (1, 2)
+        ])
+        counts = rebuild_references()
+        self.assertEqual(counts[name], 4)
+        self.assertEqual(count_references(name), 4)
+        self.assertEqual(count_references('covers/cover.jpg'), 1)
+
+
+# ==================== ẢNH BÌA ====================
+@quiet
+class CoverMarkupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.mangas = [
+            Manga.objects.create(
+                title=f'Bìa {index}', description='-', cover_image='covers/cover.jpg',
+                cover_width=300, cover_height=450, cover_placeholder='data:image/webp;base64,AAAA',
+            )
+            for index in range(8)
+        ]
+
+    def test_home_loads_first_row_eagerly(self):
+        response = self.client.get('/')
+        self.assertContains(response, 'loading="eager" fetchpriority="high"', count=6)
+        self.assertContains(response, 'width="300" height="450"', count=8)
+        self.assertContains(response, 'url(data:image/webp;base64,AAAA)', count=8)
+
+    def test_detail_cover_is_eager(self):
+        response = self.client.get(f'/manga/{self.mangas[0].slug}/')
+        self.assertContains(response, 'alt="Bìa 0" loading="eager" fetchpriority="high" width="300"', count=1)
+
+    def test_dict_items(self):
+        html = Template('{% load covers %}{% manga_cover src=src alt="Bìa" %}').render(Context({'src': '/media/x.jpg'}))
+        self.assertHTMLEqual(html, '<img src="/media/x.jpg" alt="Bìa" loading="lazy">')
+
+
+# ==================== CONDITIONAL GET ====================
+@quiet
+@override_settings(CONDITIONAL_GET_WINDOW=300)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Hành động')
+        cls.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        cls.manga.categories.add(cls.category)
+        cls.chapter = Chapter.objects.create(manga=cls.manga, chapter_number=1)
+        cls.reader = User.objects.create_user('reader')
+
+    def setUp(self):
+        cache.clear()
+        self.urls = [
+            '/',
+            f'/manga/{self.manga.slug}/',
+            f'/manga/{self.manga.slug}/{self.chapter.slug}/',
+            f'/category/{self.category.slug}/',
+        ]
+
+    def revalidate(self, url, **headers):
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        return first, self.client.get(url, headers={'If-None-Match': first['ETag'], **headers})
+
+    def test_unchanged_pages_return_304(self):
+        for url in self.urls:
+            with self.subTest(url=url):
+                first, second = self.revalidate(url)
+                self.assertIn('Last-Modified', first)
+                self.assertIn('no-cache', first['Cache-Control'])
+                self.assertIn('Cookie', first['Vary'])
+                self.assertEqual(second.status_code, 304)
+                self.assertEqual(second['ETag'], first['ETag'])
+                self.assertEqual(second.content, b'')
+
+    def test_if_modified_since(self):
+        first = self.client.get(f'/manga/{self.manga.slug}/')
+        second = self.client.get(f'/manga/{self.manga.slug}/', headers={'If-Modified-Since': first['Last-Modified']})
+        self.assertEqual(second.status_code, 304)
+
+    def test_not_modified_skips_render(self):
+        url = f'/manga/{self.manga.slug}/{self.chapter.slug}/'
+        etag = self.client.get(url)['ETag']
+        # Lượt xem vẫn được đếm nhưng ghi theo lô, không nằm trong số query của request
+        with deferred_writes, mock.patch.object(views, 'render') as render, self.assertNumQueries(1):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(render.called)
+
+    def test_changes_invalidate_etag(self):
+        url = f'/manga/{self.manga.slug}/'
+        changes = [
+            lambda: Comment.objects.create(user=self.reader, manga=self.manga, content='Hay'),
+            lambda: Chapter.objects.create(manga=self.manga, chapter_number=2),
+            lambda: Manga.objects.filter(pk=self.manga.pk).update(rating_sum=F('rating_sum') + 5, rating_count=1),
+        ]
+        for change in changes:
+            etag = self.client.get(url)['ETag']
+            change()
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+
+    def test_time_window_bounds_view_counts(self):
+        url = f'/manga/{self.manga.slug}/'
+        etag = self.client.get(url)['ETag']
+        later = time.time() + 301
+        with mock.patch('manga.conditional.time.time', return_value=later):
+            response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_not_modified_still_counts_view(self):
+        first = self.client.get(f'/manga/{self.manga.slug}/{self.chapter.slug}/')
+        with mock.patch.object(view_counter, 'record_chapter_view') as record:
+            response = self.client.get(
+                f'/manga/{self.manga.slug}/{self.chapter.slug}/', headers={'If-None-Match': first['ETag']},
+            )
+            self.assertEqual(response.status_code, 304)
+            record.assert_called_once_with(self.chapter.id)
+
+            self.client.get(
+                f'/manga/{self.manga.slug}/{self.chapter.slug}/',
+                headers={'If-None-Match': first['ETag'], 'Sec-Purpose': 'prefetch'},
+            )
+            record.assert_called_once()
+
+    def test_logged_in_users_always_render(self):
+        self.client.force_login(self.reader)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url, headers={'If-None-Match': '*'})
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn('ETag', response)
+
+    def test_missing_object_renders_404(self):
+        response = self.client.get('/manga/khong-co/', headers={'If-None-Match': '*'})
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+# ==================== ĐÁNH GIÁ ====================
+@quiet
+class RatingAggregateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        cls.users = [User.objects.create_user(f'reader{i}') for i in range(3)]
+
+    def rate(self, user, score):
+        self.client.force_login(user)
+        return self.client.post(f'/rate/{self.manga.id}/', {'score': score})
+
+    def assertRating(self, total, count, rating):
+        self.manga.refresh_from_db()
+        self.assertEqual((self.manga.rating_sum, self.manga.rating_count), (total, count))
+        self.assertEqual(self.manga.rating, Decimal(rating))
+
+    def test_new_changed_and_repeated_votes(self):
+        self.rate(self.users[0], 8)
+        self.rate(self.users[1], 5)
+        self.assertRating(13, 2, '6.50')
+
+        self.rate(self.users[1], 9)
+        self.assertRating(17, 2, '8.50')
+
+        self.rate(self.users[1], 9)
+        self.assertRating(17, 2, '8.50')
+        self.assertEqual(Rating.objects.count(), 2)
+
+    def test_invalid_score_is_ignored(self):
+        self.rate(self.users[0], 11)
+        self.rate(self.users[0], 0)
+        self.assertRating(0, 0, '0')
+
+    def test_vote_does_not_scan_ratings(self):
+        self.rate(self.users[0], 7)
+        with CaptureQueriesContext(connection) as queries:
+            self.rate(self.users[1], 10)
+        self.assertFalse([query for query in queries if 'AVG(' in query['sql'] or 'SUM(' in query['sql']])
+        self.assertRating(17, 2, '8.50')
+
+    def test_deleting_ratings_subtracts(self):
+        for user, score in zip(self.users, (10, 6, 3)):
+            self.rate(user, score)
+        Rating.objects.get(user=self.users[0]).delete()
+        self.assertRating(9, 2, '4.50')
+
+        # Xóa user xóa luôn đánh giá của họ
+        self.users[1].delete()
+        self.assertRating(3, 1, '3.00')
+
+        Rating.objects.all().delete()
+        self.assertRating(0, 0, '0')
+
+    def test_reconcile_fixes_drift(self):
+        self.rate(self.users[0], 8)
+        self.rate(self.users[1], 4)
+        Manga.objects.filter(pk=self.manga.pk).update(rating_sum=100, rating_count=1, rating=Decimal('9.99'))
+        other = Manga.objects.create(title='Khác', description='-', cover_image='covers/cover.jpg')
+
+        out = StringIO()
+        call_command('reconcile_ratings', batch_size=1, stdout=out)
+        self.assertIn('Đã sửa 1 truyện', out.getvalue())
+        self.assertRating(12, 2, '6.00')
+        other.refresh_from_db()
+        self.assertEqual((other.rating_sum, other.rating_count), (0, 0))
+
+        self.assertEqual(Manga.reconcile_ratings([self.manga.id, other.id]), 0)
+
+
+# ==================== LỊCH SỬ ĐỌC ====================
+@quiet
+class ReadingHistoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.mangas = [
+            Manga.objects.create(title=f'Manga {i}', description='-', cover_image='covers/cover.jpg')
+            for i in range(3)
+        ]
+        cls.chapters = {
+            (manga.id, number): Chapter.objects.create(manga=manga, chapter_number=number)
+            for manga in cls.mangas for number in (1, 2)
+        }
+
+    def setUp(self):
+        # Bộ đệm riêng, không có luồng nền: chỉ ghi khi test gọi write_progress
+        self.buffer = reading_progress.MemoryProgressBuffer(flush_interval=60)
+        patcher = mock.patch.object(reading_progress, '_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client.force_login(self.reader)
+
+    def record(self, manga, number, page=1):
+        reading_progress.record_progress(self.reader.id, manga.id, self.chapters[(manga.id, number)].id, page)
+
+    def test_history_merges_pending_without_writing(self):
+        first, second, third = self.mangas
+        self.record(first, 1)
+        self.record(second, 1)
+        write_progress(self.buffer.drain())
+
+        self.record(second, 2, page=7)
+        self.record(third, 1)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/user/history/')
+        self.assertFalse([query for query in queries if not query['sql'].startswith('SELECT')])
+
+        history = response.context['history']
+        self.assertEqual([item.manga for item in history], [third, second, first])
+        self.assertEqual((history[1].chapter.chapter_number, history[1].page), (2, 7))
+        self.assertContains(response, f'/manga/{second.slug}/{history[1].chapter.slug}/#page-7')
+
+        # Bộ đệm vẫn giữ nguyên để luồng nền ghi theo lô
+        self.assertEqual(set(self.buffer.pending_for_user(self.reader.id)), {second.id, third.id})
+        self.assertEqual(ReadingProgress.objects.filter(user=self.reader).count(), 2)
+
+    def test_pending_of_other_users_and_deleted_chapters_are_ignored(self):
+        other = User.objects.create_user('other')
+        reading_progress.record_progress(other.id, self.mangas[0].id, self.chapters[(self.mangas[0].id, 1)].id)
+        self.record(self.mangas[1], 2)
+        self.chapters[(self.mangas[1].id, 2)].delete()
+
+        history = reading_progress.get_history(self.reader.id)
+        self.assertEqual(history, [])
+
+    def test_limit(self):
+        for manga in self.mangas:
+            self.record(manga, 1)
+        history = reading_progress.get_history(self.reader.id, limit=2)
+        self.assertEqual([item.manga for item in history], self.mangas[:0:-1])
+
+    def test_upsert_without_conflict_target(self):
+        # MySQL (ON DUPLICATE KEY UPDATE) báo NotSupportedError nếu truyền unique_fields
+        manga = self.mangas[0]
+        pending = {(self.reader.id, manga.id): (self.chapters[(manga.id, 1)].id, 1, timezone.now())}
+        for supported in (True, False):
+            with self.subTest(supports_update_conflicts_with_target=supported), \
+                    mock.patch.object(connection.features, 'supports_update_conflicts_with_target', supported), \
+                    mock.patch.object(ReadingProgress.objects, 'bulk_create') as bulk_create:
+                write_progress(pending)
+            options = bulk_create.call_args.kwargs
+            self.assertTrue(options['update_conflicts'])
+            self.assertEqual(options.get('unique_fields'), ['user', 'manga'] if supported else None)
+
+
+# ==================== BÌNH LUẬN ====================
+@quiet
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader')
+        cls.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        cls.chapter = Chapter.objects.create(manga=cls.manga, chapter_number=1)
+
+    def comment(self, content, parent=None, chapter=None):
+        return Comment.objects.create(
+            user=self.reader, manga=self.manga, chapter=chapter, content=content, parent=parent,
+        )
+
+    def test_page_loads_in_two_queries(self):
+        for index in range(3):
+            root = self.comment(f'Gốc {index}')
+            reply = self.comment('Trả lời', parent=root)
+            self.comment('Trả lời lồng', parent=reply)
+
+        with self.assertNumQueries(2):
+            page = thread_comments.get_thread_page(self.manga.id)
+            for comment in page:
+                for reply in comment.thread_replies:
+                    reply.user.username
+        self.assertEqual([len(comment.thread_replies) for comment in page], [2, 2, 2])
+
+        # Không có trả lời: không query luồng
+        Comment.objects.filter(root__isnull=False).delete()
+        with self.assertNumQueries(1):
+            thread_comments.get_thread_page(self.manga.id)
+
+    def test_replies_in_tree_order_with_depth(self):
+        root = self.comment('Gốc')
+        first = self.comment('1', parent=root)
+        second = self.comment('2', parent=root)
+        nested = self.comment('1.1', parent=first)
+        deeper = nested
+        for index in range(4):
+            deeper = self.comment(f'sâu {index}', parent=deeper)
+
+        page = thread_comments.get_thread_page(self.manga.id)
+        replies = page[0].thread_replies
+        self.assertEqual([reply.content for reply in replies][:3], ['1', '1.1', 'sâu 0'])
+        self.assertEqual(replies[-1], second)
+        self.assertEqual([reply.depth for reply in replies], [1, 2, 3, 4, 4, 4, 1])
+        self.assertTrue(all(reply.root_id == root.id for reply in replies))
+
+    def test_long_thread_is_truncated(self):
+        root = self.comment('Gốc')
+        parent = self.comment('đầu', parent=root)
+        for index in range(4):
+            self.comment(f'{index}', parent=parent)
+
+        page = thread_comments.get_thread_page(self.manga.id, replies_per_thread=3)
+        self.assertEqual(len(page[0].thread_replies), 3)
+        self.assertEqual(page[0].hidden_replies, 2)
+
+        # Cha nằm ngoài phần đã tải: trả lời được gắn vào bình luận gốc
+        page = thread_comments.get_thread_page(self.manga.id, replies_per_thread=1)
+        self.assertEqual(page[0].thread_replies, [parent])
+        Comment.objects.filter(pk=parent.pk).update(created_at=timezone.now() + timedelta(days=1))
+        page = thread_comments.get_thread_page(self.manga.id, replies_per_thread=1)
+        self.assertEqual(page[0].thread_replies[0].depth, 1)
+
+    def test_cursor_pages_and_separate_chapter_threads(self):
+        roots = [self.comment(f'Gốc {index}') for index in range(5)]
+        self.comment('Ở chapter', chapter=self.chapter)
+
+        first = thread_comments.get_thread_page(self.manga.id, per_page=3)
+        second = thread_comments.get_thread_page(self.manga.id, cursor=first.next_cursor, per_page=3)
+        self.assertEqual(list(first) + list(second), roots[::-1])
+        self.assertFalse(second.has_next())
+
+        chapter_page = thread_comments.get_thread_page(self.manga.id, chapter_id=self.chapter.id)
+        self.assertEqual([comment.content for comment in chapter_page], ['Ở chapter'])
+
+    def test_counts_follow_creates_and_deletes(self):
+        root = self.comment('Gốc')
+        reply = self.comment('Trả lời', parent=root)
+        self.comment('Lồng', parent=reply)
+        self.comment('Ở chapter', chapter=self.chapter)
+
+        root.refresh_from_db()
+        self.manga.refresh_from_db()
+        self.chapter.refresh_from_db()
+        self.assertEqual((root.reply_count, self.manga.comment_count, self.chapter.comment_count), (2, 3, 1))
+
+        reply.delete()
+        root.refresh_from_db()
+        self.manga.refresh_from_db()
+        self.assertEqual((root.reply_count, self.manga.comment_count), (0, 1))
+
+    def test_refresh_counts_after_bulk_create(self):
+        root = self.comment('Gốc')
+        Comment.objects.bulk_create([
+            Comment(user=self.reader, manga=self.manga, content='Trả lời', parent=root, root=root),
+            Comment(user=self.reader, manga=self.manga, chapter=self.chapter, content='Ở chapter'),
+        ])
+        thread_comments.refresh_counts([self.manga.id])
+
+        root.refresh_from_db()
+        self.manga.refresh_from_db()
+        self.chapter.refresh_from_db()
+        self.assertEqual((root.reply_count, self.manga.comment_count, self.chapter.comment_count), (1, 2, 1))
+
+    def test_add_comment_checks_page(self):
+        self.client.force_login(self.reader)
+        url = f'/comment/{self.manga.id}/'
+        root = self.comment('Gốc')
+        other = Manga.objects.create(title='Khác', description='-', cover_image='covers/cover.jpg')
+        other_chapter = Chapter.objects.create(manga=other, chapter_number=1)
+
+        response = self.client.post(url, {'content': 'Trả lời', 'parent_id': root.id})
+        self.assertRedirects(response, f'/manga/{self.manga.slug}/#comments', fetch_redirect_response=False)
+        self.assertEqual(Comment.objects.get(content='Trả lời').root, root)
+
+        response = self.client.post(url, {'content': 'Hay', 'chapter_id': self.chapter.id})
+        self.assertRedirects(
+            response, f'/manga/{self.manga.slug}/{self.chapter.slug}/#comments', fetch_redirect_response=False,
+        )
+
+        # Chapter của truyện khác, trả lời sang chapter khác với bình luận cha
+        self.assertEqual(self.client.post(url, {'content': 'x', 'chapter_id': other_chapter.id}).status_code, 404)
+        response = self.client.post(url, {'content': 'x', 'chapter_id': self.chapter.id, 'parent_id': root.id})
+        self.assertEqual(response.status_code, 404)
+
+        self.client.post(url, {'content': '   '})
+        self.assertEqual(Comment.objects.filter(manga=self.manga).count(), 3)
+
+
+# ==================== VIEW ASYNC ====================
+@quiet
+@override_settings(ROOT_URLCONF='manga_project.asgi_urls')
+class AsyncViewTests(TransactionTestCase):
+    """
+    Các query của view async chạy ở luồng khác với kết nối DB riêng, nên dùng
+    TransactionTestCase để dữ liệu đã commit và các luồng đều thấy.
+    """
+
+    # Replica cấu hình qua MANGA_DB_REPLICAS (mirror của DB test) cũng được đọc
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user('reader')
+        category = Category.objects.create(name='Hành động')
+        self.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        self.manga.categories.add(category)
+        self.chapters = [Chapter.objects.create(manga=self.manga, chapter_number=number) for number in (1, 2, 3)]
+        ChapterImage.objects.bulk_create(
+            ChapterImage(chapter=self.chapters[1], page_number=page, image='chapters/page.jpg') for page in (1, 2)
+        )
+        root = Comment.objects.create(user=self.reader, manga=self.manga, content='Hay')
+        Comment.objects.create(user=self.reader, manga=self.manga, content='Đồng ý', parent=root)
+
+        # Ghi phụ chỉ được ghi nhận, không ghi DB từ luồng nền
+        for target, name in ((view_counter, 'record_manga_view'), (view_counter, 'record_chapter_view'),
+                             (reading_progress, 'record_progress')):
+            patcher = mock.patch.object(target, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+
+    async def wait_background(self):
+        await asyncio.gather(*list(async_views._background_tasks), return_exceptions=True)
+
+    def urls(self):
+        chapter = self.chapters[1]
+        return ['/', f'/manga/{self.manga.slug}/', f'/manga/{self.manga.slug}/{chapter.slug}/']
+
+    async def test_same_context_as_sync_views(self):
+        context_keys = [
+            ['latest_manga', 'top_today', 'top_week', 'top_month', 'categories'],
+            ['manga', 'chapters', 'is_following', 'continue_reading', 'comments', 'similar', 'avg_rating'],
+            ['chapter', 'manga', 'pages', 'preload_pages', 'page_sizes', 'next_chapter', 'prev_chapter', 'comments'],
+        ]
+        for url, keys in zip(self.urls(), context_keys):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+                with override_settings(ROOT_URLCONF='manga_project.urls'):
+                    expected = await self.async_client.get(url)
+
+                for key in keys:
+                    actual, wanted = response.context[key], expected.context[key]
+                    if hasattr(wanted, '__iter__') and not isinstance(wanted, (str, dict)):
+                        actual, wanted = list(actual), list(wanted)
+                    self.assertEqual(actual, wanted, key)
+                self.assertEqual(response.get('Link'), expected.get('Link'))
+
+    async def test_records_in_background(self):
+        await self.async_client.get(f'/manga/{self.manga.slug}/')
+        await self.async_client.get(self.urls()[2])
+        await self.wait_background()
+        self.record_manga_view.assert_called_once_with(self.manga.id)
+        self.record_chapter_view.assert_called_once_with(self.chapters[1].id)
+        self.assertFalse(self.record_progress.called)
+
+        await self.async_client.aforce_login(self.reader)
+        await self.async_client.get(self.urls()[2])
+        await self.async_client.get(self.urls()[2], headers={'Sec-Purpose': 'prefetch'})
+        await self.wait_background()
+        self.record_progress.assert_called_once_with(self.reader.id, self.manga.id, self.chapters[1].id)
+        self.assertEqual(self.record_chapter_view.call_count, 2)
+
+    async def test_not_modified_and_missing(self):
+        url = self.urls()[2]
+        first = await self.async_client.get(url)
+        response = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.record_chapter_view.call_count, 2)
+
+        self.assertEqual((await self.async_client.get('/manga/khong-co/')).status_code, 404)
+        self.assertEqual((await self.async_client.get(f'/manga/{self.manga.slug}/khong-co/')).status_code, 404)
+
+    async def test_parallel_runs_concurrently_in_order(self):
+        barrier = threading.Barrier(3, timeout=5)
+        main = threading.get_ident()
+
+        def work(value):
+            # Chỉ qua được barrier khi cả ba hàm chạy cùng lúc
+            barrier.wait()
+            return value, threading.get_ident()
+
+        results = await async_views.parallel(*(lambda value=value: work(value) for value in range(3)))
+        self.assertEqual([value for value, _ in results], [0, 1, 2])
+        self.assertNotIn(main, {thread for _, thread in results})
+
+    async def test_background_failure_is_logged(self):
+        with self.assertLogs('manga.async_views', 'ERROR'):
+            async_views.fire_and_forget(mock.Mock(side_effect=RuntimeError))
+            await self.wait_background()
+            await asyncio.sleep(0)
+
+
+# ==================== FILE MEDIA ====================
+class ParseRangeTests(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=50-500', 100), (50, 99))
+        self.assertEqual(parse_range('bytes=-500', 100), (0, 99))
+
+    def test_unsupported_or_invalid(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        self.assertIs(parse_range('bytes=100-', 100), False)
+        self.assertIs(parse_range('bytes=20-10', 100), False)
+        self.assertIs(parse_range('bytes=-0', 100), False)
+
+    def test_empty_file(self):
+        for header in ('bytes=0-', 'bytes=0-0', 'bytes=-10'):
+            self.assertIs(parse_range(header, 0), False)
+        self.assertIsNone(parse_range(None, 0))
+
+
+@quiet
+class ServeMediaTests(SimpleTestCase):
+    HASHED = 'chapters/ab/cd/abcd' + '0' * 60 + '.png'
+    LEGACY = 'covers/cover.jpg'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.content = bytes(range(256)) * 4
+
+        for name in (self.HASHED, self.LEGACY):
+            path = os.path.join(self.media_root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(self.content)
+        with open(os.path.join(self.media_root, 'chapters', 'x.png.tmp'), 'wb') as f:
+            f.write(b'partial')
+
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_DELIVERY={'METHOD': 'django'})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get(self, name, **headers):
+        return self.client.get('/media/' + name, headers=headers)
+
+    def test_full_file(self):
+        response = self.get(self.HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], '"abcd' + '0' * 60 + '"')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    def test_legacy_name_is_not_immutable(self):
+        response = self.get(self.LEGACY)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+    def test_range(self):
+        response = self.get(self.HASHED, Range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[10:20])
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+
+    def test_open_ended_and_suffix_range(self):
+        response = self.get(self.HASHED, Range='bytes=1000-')
+        self.assertEqual(b''.join(response.streaming_content), self.content[1000:])
+
+        response = self.get(self.HASHED, Range='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.content[-24:])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(self.HASHED, Range=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range_mismatch_sends_whole_file(self):
+        response = self.get(self.HASHED, Range='bytes=0-9', **{'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+        etag = self.get(self.HASHED)['ETag']
+        response = self.get(self.HASHED, Range='bytes=0-9', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+
+    def test_range_on_empty_file(self):
+        open(os.path.join(self.media_root, 'covers', 'empty.jpg'), 'wb').close()
+        response = self.get('covers/empty.jpg', Range='bytes=0-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */0')
+
+        response = self.get('covers/empty.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+    def test_not_modified(self):
+        etag = self.get(self.HASHED)['ETag']
+        response = self.get(self.HASHED, **{'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_missing_and_forbidden(self):
+        self.assertEqual(self.get('chapters/missing.png').status_code, 404)
+        self.assertEqual(self.get('chapters/x.png.tmp').status_code, 404)
+        self.assertEqual(self.get('chapters/../../etc/passwd').status_code, 404)
+        self.assertEqual(self.get('other/file.png').status_code, 404)
+
+    def test_dot_segments_are_rejected(self):
+        private = os.path.join(self.media_root, 'private')
+        os.makedirs(private)
+        with open(os.path.join(private, 'key.txt'), 'w') as f:
+            f.write('secret')
+        os.makedirs(os.path.join(self.media_root, 'covers', '.hidden'))
+        with open(os.path.join(self.media_root, 'covers', '.hidden', 'a.png'), 'wb') as f:
+            f.write(b'hidden')
+
+        for name in (
+            'covers/../private/key.txt',
+            'covers/%2e%2e/private/key.txt',
+            'covers/%2E%2E/private/key.txt',
+            'covers/..%2fprivate/key.txt',
+            'covers/..%5cprivate/key.txt',
+            'covers\\..\\private\\key.txt',
+            'covers/%2e%2e/covers/../private/key.txt',
+            '%2fcovers/cover.jpg',
+            'covers/.hidden/a.png',
+            'covers/%00cover.jpg',
+        ):
+            with self.subTest(name=name):
+                self.assertEqual(self.get(name).status_code, 404)
+
+        # Đoạn "." vô hại được chuẩn hóa
+        self.assertEqual(self.get('covers/./cover.jpg').status_code, 200)
+
+    def test_x_accel_redirect(self):
+        with override_settings(MEDIA_DELIVERY={'METHOD': 'xaccel', 'XACCEL_PREFIX': '/protected/'}):
+            response = self.get(self.HASHED)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/' + self.HASHED)
+        self.assertEqual(response.content, b'')
+
+    def test_x_sendfile(self):
+        with override_settings(MEDIA_DELIVERY={'METHOD': 'xsendfile'}):
+            response = self.get(self.LEGACY)
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, self.LEGACY))
+
+
+# ==================== SỐ QUERY TRANG QUẢN TRỊ ====================
+@quiet
+class ChangelistQueryBudgetTests(TestCase):
+    """Số query của mỗi trang danh sách không được tăng theo số dòng hiển thị"""
+
+    ADMIN_URLS = [
+        '/admin/manga/manga/',
+        '/admin/manga/chapter/',
+        '/admin/manga/category/',
+        '/admin/manga/author/',
+        '/admin/manga/comment/',
+        '/admin/manga/follow/',
+    ]
+    CRUD_URLS = [
+        '/crud/manga/',
+        '/crud/category/',
+        '/crud/author/',
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.first_manga = None
+
+    def create_rows(self, start, stop):
+        for i in range(start, stop):
+            author = Author.objects.create(name=f'Author {i}')
+            category = Category.objects.create(name=f'Category {i}')
+            manga = Manga.objects.create(
+                title=f'Manga {i}', description='-', author=author, cover_image='covers/cover.jpg',
+            )
+            manga.categories.add(category)
+            self.first_manga = self.first_manga or manga
+
+            for number in (1, 2):
+                chapter = Chapter.objects.create(manga=manga, chapter_number=number)
+                ChapterImage.objects.bulk_create(
+                    ChapterImage(chapter=chapter, page_number=page, image='chapters/page.jpg')
+                    for page in (1, 2)
+                )
+            # Thêm chapter vào truyện đầu tiên để trang danh sách chapter cũng dài ra
+            Chapter.objects.create(manga=self.first_manga, chapter_number=100 + i)
+
+            Comment.objects.create(user=self.reader, manga=manga, content='Hay')
+            Follow.objects.create(user=self.reader, manga=manga)
+
+    def count_queries(self):
+        urls = self.ADMIN_URLS + self.CRUD_URLS + [f'/crud/manga/{self.first_manga.id}/chapters/']
+        counts = {}
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_query_count_independent_of_rows(self):
+        self.client.force_login(self.admin)
+
+        self.create_rows(0, 2)
+        few = self.count_queries()
+        self.create_rows(2, 20)
+        many = self.count_queries()
+
+        self.assertEqual(few, many)
+
+
+# ==================== NGÂN SÁCH QUERY TRANG CÔNG KHAI ====================
+@quiet
+@deferred_writes
+class PageQueryBudgetTests(TestCase):
+    """Mỗi trang có số query cố định; template lỡ truy cập quan hệ theo từng dòng sẽ vượt ngân sách"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        now = timezone.now()
+
+        for i in range(12):
+            author = Author.objects.create(name=f'Author {i}')
+            category = Category.objects.create(name=f'Category {i}')
+            manga = Manga.objects.create(
+                title=f'Manga {i}', description='-', author=author, cover_image='covers/cover.jpg',
+            )
+            manga.categories.add(category)
+            for number in (1, 2, 3):
+                chapter = Chapter.objects.create(manga=manga, chapter_number=number)
+                ChapterImage.objects.bulk_create(
+                    ChapterImage(chapter=chapter, page_number=page, image='chapters/page.jpg')
+                    for page in (1, 2, 3)
+                )
+            for days in (1, 7, 30):
+                TrendingEntry.objects.create(window_days=days, rank=i + 1, manga=manga, views=100 - i, computed_at=now)
+
+            root = Comment.objects.create(user=cls.reader, manga=manga, content='Hay')
+            reply = Comment.objects.create(user=cls.admin, manga=manga, content='Đồng ý', parent=root)
+            Comment.objects.create(user=cls.reader, manga=manga, content='Cảm ơn', parent=reply)
+            Comment.objects.create(user=cls.reader, manga=manga, chapter=chapter, content='Chapter hay')
+            Follow.objects.create(user=cls.reader, manga=manga)
+
+        cls.manga = manga
+        cls.chapter = chapter
+        cls.category = category
+
+    def setUp(self):
+        # Đo cả trường hợp mục lục / manifest chưa có trong cache
+        cache.clear()
+        self.addCleanup(stop_buffers)
+
+    def test_public_pages(self):
+        assert_query_budget(views.home, 8)
+        assert_query_budget(views.manga_detail, 7, args=[self.manga.slug])
+        assert_query_budget(views.read_chapter, 6, args=[self.manga.slug, self.chapter.slug])
+        assert_query_budget(views.category_view, 4, args=[self.category.slug])
+        assert_query_budget('/search/?status=ongoing', 2)
+
+    def test_pages_for_logged_in_reader(self):
+        self.client.force_login(self.reader)
+        assert_query_budget(views.manga_detail, 10, args=[self.manga.slug], client=self.client)
+        assert_query_budget(views.read_chapter, 7, args=[self.manga.slug, self.chapter.slug], client=self.client)
+        assert_query_budget(views.following_list, 3, client=self.client)
+
+    def test_budget_failure_lists_queries(self):
+        with self.assertRaisesMessage(AssertionError, 'vượt ngân sách 1'):
+            assert_query_budget(views.home, 1)
+
+    def test_profile_detects_repeated_queries(self):
+        with profile() as result:
+            for manga in Manga.objects.all():
+                manga.author.name
+
+        self.assertEqual(result.query_count, 13)
+        self.assertEqual(list(result.similar.values()), [12])
+        self.assertFalse(result.duplicates)
+
+    @override_settings(INSTRUMENTATION={'LOG': False, 'SERVER_TIMING': True})
+    def test_server_timing_header(self):
+        response = self.client.get('/')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=')
+
+    @override_settings(INSTRUMENTATION={'SIMILAR_QUERY_THRESHOLD': 3})
+    def test_log_line(self):
+        with self.assertLogs('manga.instrumentation', 'INFO') as logs:
+            self.client.get('/')
+        self.assertIn('view=home', logs.output[0])
+        self.assertIn('queries=', logs.output[0])
+
+
+
+# ==================== FEED CHAPTER MỚI ====================
+@quiet
+@override_settings(FEED={'FANOUT_LIMIT': 2, 'BATCH_SIZE': 2, 'ASYNC': False})
+class UpdateFeedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.others = [User.objects.create_user(f'other{i}', password='password') for i in range(2)]
+        cls.small = Manga.objects.create(title='Small', description='-', cover_image='covers/cover.jpg')
+        cls.big = Manga.objects.create(title='Big', description='-', cover_image='covers/cover.jpg')
+
+        Follow.objects.create(user=cls.reader, manga=cls.small)
+        Follow.objects.create(user=cls.others[0], manga=cls.small)
+        for user in [cls.reader, *cls.others]:
+            Follow.objects.create(user=user, manga=cls.big)
+
+    def publish(self, manga, number):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Chapter.objects.create(manga=manga, chapter_number=number)
+
+    def test_fan_out_on_write_and_read(self):
+        small = [self.publish(self.small, number) for number in (1, 2, 3)]
+        big = [self.publish(self.big, number) for number in (1, 2)]
+
+        # Truyện nhỏ được chép cho từng người theo dõi, truyện lớn thì không
+        self.assertEqual(FeedEntry.objects.filter(manga=self.small).count(), 6)
+        self.assertFalse(FeedEntry.objects.filter(manga=self.big).exists())
+        self.assertTrue(all(Chapter.objects.filter(manga=self.big).values_list('fanout_on_read', flat=True)))
+
+        with CaptureQueriesContext(connection) as queries:
+            first = feed.get_feed_page(self.reader.id, per_page=3)
+        self.assertEqual(len(queries), 1)
+
+        second = feed.get_feed_page(self.reader.id, first.next_cursor, per_page=3)
+        ids = [item['chapter_pk'] for item in [*first, *second]]
+        expected = [chapter.id for chapter in sorted(small + big, key=lambda c: (c.created_at, c.id), reverse=True)]
+        self.assertEqual(ids, expected)
+        self.assertFalse(second.has_next())
+
+        # Người không theo dõi truyện nhỏ chỉ thấy chapter của truyện lớn
+        self.assertEqual({item['manga_pk'] for item in feed.get_feed_page(self.others[1].id)}, {self.big.id})
+
+    def test_unfollow_and_late_follow(self):
+        self.publish(self.small, 1)
+        self.publish(self.big, 1)
+        Follow.objects.get(user=self.reader, manga=self.small).delete()
+        Follow.objects.get(user=self.reader, manga=self.big).delete()
+        self.assertEqual(len(feed.get_feed_page(self.reader.id)), 0)
+
+        # Theo dõi lại: chỉ thấy chapter đăng sau đó
+        Follow.objects.create(user=self.reader, manga=self.big)
+        chapter = self.publish(self.big, 2)
+        self.assertEqual([item['chapter_pk'] for item in feed.get_feed_page(self.reader.id)], [chapter.id])
+
+    def test_feed_page(self):
+        self.publish(self.small, 1)
+        self.client.force_login(self.reader)
+        response = self.client.get('/user/feed/')
+        self.assertContains(response, '/manga/small/small-chapter-1/')
+
+
+
+# ==================== SỐ CHAPTER CHƯA ĐỌC ====================
+@quiet
+class UnreadCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user('reader', password='password')
+        cls.manga = Manga.objects.create(title='Manga', description='-', cover_image='covers/cover.jpg')
+        cls.chapters = [Chapter.objects.create(manga=cls.manga, chapter_number=number) for number in (1, 2)]
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+        self.client.post(f'/follow/{self.manga.id}/')
+        self.follow = Follow.objects.get(user=self.reader, manga=self.manga)
+
+    def assertUnread(self, marker, unread):
+        self.follow.refresh_from_db()
+        self.assertEqual((self.follow.last_read_chapter_number, self.follow.unread_count), (marker, unread))
+
+    def test_publish_read_and_delete(self):
+        # Chapter có sẵn lúc theo dõi không tính là mới
+        self.assertUnread(2, 0)
+        third = Chapter.objects.create(manga=self.manga, chapter_number=3)
+        Chapter.objects.create(manga=self.manga, chapter_number=4)
+        self.assertUnread(2, 2)
+
+        write_progress({(self.reader.id, self.manga.id): (third.id, 1, timezone.now())})
+        self.assertUnread(3, 1)
+
+        # Đọc lại chapter cũ không lùi mốc
+        write_progress({(self.reader.id, self.manga.id): (self.chapters[0].id, 1, timezone.now())})
+        self.assertUnread(3, 1)
+
+        Chapter.objects.get(manga=self.manga, chapter_number=4).delete()
+        self.assertUnread(3, 0)
+
+    def test_reconcile(self):
+        Follow.objects.filter(id=self.follow.id).update(unread_count=7, last_read_chapter_number=1)
+        self.assertEqual(Follow.reconcile_unread([self.follow.id]), 1)
+        self.assertUnread(1, 1)
+        self.assertEqual(Follow.reconcile_unread([self.follow.id]), 0)
+
+    def test_following_page(self):
+        Chapter.objects.create(manga=self.manga, chapter_number=3)
+        response, result = assert_query_budget(views.following_list, 3, client=self.client)
+        self.assertContains(response, '1 chapter mới')
+
+
+
+# ==================== TRUYỆN TƯƠNG TỰ ====================
+@quiet
+@override_settings(RECOMMENDATIONS={'TOP_K': 3, 'CO_READING_WEIGHT': 0.7, 'CATEGORY_WEIGHT': 0.3})
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        action = Category.objects.create(name='Action')
+        romance = Category.objects.create(name='Romance')
+        cls.mangas = {}
+        for title, categories in [('A', [action]), ('B', [romance]), ('C', [action]), ('D', [romance]), ('E', [])]:
+            manga = Manga.objects.create(title=title, description='-', cover_image='covers/cover.jpg')
+            manga.categories.set(categories)
+            cls.mangas[title] = manga
+
+        # A và B có chung người đọc, A và D chung một người đọc, A và C chỉ chung thể loại
+        for i in range(3):
+            user = User.objects.create_user(f'reader{i}', password='password')
+            Follow.objects.create(user=user, manga=cls.mangas['A'])
+            Follow.objects.create(user=user, manga=cls.mangas['B'])
+        Follow.objects.create(user=user, manga=cls.mangas['D'])
+
+    def similar_titles(self, title):
+        return [manga.title for manga in recommendations.get_similar(self.mangas[title].id)]
+
+    def test_blended_scores(self):
+        self.assertEqual(recommendations.build(workers=1, log=lambda message: None), 5)
+
+        self.assertEqual(self.similar_titles('A'), ['B', 'D', 'C'])
+        self.assertEqual(self.similar_titles('D'), ['B', 'A'])
+        self.assertEqual(self.similar_titles('E'), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.similar_titles('A')
+        self.assertEqual(len(queries), 1)
+
+    def test_incremental(self):
+        recommendations.build(workers=1, log=lambda message: None)
+        self.assertEqual(self.similar_titles('C'), ['A'])
+
+        # Người dùng mới đọc C và D: tính lại truyện của họ, truyện đọc chung với D (A, B: mẫu số
+        # cosine đổi) và E (chưa có kết quả)
+        user = User.objects.create_user('late', password='password')
+        Follow.objects.create(user=user, manga=self.mangas['C'])
+        Follow.objects.create(user=user, manga=self.mangas['D'])
+        self.assertEqual(recommendations.build(workers=1, log=lambda message: None), 5)
+        self.assertEqual(self.similar_titles('C'), ['D', 'A'])
+        self.assertEqual(SimilarManga.objects.filter(manga=self.mangas['B']).count(), 2)
+
+    def snapshot(self):
+        return sorted(SimilarManga.objects.values_list('manga_id', 'rank', 'similar_id', 'score'))
+
+    def assertMatchesFullBuild(self):
+        incremental = self.snapshot()
+        recommendations.build(full=True, workers=1, log=lambda message: None)
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_handles_deletions_and_neighbours(self):
+        with self.assertLogs('manga.recommendations', 'INFO'):
+            recommendations.build(workers=1)
+
+        # Người mới chỉ theo dõi D: |U(D)| đổi nên điểm A -> D (đọc chung qua reader2) cũng đổi
+        late = User.objects.create_user('late', password='password')
+        Follow.objects.create(user=late, manga=self.mangas['D'])
+        recommendations.build(workers=1, log=lambda message: None)
+        self.assertMatchesFullBuild()
+
+        # Bỏ theo dõi và xóa tiến độ đọc được ghi lại để lần chạy sau tính lại
+        Follow.objects.filter(user__username='reader2', manga=self.mangas['D']).delete()
+        self.assertEqual(
+            list(SimilarityChange.objects.values_list('manga_id', flat=True)), [self.mangas['D'].id],
+        )
+        recommendations.build(workers=1, log=lambda message: None)
+        self.assertFalse(SimilarityChange.objects.exists())
+        self.assertEqual(self.similar_titles('A'), ['B', 'C'])
+        self.assertMatchesFullBuild()
+
+        chapter = Chapter.objects.create(manga=self.mangas['C'], chapter_number=1)
+        reader = User.objects.get(username='reader0')
+        write_progress({(reader.id, self.mangas['C'].id): (chapter.id, 1, timezone.now())})
+        recommendations.build(workers=1, log=lambda message: None)
+        self.assertMatchesFullBuild()
+        ReadingProgress.objects.filter(user=reader).delete()
+        recommendations.build(workers=1, log=lambda message: None)
+        self.assertMatchesFullBuild()
+
+    @skipUnless(recommendations.sparse, 'cần scipy')
+    def test_sparse_matches_python(self):
+        # Thêm truyện, thể loại và người đọc để có nhiều điểm bằng nhau và nhiều nhóm thể loại
+        categories = list(Category.objects.all()) + [Category.objects.create(name=f'Thể loại {i}') for i in range(3)]
+        mangas = list(self.mangas.values())
+        for i in range(15):
+            manga = Manga.objects.create(title=f'Truyện {i}', description='-', cover_image='covers/cover.jpg', views=i % 4)
+            manga.categories.set(categories[i % 5:i % 5 + i % 3])
+            mangas.append(manga)
+        for i in range(12):
+            user = User.objects.create_user(f'user{i}')
+            Follow.objects.bulk_create(Follow(user=user, manga=manga) for manga in mangas[i % 7::i % 4 + 2])
+
+        data = recommendations.SimilarityData()
+        manga_ids = data.manga_ids
+        for weights in ((5, 0.7, 0.3), (3, 1.0, 0.0), (4, 0.0, 1.0), (30, 0.5, 0.5)):
+            with self.subTest(weights=weights):
+                self.assertEqual(
+                    recommendations.top_similar_batch(data, manga_ids, *weights),
+                    [(manga_id, recommendations.top_similar(data, manga_id, *weights)) for manga_id in manga_ids],
+                )
+
+
+# ==================== DỮ LIỆU GIẢ LẬP VÀ ĐO TẢI ====================
+@quiet
+@deferred_writes
+class BenchmarkTests(TransactionTestCase):
+    """Luồng đo tải dùng kết nối DB riêng nên dữ liệu phải được commit thật"""
+
+    # Replica cấu hình qua MANGA_DB_REPLICAS (mirror của DB test) cũng được đọc
+    databases = '__all__'
+
+    def setUp(self):
+        self.addCleanup(stop_buffers)
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_seed_and_run(self):
+        manga_ids = DatasetSeeder(
+            mangas=6, chapters=3, pages=5, users=8, follows=3, ratings=2, comments=40, days=7,
+            batch_size=4, seed=1, log=lambda message: None,
+        ).run()
+
+        self.assertEqual(len(manga_ids), 6)
+        self.assertEqual(Chapter.objects.count(), 18)
+        self.assertEqual(ChapterImage.objects.count(), 90)
+        # Các trang dùng chung vài file ảnh giả
+        self.assertEqual(ChapterImage.objects.values('image').distinct().count(), 4)
+        self.assertEqual(Follow.objects.count(), 24)
+        self.assertEqual(Comment.objects.count(), 40)
+        self.assertEqual(TrendingEntry.objects.filter(window_days=7).count(), 6)
+        for manga in Manga.objects.all():
+            self.assertEqual(manga.chapter_count, 3)
+            self.assertEqual(manga.comment_count, manga.comments.filter(chapter__isnull=True).count())
+            self.assertEqual(manga.rating_count, manga.ratings.count())
+        for root in Comment.objects.filter(root__isnull=True):
+            self.assertEqual(root.reply_count, root.thread.count())
+
+        results = LoadRunner(requests=6, concurrency=2).run(log=lambda message: None)
+
+        self.assertEqual(list(results['scenarios']), ['home', 'manga_detail', 'read_chapter', 'search', 'category_view'])
+        self.assertEqual(results['dataset']['mangas'], 6)
+        for result in results['scenarios'].values():
+            self.assertEqual(result['requests'], 6)
+            self.assertEqual(result['errors'], 0)
+            self.assertLessEqual(result['p50'], result['p99'])
+            self.assertGreater(result['queries_mean'], 0)
+
+
+# ==================== REPLICA ====================
+REPLICA = 'replica_test'
+# Replica không kết nối được: file SQLite nằm trong thư mục không tồn tại
+DOWN_REPLICA = 'replica_down'
+
+
+@quiet
+@override_settings(READ_REPLICAS={'ALIASES': [REPLICA], 'STICKY_SECONDS': 15, 'COOKIE': 'db_primary'})
+@deferred_writes
+class ReadReplicaTests(TransactionTestCase):
+    """
+    Primary là DB test mặc định, replica là một file SQLite thứ hai không được
+    đồng bộ: dữ liệu khác nhau giữa hai bên cho biết query đã đọc từ đâu.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Thêm sau khi test runner đã dựng DB test. Replica thật nhận schema qua
+        # replication nên ở đây tạo thẳng các bảng từ model, không chạy migration
+        cls.replica_dir = tempfile.mkdtemp()
+        configured = connections.configure_settings({
+            **connections.settings,
+            REPLICA: {'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3')},
+            # MIRROR chỉ để test runner không flush DB không mở được này
+            DOWN_REPLICA: {
+                'ENGINE': 'django.db.backends.sqlite3', 'NAME': os.path.join(cls.replica_dir, 'missing', 'db.sqlite3'),
+                'TEST': {'MIRROR': REPLICA},
+            },
+        })
+        connections.settings[REPLICA] = configured[REPLICA]
+        connections.settings[DOWN_REPLICA] = configured[DOWN_REPLICA]
+        cls.databases = {'default', REPLICA, DOWN_REPLICA}
+        with connections[REPLICA].schema_editor() as editor:
+            for model in apps.get_models():
+                editor.create_model(model)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in (REPLICA, DOWN_REPLICA):
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        self.addCleanup(stop_buffers)
+        cache.clear()
+        replicas._down_until.clear()
+        self.reader = User.objects.create_user('reader', password='password')
+        User.objects.using(REPLICA).create(id=self.reader.id, username='reader', password=self.reader.password)
+
+        # Cùng truyện ở hai DB, replica "trễ" nên còn tên cũ
+        self.manga = Manga.objects.create(title='Bản mới', slug='truyen', description='-', cover_image='covers/cover.jpg')
+        Manga.objects.using(REPLICA).create(
+            id=self.manga.id, title='Bản cũ', slug='truyen', description='-', cover_image='covers/cover.jpg',
+        )
+
+    def test_read_only_pages_use_replica(self):
+        for url in ('/', '/search/', '/manga/truyen/'):
+            response = self.client.get(url)
+            self.assertContains(response, 'Bản cũ')
+            self.assertNotContains(response, 'Bản mới')
+            self.assertNotIn('db_primary', response.cookies)
+
+    def test_sticky_after_write(self):
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get('/manga/truyen/'), 'Bản cũ')
+
+        # Theo dõi xong quay lại trang truyện: đọc primary, thấy ngay trạng thái mới
+        response = self.client.post(f'/follow/{self.manga.id}/', follow=True)
+        self.assertIn('db_primary', self.client.cookies)
+        self.assertContains(response, 'Bản mới')
+        self.assertContains(response, 'Đã theo dõi')
+        self.assertFalse(Follow.objects.using(REPLICA).exists())
+
+        # Hết thời gian sticky thì lại đọc replica
+        self.client.cookies['db_primary'] = '0'
+        self.assertContains(self.client.get('/manga/truyen/'), 'Bản cũ')
+
+    def test_router(self):
+        request = RequestFactory().get('/')
+
+        @replicas.read_replica
+        def view(request):
+            result = [router.db_for_read(Manga)]
+            with replicas.use_primary():
+                result.append(router.db_for_read(Manga))
+            result.append(router.db_for_read(Manga))
+            self.assertEqual(router.db_for_write(Manga), 'default')
+            result.append(router.db_for_read(Manga))
+            return result
+
+        self.assertEqual(view(request), [REPLICA, 'default', REPLICA, 'default'])
+        self.assertEqual(router.db_for_read(Manga), 'default')
+        self.assertEqual(view(RequestFactory().post('/')), ['default'] * 4)
+
+    def test_down_replica_falls_back_to_primary(self):
+        down = {'ALIASES': [DOWN_REPLICA], 'DOWN_SECONDS': 30}
+        with override_settings(READ_REPLICAS=down), self.assertLogs('manga.replicas', 'WARNING'):
+            response = self.client.get('/manga/truyen/')
+        self.assertContains(response, 'Bản mới')
+
+        # Replica bị bỏ qua trong DOWN_SECONDS, sau đó được thử lại
+        with override_settings(READ_REPLICAS={'ALIASES': [DOWN_REPLICA, REPLICA]}):
+            for _ in range(5):
+                self.assertContains(self.client.get('/manga/truyen/'), 'Bản cũ')
+            with mock.patch('manga.replicas.time.monotonic', return_value=time.monotonic() + 31), \
+                    mock.patch('manga.replicas.random.choice', side_effect=lambda aliases: aliases[0]), \
+                    self.assertLogs('manga.replicas', 'WARNING'):
+                self.assertContains(self.client.get('/manga/truyen/'), 'Bản mới')
+
+    def test_error_after_write_is_not_retried(self):
+        @replicas.read_replica
+        def view(request):
+            router.db_for_write(Manga)
+            raise OperationalError('mất kết nối')
+
+        with override_settings(READ_REPLICAS={'ALIASES': [REPLICA]}), self.assertRaises(OperationalError):
+            view(RequestFactory().get('/'))
+
+    @override_settings(ROOT_URLCONF='manga_project.asgi_urls')
+    async def test_async_middleware_and_fallback(self):
+        with override_settings(READ_REPLICAS={'ALIASES': [DOWN_REPLICA]}), self.assertLogs('manga.replicas', 'WARNING'):
+            response = await self.async_client.get('/manga/truyen/')
+        self.assertContains(response, 'Bản mới')
+
+        async def get_response(request):
+            router.db_for_write(Manga)
+            return HttpResponse()
+
+        for middleware in (replicas.StickyPrimaryMiddleware, RequestProfileMiddleware):
+            self.assertTrue(middleware.sync_capable and middleware.async_capable)
+        with override_settings(INSTRUMENTATION={'LOG': False, 'SERVER_TIMING': True}):
+            middleware = RequestProfileMiddleware(replicas.StickyPrimaryMiddleware(get_response))
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = await middleware(RequestFactory().get('/'))
+        self.assertIn('db_primary', response.cookies)
+        self.assertIn('db;dur=', response['Server-Timing'])
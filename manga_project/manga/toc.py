@@ -0,0 +1,111 @@
+"""
+Mục lục chapter (table of contents) của từng truyện, lưu trong cache.
+
+Mỗi truyện có một số phiên bản (version) riêng; khi chapter thay đổi chỉ cần
+đổi version là mục lục cũ tự hết hiệu lực. Chapter trước/sau được tìm bằng
+bisect trên danh sách chapter_number đã sắp xếp thay vì query DB.
+"""
+import time
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.utils.formats import localize
+
+from .replicas import use_primary
+
+TOC_TIMEOUT = 60 * 60 * 24
+
+TOCEntry = namedtuple('TOCEntry', ['id', 'chapter_number', 'slug'])
+
+
+class ChapterTOC:
+    """Danh sách chapter của một truyện, sắp xếp tăng dần theo chapter_number"""
+
+    __slots__ = ('manga_id', 'version', 'numbers', 'slugs', 'ids')
+
+    def __init__(self, manga_id, version, rows):
+        self.manga_id = manga_id
+        self.version = version
+        self.numbers = [row[0] for row in rows]
+        self.slugs = [row[1] for row in rows]
+        self.ids = [row[2] for row in rows]
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def entry(self, index):
+        return TOCEntry(self.ids[index], self.numbers[index], self.slugs[index])
+
+    def find(self, chapter_id):
+        """Tìm chapter theo id, None nếu không thuộc truyện này"""
+        try:
+            return self.entry(self.ids.index(chapter_id))
+        except ValueError:
+            return None
+
+    def next_of(self, chapter_number):
+        index = bisect_right(self.numbers, chapter_number)
+        return self.entry(index) if index < len(self) else None
+
+    def previous_of(self, chapter_number):
+        index = bisect_left(self.numbers, chapter_number) - 1
+        return self.entry(index) if index >= 0 else None
+
+    def count_after(self, chapter_number):
+        """Số chapter lớn hơn ``chapter_number`` (None: tất cả)"""
+        if chapter_number is None:
+            return len(self)
+        return len(self) - bisect_right(self.numbers, chapter_number)
+
+    def as_dict(self):
+        # Kèm số chapter đã định dạng như trong template ({{ chapter.chapter_number }})
+        return {
+            'manga_id': self.manga_id,
+            'version': self.version,
+            'chapters': [[number, slug, localize(number)] for number, slug in zip(self.numbers, self.slugs)],
+        }
+
+
+def _version_key(manga_id):
+    return f'toc:version:{manga_id}'
+
+
+def _toc_key(manga_id, version):
+    return f'toc:{manga_id}:{version}'
+
+
+def get_version(manga_id):
+    version = cache.get(_version_key(manga_id))
+    if version is None:
+        version = time.time_ns()
+        # add() để không ghi đè version do tiến trình khác vừa đặt
+        if not cache.add(_version_key(manga_id), version, TOC_TIMEOUT):
+            version = cache.get(_version_key(manga_id), version)
+    return version
+
+
+def get_toc(manga_id):
+    """Lấy mục lục từ cache, nếu chưa có thì dựng lại bằng một query"""
+    from .models import Chapter
+
+    version = get_version(manga_id)
+    key = _toc_key(manga_id, version)
+
+    rows = cache.get(key)
+    if rows is None:
+        # Cache sống tới khi đổi version: đọc primary để không giữ bản cũ của replica
+        with use_primary():
+            rows = list(
+                Chapter.objects.filter(manga_id=manga_id)
+                .order_by('chapter_number')
+                .values_list('chapter_number', 'slug', 'id')
+            )
+        cache.set(key, rows, TOC_TIMEOUT)
+
+    return ChapterTOC(manga_id, version, rows)
+
+
+def invalidate(manga_id):
+    """Đổi version để mục lục cũ không còn được dùng"""
+    cache.set(_version_key(manga_id), time.time_ns(), TOC_TIMEOUT)
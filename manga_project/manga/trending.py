@@ -0,0 +1,80 @@
+"""
+Bảng xếp hạng truyện hot tính sẵn.
+
+ViewCount đã là bảng gộp lượt xem theo ngày; job ``refresh_trending`` cộng
+``ViewCount.count`` trong từng cửa sổ (1, 7, 30 ngày hoặc tùy ý) và lưu top N
+vào ``TrendingEntry``. Trang chủ chỉ đọc N dòng đã sắp xếp sẵn.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import TrendingEntry, ViewCount
+
+DEFAULT_WINDOWS = [1, 7, 30]
+DEFAULT_SIZE = 10
+
+
+def get_windows():
+    return getattr(settings, 'TRENDING_WINDOWS', DEFAULT_WINDOWS)
+
+
+def get_size():
+    return getattr(settings, 'TRENDING_SIZE', DEFAULT_SIZE)
+
+
+def refresh_window(days, size=None):
+    """Tính lại top N của cửa sổ ``days`` ngày gần nhất (tính cả hôm nay)"""
+    size = size or get_size()
+    since = timezone.localdate() - timedelta(days=days)
+
+    totals = (
+        ViewCount.objects
+        .filter(date__gt=since)
+        .values('manga')
+        .annotate(total=Sum('count'))
+        .order_by('-total', 'manga')[:size]
+    )
+
+    now = timezone.now()
+    entries = [
+        TrendingEntry(
+            window_days=days,
+            rank=rank,
+            manga_id=row['manga'],
+            views=row['total'] or 0,
+            computed_at=now,
+        )
+        for rank, row in enumerate(totals, start=1)
+    ]
+
+    # Thay toàn bộ bảng xếp hạng của cửa sổ trong một transaction
+    with transaction.atomic():
+        TrendingEntry.objects.filter(window_days=days).delete()
+        TrendingEntry.objects.bulk_create(entries)
+
+    return entries
+
+
+def refresh_all(windows=None, size=None):
+    return {days: refresh_window(days, size) for days in (windows or get_windows())}
+
+
+def get_trending(days, limit=None):
+    """Đọc top truyện của cửa sổ ``days`` ngày, gắn ``window_views`` vào từng truyện"""
+    limit = limit or get_size()
+    entries = (
+        TrendingEntry.objects
+        .filter(window_days=days)
+        .select_related('manga')
+        .order_by('rank')[:limit]
+    )
+
+    mangas = []
+    for entry in entries:
+        entry.manga.window_views = entry.views
+        mangas.append(entry.manga)
+    return mangas
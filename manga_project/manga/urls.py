@@ -10,6 +10,9 @@ urlpatterns = [
 
     # Đọc truyện
     path('manga/<slug:manga_slug>/<path:chapter_slug>/', views.read_chapter, name='read_chapter'),
+    path('api/manga/<int:manga_id>/chapters/', views.chapter_toc, name='chapter_toc'),
+    path('api/chapter/<int:chapter_id>/manifest/', views.chapter_manifest, name='chapter_manifest'),
+    path('api/progress/', views.save_progress, name='save_progress'),
     # Tìm kiếm
     path('search/', views.search, name='search'),
 
@@ -25,6 +28,7 @@ urlpatterns = [
     path('user/profile/', views.profile, name='profile'),
     path('user/history/', views.reading_history, name='reading_history'),
     path('user/following/', views.following_list, name='following_list'),
+    path('user/feed/', views.update_feed, name='update_feed'),
 
     # Actions
     path('follow/<int:manga_id>/', views.follow_manga, name='follow_manga'),
@@ -0,0 +1,281 @@
+"""
+Bộ đếm lượt xem ghi trễ (write-behind).
+
+Mỗi lượt xem chỉ cộng vào bộ đệm trong bộ nhớ, không ghi DB. Một luồng nền
+định kỳ gom các lượt xem lại và ghi xuống ``Manga.views``, ``Chapter.views``
+và ``ViewCount`` bằng các câu UPDATE ... F() theo lô.
+
+``MemoryViewCounter`` đệm trong bộ nhớ của từng tiến trình (mất phần chưa ghi
+nếu tiến trình chết). ``CacheViewCounter`` đệm trong cache dùng chung
+(Redis/Memcached): không mất khi tiến trình chết và mọi tiến trình cùng cộng
+vào một chỗ.
+
+Cấu hình trong settings:
+
+    VIEW_COUNTER = {
+        'BACKEND': 'manga.view_counter.MemoryViewCounter',
+        'FLUSH_INTERVAL': 10,  # giây, 0 = ghi ngay (dùng khi test)
+        'OPTIONS': {},         # tham số riêng của backend, vd. {'CACHE': 'default', 'BUCKET': 60}
+    }
+"""
+import threading
+import time
+from abc import abstractmethod
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .buffering import BufferedWriter
+
+MANGA = 'manga'
+CHAPTER = 'chapter'
+
+DEFAULTS = {
+    'BACKEND': 'manga.view_counter.MemoryViewCounter',
+    'FLUSH_INTERVAL': 10,
+    'OPTIONS': {},
+}
+
+
+def _group_by_count(totals):
+    """Gom các id có cùng số lượt xem để một câu UPDATE phục vụ nhiều dòng"""
+    groups = defaultdict(list)
+    for key, count in totals.items():
+        groups[count].append(key)
+    return groups.items()
+
+
+def write_view_counts(pending):
+    """Ghi một lô lượt xem xuống DB trong một transaction"""
+    from .models import Manga, Chapter, ViewCount
+
+    manga_totals = Counter()
+    chapter_totals = Counter()
+    daily_totals = defaultdict(Counter)
+
+    for (kind, pk, day), count in pending.items():
+        if kind == MANGA:
+            manga_totals[pk] += count
+            daily_totals[day][pk] += count
+        elif kind == CHAPTER:
+            chapter_totals[pk] += count
+
+    with transaction.atomic():
+        for count, ids in _group_by_count(manga_totals):
+            Manga.objects.filter(id__in=ids).update(views=F('views') + count)
+
+        for count, ids in _group_by_count(chapter_totals):
+            Chapter.objects.filter(id__in=ids).update(views=F('views') + count)
+
+        # Bỏ qua truyện đã bị xóa trong lúc chờ ghi
+        existing = set(Manga.objects.filter(id__in=manga_totals).values_list('id', flat=True))
+
+        for day, totals in daily_totals.items():
+            ids = [pk for pk in totals if pk in existing]
+            if not ids:
+                continue
+
+            # Tạo trước các dòng còn thiếu, sau đó cộng dồn bằng F()
+            ViewCount.objects.bulk_create(
+                [ViewCount(manga_id=pk, date=day, count=0) for pk in ids],
+                ignore_conflicts=True,
+            )
+            for count, group in _group_by_count({pk: totals[pk] for pk in ids}):
+                ViewCount.objects.filter(manga_id__in=group, date=day).update(count=F('count') + count)
+
+
+class BaseViewCounter(BufferedWriter):
+    """
+    Giao diện chung cho các backend đếm lượt xem.
+
+    Backend con chỉ cần cài đặt ``incr``, ``drain`` và ``restore``;
+    việc ghi xuống DB và luồng flush định kỳ dùng chung ở đây.
+    """
+
+    thread_name = 'view-counter-flush'
+
+    @abstractmethod
+    def incr(self, key, count=1):
+        """Cộng ``count`` lượt xem cho khóa ``(loại, id, ngày)``"""
+
+    @abstractmethod
+    def drain(self):
+        """Lấy ra và xóa toàn bộ lượt xem đang chờ, trả về Counter"""
+
+    @abstractmethod
+    def restore(self, pending):
+        """Trả lại các lượt xem khi ghi DB thất bại để không bị mất"""
+
+    def write(self, pending):
+        write_view_counts(pending)
+
+    def size(self, pending):
+        return sum(pending.values())
+
+    def record(self, kind, pk, count=1):
+        self.incr((kind, pk, timezone.localdate()), count)
+        self.schedule()
+
+
+class MemoryViewCounter(BaseViewCounter):
+    """Đệm lượt xem trong bộ nhớ của từng tiến trình"""
+
+    def __init__(self, flush_interval=10):
+        super().__init__(flush_interval)
+        self._lock = threading.Lock()
+        self._pending = Counter()
+
+    def incr(self, key, count=1):
+        with self._lock:
+            self._pending[key] += count
+
+    def drain(self):
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        return pending
+
+    def restore(self, pending):
+        with self._lock:
+            self._pending.update(pending)
+
+
+class CacheViewCounter(BaseViewCounter):
+    """
+    Đệm lượt xem trong cache dùng chung giữa các tiến trình.
+
+    Lượt xem được cộng nguyên tử (``cache.incr``) vào khóa của "ngăn" thời gian
+    hiện tại (``BUCKET`` giây); khóa mới được ghi danh vào ngăn qua một số thứ
+    tự cũng tăng nguyên tử. Khi flush, tiến trình giữ khóa ``lock`` đọc các
+    khóa đã ghi danh của ``LOOKBACK`` ngăn gần nhất và trừ đi đúng số đã đọc
+    (``cache.decr``) nên lượt xem cộng thêm trong lúc đó không bị mất. Ngăn đã
+    đóng và đã đọc hết được đánh dấu để lần sau bỏ qua.
+
+    Cache phải hỗ trợ incr/decr nguyên tử (Redis, Memcached). LocMemCache
+    chỉ dùng chung trong một tiến trình.
+    """
+
+    prefix = 'view-counter'
+
+    def __init__(self, flush_interval=10, cache='default', bucket=60, lookback=60):
+        super().__init__(flush_interval)
+        self.cache = caches[cache]
+        self.bucket_seconds = bucket
+        self.lookback = lookback
+        # Khóa sống đủ lâu để còn được đọc cho tới khi ngăn ra khỏi khoảng lookback
+        self.timeout = (lookback + 2) * bucket
+
+    def _bucket(self):
+        return int(time.time() // self.bucket_seconds)
+
+    def _key(self, bucket, *parts):
+        return ':'.join(map(str, (self.prefix, bucket, *parts)))
+
+    def _add(self, name, count):
+        """incr, tạo khóa nếu chưa có; trả về (giá trị mới, có phải vừa tạo)"""
+        try:
+            return self.cache.incr(name, count), False
+        except ValueError:
+            if self.cache.add(name, count, self.timeout):
+                return count, True
+            return self.cache.incr(name, count), False
+
+    def incr(self, key, count=1):
+        bucket = self._bucket()
+        _, created = self._add(self._key(bucket, 'value', *key), count)
+        if created:
+            slot, _ = self._add(self._key(bucket, 'size'), 1)
+            self.cache.set(self._key(bucket, 'slot', slot), key, self.timeout)
+
+    def drain(self):
+        pending = Counter()
+        lock = self._key('lock')
+        if not self.cache.add(lock, 1, max(self.flush_interval, 1) * 5 + 60):
+            # Tiến trình khác đang flush
+            return pending
+
+        try:
+            current = self._bucket()
+            buckets = range(current - self.lookback, current + 1)
+            done = self.cache.get_many([self._key(bucket, 'done') for bucket in buckets])
+            sizes = self.cache.get_many([self._key(bucket, 'size') for bucket in buckets])
+
+            for bucket in buckets:
+                if self._key(bucket, 'done') in done:
+                    continue
+                size = sizes.get(self._key(bucket, 'size'), 0)
+                slots = self.cache.get_many([self._key(bucket, 'slot', slot) for slot in range(1, size + 1)])
+                names = {self._key(bucket, 'value', *key): key for key in slots.values()}
+
+                for name, count in self.cache.get_many(list(names)).items():
+                    if count > 0:
+                        self.cache.decr(name, count)
+                        pending[names[name]] += count
+
+                # Ngăn trước ngăn hiện tại có thể còn lượt ghi muộn, chỉ đánh dấu ngăn cũ hơn
+                if bucket < current - 1 and len(slots) == size:
+                    self.cache.set(self._key(bucket, 'done'), 1, self.timeout)
+        finally:
+            self.cache.delete(lock)
+
+        return pending
+
+    def restore(self, pending):
+        for key, count in pending.items():
+            self.incr(key, count)
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_view_counter():
+    """Trả về backend đếm lượt xem theo cấu hình VIEW_COUNTER"""
+    global _counter
+
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                config = {**DEFAULTS, **getattr(settings, 'VIEW_COUNTER', {})}
+                backend = import_string(config['BACKEND'])
+                options = {name.lower(): value for name, value in config['OPTIONS'].items()}
+                _counter = backend(flush_interval=config['FLUSH_INTERVAL'], **options)
+
+    return _counter
+
+
+@receiver(setting_changed)
+def reset_view_counter(setting, **kwargs):
+    """Đổi VIEW_COUNTER (override_settings trong test): ghi nốt rồi tạo lại backend"""
+    global _counter
+
+    if setting == 'VIEW_COUNTER':
+        with _counter_lock:
+            if _counter is not None:
+                _counter.stop()
+            _counter = None
+
+
+def is_prefetch(request):
+    """
+    Request do trình duyệt tải trước (``<link rel=prefetch>``, speculation
+    rules...), người dùng chưa thật sự mở trang: không tính lượt xem/tiến độ.
+    """
+    for header in ('Sec-Purpose', 'Purpose', 'X-Purpose', 'X-Moz'):
+        if 'prefetch' in request.headers.get(header, '').lower():
+            return True
+    return False
+
+
+def record_manga_view(manga_id):
+    get_view_counter().record(MANGA, manga_id)
+
+
+def record_chapter_view(chapter_id):
+    get_view_counter().record(CHAPTER, chapter_id)
@@ -1,43 +1,36 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
+from django.db import transaction
 from django.db.models import Q, Count, Avg, Max, F
-from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.urls import reverse
+from django.utils.http import quote_etag
 from django.utils import timezone
-from django.db import IntegrityError, transaction
 from datetime import timedelta
 from .models import *
+from . import conditional, feed, manifest, reading_progress, recommendations, search_index, toc, trending, view_counter
+from . import comments as thread_comments
+from .conditional import conditional_page
+from .replicas import read_replica
+from .pagination import KeysetPaginator, SequencePaginator
 
 
 # ==================== TRANG CHỦ ====================
+@read_replica
+@conditional_page(conditional.home_state)
 def home(request):
-    # Truyện mới cập nhật
-    latest_manga = Manga.objects.prefetch_related('chapters').order_by('-updated_at')[:20]
-
-    # Top ngày/tuần/tháng
-    today = timezone.now().date()
-    week_ago = today - timedelta(days=7)
-    month_ago = today - timedelta(days=30)
-
-    top_today = Manga.objects.filter(
-        viewcount__date=today
-    ).annotate(
-        daily_views=Count('viewcount')
-    ).order_by('-daily_views')[:10]
-
-    top_week = Manga.objects.filter(
-        viewcount__date__gte=week_ago
-    ).annotate(
-        weekly_views=Count('viewcount')
-    ).order_by('-weekly_views')[:10]
-
-    top_month = Manga.objects.filter(
-        viewcount__date__gte=month_ago
-    ).annotate(
-        monthly_views=Count('viewcount')
-    ).order_by('-monthly_views')[:10]
+    # Truyện mới cập nhật (chapter mới nhất lấy từ các trường latest_chapter_* của Manga)
+    latest_manga = Manga.objects.order_by('-updated_at')[:20]
+
+    # Top ngày/tuần/tháng (đọc từ bảng xếp hạng tính sẵn)
+    top_today = trending.get_trending(1)
+    top_week = trending.get_trending(7)
+    top_month = trending.get_trending(30)
 
     # Tất cả thể loại
     categories = Category.objects.all()
@@ -53,124 +46,177 @@ def home(request):
 
 
 # ==================== CHI TIẾT TRUYỆN ====================
+@read_replica
+@conditional_page(
+    conditional.manga_detail_state,
+    on_not_modified=lambda state: view_counter.record_manga_view(state['manga_id']),
+)
 def manga_detail(request, slug):
-    manga = get_object_or_404(Manga, slug=slug)
-
-    # Tăng lượt xem
-    manga.views += 1
-    manga.save(update_fields=['views'])
+    manga = get_object_or_404(Manga.objects.select_related('author'), slug=slug)
 
-    # Cập nhật ViewCount theo ngày - XỬ LÝ RACE CONDITION
-    try:
-        with transaction.atomic():
-            view_count, created = ViewCount.objects.get_or_create(
-                manga=manga,
-                date=timezone.now().date(),
-                defaults={'count': 0}
-            )
-            if not created:
-                # Nếu đã tồn tại, tăng count
-                ViewCount.objects.filter(
-                    manga=manga,
-                    date=timezone.now().date()
-                ).update(count=F('count') + 1)
-            else:
-                # Nếu mới tạo, set count = 1
-                view_count.count = 1
-                view_count.save()
-    except IntegrityError:
-        # Nếu vẫn bị lỗi duplicate, chỉ cần update
-        ViewCount.objects.filter(
-            manga=manga,
-            date=timezone.now().date()
-        ).update(count=F('count') + 1)
+    # Tăng lượt xem (ghi trễ theo lô, không ghi DB trong request)
+    if not view_counter.is_prefetch(request):
+        view_counter.record_manga_view(manga.id)
 
     # Lấy danh sách chapter
     chapters = manga.chapters.all().order_by('-chapter_number')
 
-    # Kiểm tra user có follow không
+    # Kiểm tra user có follow không, vị trí đọc dở
     is_following = False
+    continue_reading = None
     if request.user.is_authenticated:
         is_following = Follow.objects.filter(user=request.user, manga=manga).exists()
+        continue_reading = reading_progress.get_continue_reading(request.user.id, manga.id)
 
-    # Lấy bình luận
-    comments = manga.comments.filter(parent=None).select_related('user')[:10]
+    # Bình luận ở trang truyện kèm trả lời (2 query, phân trang theo con trỏ)
+    comments = thread_comments.get_thread_page(manga.id, cursor=request.GET.get('comments'))
 
-    # Tính rating trung bình
-    avg_rating = manga.ratings.aggregate(Avg('score'))['score__avg'] or 0
+    # Truyện tương tự tính sẵn bởi job build_recommendations (1 query)
+    similar = recommendations.get_similar(manga.id)
 
     context = {
         'manga': manga,
         'chapters': chapters,
         'is_following': is_following,
+        'continue_reading': continue_reading,
         'comments': comments,
-        'avg_rating': round(avg_rating, 1),
+        'similar': similar,
+        'avg_rating': round(manga.rating, 1),
     }
     return render(request, 'manga_detail.html', context)
 
 
 # ==================== TRANG ĐỌC TRUYỆN ====================
+@read_replica
+@conditional_page(
+    conditional.read_chapter_state,
+    on_not_modified=lambda state: view_counter.record_chapter_view(state['chapter_id']),
+)
 def read_chapter(request, manga_slug, chapter_slug):
-    chapter = get_object_or_404(Chapter, slug=chapter_slug, manga__slug=manga_slug)
-
-    # Tăng lượt xem chapter
-    chapter.views += 1
-    chapter.save(update_fields=['views'])
-
-    # Lưu lịch sử đọc
-    if request.user.is_authenticated:
-        ReadingHistory.objects.update_or_create(
-            user=request.user,
-            chapter=chapter,
-            defaults={'manga': chapter.manga}
-        )
-
-    # Lấy tất cả ảnh của chapter
-    images = chapter.images.all().order_by('page_number')
-
-    # Chapter trước/sau
-    next_chapter = chapter.get_next_chapter()
-    prev_chapter = chapter.get_previous_chapter()
-
-    # Tất cả chapter của truyện
-    all_chapters = chapter.manga.chapters.all().order_by('-chapter_number')
+    chapter = get_object_or_404(
+        Chapter.objects.select_related('manga'),
+        slug=chapter_slug,
+        manga__slug=manga_slug
+    )
+
+    # Tăng lượt xem chapter và lưu tiến độ đọc (ghi trễ theo lô, trang cụ thể
+    # do reader báo qua beacon); request tải trước của trình duyệt không tính
+    if not view_counter.is_prefetch(request):
+        view_counter.record_chapter_view(chapter.id)
+        if request.user.is_authenticated:
+            reading_progress.record_progress(request.user.id, chapter.manga_id, chapter.id)
+
+    # Danh sách trang lấy từ manifest đã cache (không query ảnh)
+    chapter_manifest = manifest.get_manifest(chapter.id)
+    pages = chapter_manifest['pages']
+
+    # Chapter trước/sau (tra trong mục lục đã cache, không query DB)
+    manga_toc = toc.get_toc(chapter.manga_id)
+    next_chapter = manga_toc.next_of(chapter.chapter_number)
+    prev_chapter = manga_toc.previous_of(chapter.chapter_number)
 
     context = {
         'chapter': chapter,
         'manga': chapter.manga,
-        'images': images,
+        'pages': pages,
+        'preload_pages': manifest.PRELOAD_PAGES,
+        'page_sizes': manifest.PAGE_SIZES,
         'next_chapter': next_chapter,
         'prev_chapter': prev_chapter,
-        'all_chapters': all_chapters,
+        'comments': thread_comments.get_thread_page(
+            chapter.manga_id, chapter.id, cursor=request.GET.get('comments'),
+        ),
     }
-    return render(request, 'reader.html', context)
+    response = render(request, 'reader.html', context)
+
+    # Cho trình duyệt (hoặc proxy hỗ trợ 103 Early Hints) tải sớm các trang đầu
+    if pages:
+        response['Link'] = manifest.preload_links(pages)
+    return response
+
+
+# ==================== MỤC LỤC CHAPTER (JSON) ====================
+def chapter_toc(request, manga_id):
+    manga_toc = toc.get_toc(manga_id)
+    if not len(manga_toc):
+        raise Http404
+
+    # Mục lục không đổi cho tới khi version đổi
+    etag = quote_etag(f'toc-{manga_id}-{manga_toc.version}')
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(manga_toc.as_dict())
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+
+# ==================== DANH SÁCH TRANG CHAPTER (JSON) ====================
+def chapter_manifest(request, chapter_id):
+    chapter_manifest = manifest.get_manifest(chapter_id)
+    if chapter_manifest is None:
+        raise Http404
+
+    chapter = chapter_manifest['chapter']
+    manga_toc = toc.get_toc(chapter['manga_id'])
+    etag = quote_etag(f'manifest-{chapter_manifest["etag"]}-{manga_toc.version}')
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        def neighbour(entry):
+            if entry is None:
+                return None
+            return {
+                'id': entry.id,
+                'chapter_number': entry.chapter_number,
+                'slug': entry.slug,
+                'manifest': reverse('chapter_manifest', args=[entry.id]),
+            }
+
+        response = JsonResponse({
+            'chapter': chapter,
+            'pages': [
+                {key: page[key] for key in ('page', 'url', 'width', 'height', 'srcset')}
+                for page in chapter_manifest['pages']
+            ],
+            'next': neighbour(manga_toc.next_of(chapter['chapter_number'])),
+            'prev': neighbour(manga_toc.previous_of(chapter['chapter_number'])),
+        })
+
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=60)
+    return response
 
 
 # ==================== TÌM KIẾM ====================
+@read_replica
 def search(request):
     query = request.GET.get('q', '')
     category = request.GET.get('category', '')
     status = request.GET.get('status', '')
 
-    mangas = Manga.objects.all()
+    cursor = request.GET.get('cursor')
 
     if query:
-        mangas = mangas.filter(
-            Q(title__icontains=query) |
-            Q(alternative_title__icontains=query) |
-            Q(author__name__icontains=query)
-        )
+        # Tìm trong chỉ mục (bỏ dấu, khớp tiền tố, lọc thể loại/trạng thái trong chỉ mục)
+        manga_ids = search_index.search(query, category=category, status=status)
+        mangas = SequencePaginator(manga_ids, 24).get_page(cursor)
 
-    if category:
-        mangas = mangas.filter(categories__slug=category)
+        # Chỉ lấy các truyện của trang hiện tại, giữ thứ tự xếp hạng
+        mangas_by_id = Manga.objects.select_related('author').in_bulk(mangas.object_list)
+        mangas.object_list = [mangas_by_id[i] for i in mangas.object_list if i in mangas_by_id]
+    else:
+        mangas = Manga.objects.select_related('author')
+
+        if category:
+            mangas = mangas.filter(categories__slug=category)
 
-    if status:
-        mangas = mangas.filter(status=status)
+        if status:
+            mangas = mangas.filter(status=status)
 
-    # Phân trang
-    paginator = Paginator(mangas, 24)
-    page = request.GET.get('page')
-    mangas = paginator.get_page(page)
+        # Phân trang theo con trỏ
+        mangas = KeysetPaginator(mangas, ('-updated_at', 'id'), 24).get_page(cursor)
 
     categories = Category.objects.all()
 
@@ -185,13 +231,14 @@ def search(request):
 
 
 # ==================== XEM THEO THỂ LOẠI ====================
+@read_replica
+@conditional_page(conditional.category_state)
 def category_view(request, slug):
     category = get_object_or_404(Category, slug=slug)
-    mangas = category.mangas.all()
+    mangas = category.mangas.select_related('author')
 
-    paginator = Paginator(mangas, 24)
-    page = request.GET.get('page')
-    mangas = paginator.get_page(page)
+    # Phân trang theo con trỏ
+    mangas = KeysetPaginator(mangas, ('-updated_at', 'id'), 24).get_page(request.GET.get('cursor'))
 
     context = {
         'category': category,
@@ -266,10 +313,36 @@ def profile(request):
     return render(request, 'user/profile.html')
 
 
+# ==================== TIẾN ĐỘ ĐỌC (BEACON) ====================
+@require_POST
+def save_progress(request):
+    # Reader gửi bằng navigator.sendBeacon nên không chuyển hướng tới trang đăng nhập
+    if not request.user.is_authenticated:
+        return HttpResponse(status=401)
+
+    try:
+        chapter_id = int(request.POST['chapter_id'])
+        page = int(request.POST.get('page', 1))
+    except (KeyError, ValueError):
+        return HttpResponse(status=400)
+
+    # Kiểm tra chapter và số trang qua manifest đã cache
+    chapter_manifest = manifest.get_manifest(chapter_id)
+    if chapter_manifest is None:
+        raise Http404
+
+    page = min(max(page, 1), max(len(chapter_manifest['pages']), 1))
+    reading_progress.record_progress(
+        request.user.id, chapter_manifest['chapter']['manga_id'], chapter_id, page,
+    )
+    return HttpResponse(status=204)
+
+
 # ==================== LỊCH SỬ ĐỌC ====================
 @login_required
 def reading_history(request):
-    history = ReadingHistory.objects.filter(user=request.user).select_related('manga', 'chapter')[:50]
+    # Gộp cả vị trí còn trong bộ đệm để lịch sử hiện chapter vừa đọc
+    history = reading_progress.get_history(request.user.id, limit=50)
 
     context = {
         'history': history,
@@ -282,7 +355,10 @@ def reading_history(request):
 def follow_manga(request, manga_id):
     manga = get_object_or_404(Manga, id=manga_id)
 
-    follow, created = Follow.objects.get_or_create(user=request.user, manga=manga)
+    # Chapter đã có lúc theo dõi không tính là chapter mới
+    follow, created = Follow.objects.get_or_create(
+        user=request.user, manga=manga, defaults={'last_read_chapter_number': manga.latest_chapter_number},
+    )
 
     if not created:
         follow.delete()
@@ -296,7 +372,12 @@ def follow_manga(request, manga_id):
 # ==================== DANH SÁCH THEO DÕI ====================
 @login_required
 def following_list(request):
-    follows = Follow.objects.filter(user=request.user).select_related('manga')
+    # Một query: số chapter chưa đọc tính sẵn trên Follow, truyện có chapter mới lên đầu
+    follows = (
+        Follow.objects.filter(user=request.user)
+        .select_related('manga')
+        .order_by('-unread_count', F('manga__latest_chapter_at').desc(nulls_last=True), '-id')
+    )
 
     context = {
         'follows': follows,
@@ -304,23 +385,54 @@ def following_list(request):
     return render(request, 'user/following.html', context)
 
 
+@login_required
+def update_feed(request):
+    # Chapter mới của truyện đang theo dõi, phân trang theo con trỏ (?cursor=)
+    page = feed.get_feed_page(request.user.id, request.GET.get('cursor'))
+
+    context = {
+        'page': page,
+    }
+    return render(request, 'user/feed.html', context)
+
+
 # ==================== BÌNH LUẬN ====================
 @login_required
 def add_comment(request, manga_id):
     if request.method == 'POST':
         manga = get_object_or_404(Manga, id=manga_id)
-        content = request.POST.get('content')
+        content = request.POST.get('content', '').strip()
+        chapter_id = request.POST.get('chapter_id')
         parent_id = request.POST.get('parent_id')
 
-        comment = Comment.objects.create(
+        chapter = None
+        if chapter_id:
+            chapter = get_object_or_404(Chapter, id=chapter_id, manga=manga)
+
+        # Trả lời phải cùng trang (truyện / chapter) với bình luận cha
+        parent = None
+        if parent_id:
+            parent = get_object_or_404(Comment, id=parent_id, manga=manga, chapter=chapter)
+
+        if chapter is not None:
+            back = reverse('read_chapter', args=[manga.slug, chapter.slug]) + '#comments'
+        else:
+            back = reverse('manga_detail', args=[manga.slug]) + '#comments'
+
+        if not content:
+            messages.error(request, 'Nội dung bình luận không được để trống!')
+            return redirect(back)
+
+        Comment.objects.create(
             user=request.user,
             manga=manga,
+            chapter=chapter,
             content=content,
-            parent_id=parent_id if parent_id else None
+            parent=parent,
         )
 
         messages.success(request, 'Đã thêm bình luận!')
-        return redirect('manga_detail', slug=manga.slug)
+        return redirect(back)
 
     return redirect('home')
 
@@ -333,16 +445,23 @@ def rate_manga(request, manga_id):
         score = int(request.POST.get('score'))
 
         if 1 <= score <= 10:
-            Rating.objects.update_or_create(
-                user=request.user,
-                manga=manga,
-                defaults={'score': score}
-            )
-
-            # Cập nhật rating trung bình
-            avg = manga.ratings.aggregate(Avg('score'))['score__avg']
-            manga.rating = avg if avg else 0
-            manga.save(update_fields=['rating'])
+            with transaction.atomic():
+                rating, created = Rating.objects.select_for_update().get_or_create(
+                    user=request.user,
+                    manga=manga,
+                    defaults={'score': score}
+                )
+
+                # Cập nhật tổng điểm theo chênh lệch, không quét lại toàn bộ bảng Rating
+                if created:
+                    Manga.apply_rating_change(manga.id, score, 1)
+                elif rating.score != score:
+                    Manga.apply_rating_change(manga.id, score - rating.score, 0)
+                    rating.score = score
+                    rating.save(update_fields=['score'])
+
+            # Điểm đánh giá dùng để xếp hạng kết quả tìm kiếm
+            search_index.index_mangas([manga.id])
 
             messages.success(request, 'Đã đánh giá truyện!')
 
@@ -3,6 +3,21 @@ ASGI config for manga_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Chạy qua ASGI thì trang chủ, trang truyện và trang đọc dùng view async
+(manga/async_views.py, URLconf manga_project/asgi_urls.py):
+
+    pip install uvicorn
+    uvicorn manga_project.asgi:application --workers 4 --host 0.0.0.0 --port 8000
+
+    # hoặc gunicorn quản lý tiến trình, worker uvicorn
+    gunicorn manga_project.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+    # hoặc daphne
+    daphne -b 0.0.0.0 -p 8000 manga_project.asgi:application
+
+Đặt MANGA_URLCONF=manga_project.urls để chạy ASGI với view sync như WSGI.
+So sánh hai cách bằng ``python manage.py benchmark_asgi``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +27,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'manga_project.settings')
+os.environ.setdefault('MANGA_URLCONF', 'manga_project.asgi_urls')
 
 application = get_asgi_application()
@@ -0,0 +1,18 @@
+# manga_project/asgi_urls.py
+# URLconf khi chạy qua ASGI (manga_project/asgi.py): giống urls.py, riêng các
+# trang đọc dùng view async (manga/async_urls.py)
+from django.contrib import admin
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+
+from manga.media import serve_media
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
+    path('', include('manga.async_urls')),
+]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
@@ -20,6 +20,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Đứng đầu để đo cả các middleware phía sau (manga/instrumentation.py)
+    'manga.instrumentation.RequestProfileMiddleware',
+    # Trước SessionMiddleware để việc lưu session cũng tính là ghi (manga/replicas.py)
+    'manga.replicas.StickyPrimaryMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -29,7 +33,8 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'manga_project.urls'
+# manga_project/asgi.py đặt MANGA_URLCONF=manga_project.asgi_urls để dùng view async
+ROOT_URLCONF = os.environ.get('MANGA_URLCONF', 'manga_project.urls')
 
 TEMPLATES = [
     {
@@ -63,6 +68,35 @@ DATABASES = {
             'charset': 'utf8mb4',
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
         },
+        # Giữ kết nối giữa các request, kiểm tra còn sống trước khi dùng lại
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Replica chỉ đọc: MANGA_DB_REPLICAS=host1,host2 (cùng tên DB / tài khoản với primary)
+for index, host in enumerate(filter(None, os.environ.get('MANGA_DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        # Khi chạy test, replica dùng chung DB test với primary
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['manga.replicas.ReplicaRouter']
+
+# Đọc replica ở các trang chỉ đọc (manga/replicas.py)
+READ_REPLICAS = {
+    'ALIASES': [alias for alias in DATABASES if alias != 'default'],
+    'STICKY_SECONDS': 15,  # sau khi ghi, người dùng đọc primary chừng này giây (replica có thể trễ)
+    'COOKIE': 'db_primary',
+}
+
+# Cache - dùng chung cho mục lục chapter, ...
+# Khi chạy nhiều tiến trình nên đổi sang Redis/Memcached để việc xóa cache có hiệu lực ở mọi nơi
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
 }
 
@@ -94,6 +128,16 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# File media lưu theo nội dung, ảnh trùng chỉ giữ một bản (manga/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'manga.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -103,4 +147,79 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Session settings
-SESSION_COOKIE_AGE = 86400 * 30  # 30 days
\ No newline at end of file
+SESSION_COOKIE_AGE = 86400 * 30  # 30 days
+
+# Bộ đếm lượt xem ghi trễ (manga/view_counter.py)
+# Chạy nhiều tiến trình: dùng 'manga.view_counter.CacheViewCounter' với cache Redis/Memcached
+# để lượt xem không mất khi tiến trình chết, OPTIONS: {'CACHE': 'default', 'BUCKET': 60, 'LOOKBACK': 60}
+VIEW_COUNTER = {
+    'BACKEND': 'manga.view_counter.MemoryViewCounter',
+    'FLUSH_INTERVAL': 10,  # giây
+    'OPTIONS': {},
+}
+
+# Đo số query / thời gian của từng request (manga/instrumentation.py)
+INSTRUMENTATION = {
+    'ENABLED': True,
+    'SERVER_TIMING': DEBUG,
+    'LOG': True,
+    'TRACE_MEMORY': False,
+    'SIMILAR_QUERY_THRESHOLD': 5,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'manga.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Tiến độ đọc, cũng ghi trễ theo lô (manga/reading_progress.py)
+READING_PROGRESS = {
+    'BACKEND': 'manga.reading_progress.MemoryProgressBuffer',
+    'FLUSH_INTERVAL': 10,  # giây
+}
+
+# Feed chapter mới của truyện đang theo dõi (manga/feed.py)
+FEED = {
+    'FANOUT_LIMIT': 5000,  # truyện nhiều người theo dõi hơn: feed tự đọc chapter thay vì chép cho từng người
+    'BATCH_SIZE': 1000,
+    'ASYNC': True,
+}
+
+# Truyện tương tự tính sẵn (manga/recommendations.py, lệnh build_recommendations)
+RECOMMENDATIONS = {
+    'TOP_K': 12,
+    'CO_READING_WEIGHT': 0.7,  # cosine đọc chung
+    'CATEGORY_WEIGHT': 0.3,    # Jaccard thể loại
+    'MAX_USER_ITEMS': 500,
+}
+
+# Bảng xếp hạng truyện hot (manga/trending.py)
+TRENDING_WINDOWS = [1, 7, 30]  # số ngày
+TRENDING_SIZE = 10
+
+# Tìm kiếm (manga/search_index.py)
+SEARCH_BACKEND = 'manga.search_index.PythonSearchBackend'
+SEARCH_INDEX = {
+    'POLL_INTERVAL': 1,  # giây giữa hai lần đọc nhật ký thay đổi (bảng SearchIndexChange)
+    'OVERLAP': 60,
+    'RETENTION': 86400,
+}
+
+# Ảnh phái sinh WebP cho trang truyện (manga/imaging.py)
+IMAGE_VARIANT_WIDTHS = [480, 800, 1200]
+IMAGE_VARIANTS_ASYNC = True
+
+# Conditional GET cho khách chưa đăng nhập (manga/conditional.py)
+CONDITIONAL_GET_WINDOW = 300  # giây, lượt xem hiển thị có thể cũ tối đa chừng này
+
+# Gửi file media (manga/media.py): 'django' | 'xaccel' (nginx) | 'xsendfile' (Apache)
+MEDIA_DELIVERY = {
+    'METHOD': 'django',
+    'XACCEL_PREFIX': '/protected-media/',
+}
@@ -4,12 +4,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from manga.media import serve_media
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    # File media: kiểm tra trong Django, gửi file qua web server (xem manga/media.py)
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", serve_media, name='media'),
     path('', include('manga.urls')),
 ]
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
 